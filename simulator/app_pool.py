@@ -0,0 +1,384 @@
+import logging
+import multiprocessing
+import Queue
+import traceback
+
+from application import Application
+from cube import Cube
+import codec
+
+
+logger = logging.getLogger(__name__)
+
+
+# Codecs used for messages to and from apps in worker processes. Messages have
+# to be pickled anyway, so the local codec is not an option.
+_REMOTE_CODECS = (codec.BinaryCodec.NAME, codec.JsonCodec.NAME)
+
+# Display methods that apps in worker processes are allowed to call.
+_DISPLAY_METHODS = set(["draw_text", "draw_rect", "draw_oval", "clear",
+                        "set_fill"])
+
+
+class _CubeRef(object):
+  """ Stands in for a Cube object in the configurations that get passed to apps
+  in worker processes. """
+
+  def __init__(self, cube_id):
+    """
+    Args:
+      cube_id: The ID of the cube. """
+    self.__id = cube_id
+
+  def __eq__(self, other):
+    return isinstance(other, _CubeRef) and other.get_id() == self.__id
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __hash__(self):
+    return hash(self.__id)
+
+  def get_id(self):
+    """
+    Returns:
+      The unique ID of the cube. """
+    return self.__id
+
+
+class _PreEncoded(object):
+  """ An encoding for a message that was already encoded in a worker process.
+  It can be passed to Cube.flood_message() and Cube.route_message(). """
+
+  def __init__(self, message, codec_name):
+    """
+    Args:
+      message: The encoded message.
+      codec_name: The name of the codec that it was encoded with. """
+    self.__message = message
+    self.__codec_name = codec_name
+
+  def __call__(self, peer_codecs):
+    return self.__message, self.__codec_name
+
+
+class _WorkerDisplay(object):
+  """ Stands in for a cube's display in a worker process. Every call gets sent
+  back to the host process. """
+
+  def __init__(self, worker_cube):
+    """
+    Args:
+      worker_cube: The _WorkerCube that this display belongs to. """
+    self.__worker_cube = worker_cube
+
+  def __getattr__(self, name):
+    if name not in _DISPLAY_METHODS:
+      raise AttributeError("Display method '%s' is not available." % (name))
+
+    def call(*args, **kwargs):
+      self.__worker_cube.post("display", name, args, kwargs)
+    return call
+
+
+class _WorkerCube(object):
+  """ Stands in for a cube in a worker process. It implements the parts of the
+  Cube interface that applications use, by sending commands back to the host
+  process. """
+
+  def __init__(self, cube_id, outbox):
+    """
+    Args:
+      cube_id: The ID of the cube on the host.
+      outbox: The queue to send commands to the host on. """
+    self.__id = cube_id
+    self.__outbox = outbox
+    self.__display = _WorkerDisplay(self)
+
+    # The IDs of the connected cubes, keyed by side.
+    self.__connected = dict.fromkeys(Cube.Sides.all())
+
+  def post(self, command, *args):
+    """ Sends a command for this cube to the host process.
+    Args:
+      command: The name of the command.
+      All other arguments are passed along with it. """
+    self.__outbox.put((command, self.__id) + args)
+
+  def make_config(self, connected, added, removed):
+    """ Updates the connections for this cube, and creates the configuration
+    to pass to the app.
+    Args:
+      connected: The IDs of the connected cubes, keyed by side.
+      added: The IDs of the newly-connected cubes, keyed by side.
+      removed: The IDs of the disconnected cubes, keyed by side.
+    Returns:
+      The Cube.Connections to pass to the app. """
+    self.__connected = connected
+
+    def refs(ids):
+      return dict((side, None if cube_id is None else _CubeRef(cube_id)) \
+                  for side, cube_id in ids.iteritems())
+    return Cube.Connections(refs(connected), refs(added), refs(removed))
+
+  def get_id(self):
+    return self.__id
+
+  def get_display(self):
+    return self.__display
+
+  def get_cluster_index(self):
+    # The index lives in the host process.
+    return None
+
+  def get_peer_codecs(self, side):
+    if self.__connected[side] is None:
+      raise ValueError("No cube connected on side %s'." % (side))
+    return _REMOTE_CODECS
+
+  def send_message(self, side, message, codec_name):
+    self.post("send", side, message, codec_name)
+
+  def flood_message(self, encoding, sides=None, first_side=None):
+    message, codec_name = encoding(_REMOTE_CODECS)
+    self.post("flood", message, codec_name, sides, first_side)
+
+  def route_message(self, cube_id, encoding):
+    message, codec_name = encoding(_REMOTE_CODECS)
+    self.post("route", cube_id, message, codec_name)
+
+
+def _run_worker(inbox, outbox):
+  """ Main loop for worker processes. It runs apps on behalf of the host.
+  Args:
+    inbox: The queue to receive commands on.
+    outbox: The queue to send commands to the host on. """
+  # Maps cube IDs to the app running on that cube.
+  apps = {}
+  # Maps cube IDs to the corresponding _WorkerCube.
+  cubes = {}
+
+  while True:
+    command = inbox.get()
+    name, cube_id = command[:2]
+    args = command[2:]
+    if name == "stop":
+      return
+
+    try:
+      if name == "start":
+        app, = args
+        cubes[cube_id] = _WorkerCube(cube_id, outbox)
+        apps[cube_id] = app
+        app.run(cubes[cube_id])
+      elif name == "reconfigure":
+        config = cubes[cube_id].make_config(*args)
+        apps[cube_id].on_reconfiguration(config)
+      elif name == "message":
+        apps[cube_id].on_message_receive(*args)
+      elif name == "routed":
+        apps[cube_id].on_routed_message_receive(*args)
+      elif name == "button":
+        apps[cube_id].on_button_event(*args)
+
+    except Exception:
+      # Don't let one broken app take down all the others in this worker.
+      outbox.put(("error", cube_id, traceback.format_exc()))
+
+
+class RemoteApplication(Application):
+  """ Stands in for an app that is running in a worker process. Everything that
+  happens to the cube gets forwarded to the worker. """
+
+  _CODECS = _REMOTE_CODECS
+
+  def __init__(self, inbox):
+    """
+    Args:
+      inbox: The queue to send commands to the worker on. """
+    self.__inbox = inbox
+    self.__cube_id = None
+    # Our copy of the real app, as it was when it was started.
+    self.__app = None
+
+  def __post(self, command, *args):
+    """ Sends a command to the worker process.
+    Args:
+      command: The name of the command.
+      All other arguments are passed along with it. """
+    self.__inbox.put((command, self.__cube_id) + args)
+
+  def start(self, cube, app):
+    """ Starts the real app in the worker process.
+    Args:
+      cube: The cube that the app is running on.
+      app: The real app. It must be picklable. """
+    self.__cube_id = cube.get_id()
+    self.__app = app
+    self.__post("start", app)
+
+    cube.run_app(self)
+
+  def get_app_class(self):
+    # The real app is what gets saved.
+    return self.__app.get_app_class()
+
+  def get_init_args(self):
+    return self.__app.get_init_args()
+
+  def get_state(self):
+    # The real app is in the worker, so this is the state that it started
+    # with.
+    return self.__app.get_state()
+
+  def on_reconfiguration(self, config):
+    def ids(cubes):
+      return dict((side, None if other is None else other.get_id()) \
+                  for side, other in cubes.iteritems())
+
+    self.__post("reconfigure", ids(config), ids(config.added),
+                ids(config.removed))
+
+  def on_message_receive(self, side, message,
+                         codec_name=codec.JsonCodec.NAME):
+    self.__post("message", side, message, codec_name)
+
+  def on_routed_message_receive(self, source_id, message,
+                                codec_name=codec.JsonCodec.NAME):
+    self.__post("routed", source_id, message, codec_name)
+
+  def on_button_event(self, button, pressed, timestamp):
+    self.__post("button", button, pressed, timestamp)
+
+
+class AppPool(object):
+  """ Runs cube applications in a pool of worker processes, so that a slow app
+  doesn't block the GUI or the apps on other cubes. Everything the apps do to
+  their cubes is sent back to this process and applied by poll(). """
+
+  def __init__(self, num_workers=None):
+    """
+    Args:
+      num_workers: The number of worker processes to use. Defaults to the
+                   number of CPUs. """
+    if num_workers is None:
+      num_workers = multiprocessing.cpu_count()
+
+    # Queue that all the workers send commands back to us on.
+    self.__outbox = multiprocessing.Queue()
+    # Queues for sending commands to each worker.
+    self.__inboxes = []
+    self.__workers = []
+    for _ in range(num_workers):
+      inbox = multiprocessing.Queue()
+      worker = multiprocessing.Process(target=_run_worker,
+                                       args=(inbox, self.__outbox))
+      worker.daemon = True
+      worker.start()
+
+      self.__inboxes.append(inbox)
+      self.__workers.append(worker)
+
+    # Maps cube IDs to cubes with apps running in the pool.
+    self.__cubes = {}
+    # Maps group names to the worker they were assigned to.
+    self.__groups = {}
+    # Worker to assign the next ungrouped app to.
+    self.__next_worker = 0
+
+    logger.info("Started app pool with %d workers." % (num_workers))
+
+  def __pick_worker(self, group):
+    """ Picks the worker to run an app on.
+    Args:
+      group: The group that the app is in, or None.
+    Returns:
+      The index of the worker. """
+    if group in self.__groups:
+      return self.__groups[group]
+
+    worker = self.__next_worker
+    self.__next_worker = (self.__next_worker + 1) % len(self.__workers)
+    if group is not None:
+      self.__groups[group] = worker
+
+    return worker
+
+  def run_app(self, cube, app, group=None):
+    """ Runs an app on a cube, in one of the worker processes.
+    Args:
+      cube: The cube to run the app on.
+      app: The app to run. It must be picklable.
+      group: Apps in the same group always run in the same worker. By default,
+             apps are spread evenly across the workers. """
+    inbox = self.__inboxes[self.__pick_worker(group)]
+    self.__cubes[cube.get_id()] = cube
+
+    RemoteApplication(inbox).start(cube, app)
+
+  def __handle_command(self, command):
+    """ Applies a command that was sent by a worker.
+    Args:
+      command: The command to apply. """
+    name, cube_id = command[:2]
+    args = command[2:]
+    cube = self.__cubes[cube_id]
+
+    try:
+      if name == "send":
+        cube.send_message(*args)
+      elif name == "flood":
+        message, codec_name, sides, first_side = args
+        cube.flood_message(_PreEncoded(message, codec_name), sides=sides,
+                           first_side=first_side)
+      elif name == "route":
+        dest_id, message, codec_name = args
+        cube.route_message(dest_id, _PreEncoded(message, codec_name))
+      elif name == "display":
+        method, method_args, method_kwargs = args
+        getattr(cube.get_display(), method)(*method_args, **method_kwargs)
+      elif name == "error":
+        logger.error("App on cube %d failed:\n%s" % (cube_id, args[0]))
+
+    except ValueError as error:
+      # The app was working from a topology that has since changed.
+      logger.warning("Dropping command from cube %d: %s" % (cube_id, error))
+    except Exception:
+      # Don't let one broken command stop us from handling all the others.
+      logger.exception("Command %s from cube %d failed." % (name, cube_id))
+
+  def poll(self):
+    """ Applies all the commands that the workers have sent so far. This never
+    blocks.
+    Returns:
+      The number of commands that were applied. """
+    handled = 0
+    while True:
+      try:
+        command = self.__outbox.get_nowait()
+      except Queue.Empty:
+        return handled
+
+      self.__handle_command(command)
+      handled += 1
+
+  def poll_periodically(self, canvas, interval=10):
+    """ Keeps calling poll() from the canvas event loop.
+    Args:
+      canvas: The canvas whose event loop to use.
+      interval: How often to poll, in ms. """
+    try:
+      self.poll()
+    finally:
+      # Keep polling, even if something went wrong this time.
+      canvas.call_later(interval,
+                        lambda: self.poll_periodically(canvas, interval))
+
+  def shutdown(self):
+    """ Stops all the worker processes. """
+    for inbox in self.__inboxes:
+      inbox.put(("stop", None))
+    for worker in self.__workers:
+      worker.join()
+
+    logger.info("App pool shut down.")
@@ -1,9 +1,52 @@
-import json
+import codec
+import profiling
 
 
 class Application(object):
   """ Represents an application running on a cube. """
 
+  class _Encoding(object):
+    """ Lazily encodes a single message for whatever cubes it gets sent to.
+    Every codec is only run once, no matter how many cubes receive the
+    message. """
+
+    def __init__(self, codecs, message):
+      """
+      Args:
+        codecs: The names of the codecs that the sender supports, in order of
+                preference.
+        message: The message to encode. """
+      self.__codecs = codecs
+      self.__message = message
+
+      # Encoded versions of the message, keyed by codec name.
+      self.__encoded = {}
+
+    def __call__(self, peer_codecs):
+      """ Encodes the message for a particular receiver.
+      Args:
+        peer_codecs: The names of the codecs that the receiver supports.
+      Returns:
+        The encoded message, and the name of the codec used. """
+      if peer_codecs:
+        message_codec = codec.negotiate(self.__codecs, peer_codecs)
+      else:
+        # Nobody is listening, so it doesn't matter what we use.
+        message_codec = codec.get_codec(self.__codecs[0])
+
+      name = message_codec.NAME
+      encoded = self.__encoded.get(name)
+      if encoded is None:
+        encoded = message_codec.encode(self.__message)
+        self.__encoded[name] = encoded
+
+      return encoded, name
+
+  # Names of the codecs that this app can use for messages, in order of
+  # preference. Subclasses can override this.
+  _CODECS = (codec.LocalCodec.NAME, codec.BinaryCodec.NAME,
+             codec.JsonCodec.NAME)
+
   def _start_app(self):
     """ This is the app's start-up code. It will be run once when it is first
     started. """
@@ -16,6 +59,28 @@ class Application(object):
       message: The message, in deserialized form. """
     return
 
+  def _on_routed_message_receive(self, source_id, message):
+    """ This is called every time the cube receives a message that was routed
+    to it from a cube that might not be adjacent.
+    Args:
+      source_id: The ID of the cube that sent the message.
+      message: The message, in deserialized form. """
+    return
+
+  def _on_button_press(self, button, timestamp):
+    """ This is called every time one of the cube's buttons is pressed.
+    Args:
+      button: The button, from Cube.Buttons.
+      timestamp: When it was pressed, in seconds since the epoch. """
+    return
+
+  def _on_button_release(self, button, timestamp):
+    """ This is called every time one of the cube's buttons is released.
+    Args:
+      button: The button, from Cube.Buttons.
+      timestamp: When it was released, in seconds since the epoch. """
+    return
+
   def run(self, cube):
     """ Runs the application on a particular cube.
     Args:
@@ -23,7 +88,11 @@ class Application(object):
     self.__cube = cube
 
     # Run init code.
-    self._start_app()
+    if profiling.active is None:
+      self._start_app()
+    else:
+      profiling.active.call(self, cube.get_id(), profiling.START_APP,
+                            self._start_app)
 
   def on_reconfiguration(self, config):
     """ This is a stub method that will be called every time the connection
@@ -33,25 +102,142 @@ class Application(object):
       config: The new configuration, as returned by Cube.get_connections(). """
     return
 
-  def on_message_receive(self, side, message):
-    """ This is a stub method that will be called every time a message is
-    received by the cube. By default, it does nothing.
+  def get_app_class(self):
+    """ Gets the class that the app can be recreated from, along with
+    get_init_args() and get_state(). Apps that stand in for other apps
+    override this.
+    Returns:
+      The class, or None if the app can't be recreated. """
+    return self.__class__
+
+  def get_init_args(self):
+    """ Gets the arguments that the app was constructed with, so that it can be
+    saved and recreated later. Apps that take constructor arguments must
+    override this.
+    Returns:
+      A tuple of the arguments. They must be picklable. """
+    return ()
+
+  def get_state(self):
+    """ Gets any state that should be saved along with the app. By default,
+    apps don't save any state.
+    Returns:
+      The state, which must be picklable, or None if there isn't any. """
+    return None
+
+  def set_state(self, state):
+    """ Restores state that was saved with get_state(). This gets called after
+    the app is constructed, but before it is started.
+    Args:
+      state: The saved state. """
+    return
+
+  def get_codecs(self):
+    """
+    Returns:
+      The names of the codecs that this app understands, in order of
+      preference. """
+    return self._CODECS
+
+  def on_message_receive(self, side, message,
+                         codec_name=codec.JsonCodec.NAME):
+    """ This is called every time a message is received by the cube. It
+    deserializes the message and passes it on to _on_message_receive().
     Args:
       side: The side that the sender is connected on.
-      message: The message being received, in string form. """
+      message: The message being received, in serialized form.
+      codec_name: The name of the codec that the message was encoded with. """
     # Deserialize.
-    decoded = json.loads(message)
-    self._on_message_receive(side, decoded)
+    decoded = codec.get_codec(codec_name).decode(message)
+    if profiling.active is None:
+      self._on_message_receive(side, decoded)
+    else:
+      profiling.active.call(self, self.__cube.get_id(),
+                            profiling.MESSAGE_RECEIVE,
+                            self._on_message_receive, side, decoded)
+
+  def on_routed_message_receive(self, source_id, message,
+                                codec_name=codec.JsonCodec.NAME):
+    """ This is called every time a routed message is received by the cube. It
+    deserializes the message and passes it on to _on_routed_message_receive().
+    Args:
+      source_id: The ID of the cube that sent the message.
+      message: The message being received, in serialized form.
+      codec_name: The name of the codec that the message was encoded with. """
+    decoded = codec.get_codec(codec_name).decode(message)
+    self._on_routed_message_receive(source_id, decoded)
+
+  def on_button_event(self, button, pressed, timestamp):
+    """ This is called every time a button on the cube is pressed or released.
+    It passes the event on to _on_button_press() or _on_button_release().
+    Args:
+      button: The button, from Cube.Buttons.
+      pressed: True if it was pressed, false if it was released.
+      timestamp: When it happened, in seconds since the epoch. """
+    if pressed:
+      hook, hook_name = self._on_button_press, profiling.BUTTON_PRESS
+    else:
+      hook, hook_name = self._on_button_release, profiling.BUTTON_RELEASE
+
+    if profiling.active is None:
+      hook(button, timestamp)
+    else:
+      profiling.active.call(self, self.__cube.get_id(), hook_name, hook,
+                            button, timestamp)
+
+  def get_cube_id(self):
+    """
+    Returns:
+      The unique ID of the cube that this app is running on. """
+    return self.__cube.get_id()
 
   def send_message(self, side, message):
     """ Sends a message to a connected cube.
     Args:
       side: The side that the recipient is connected on.
       message: The message to send. Can be anything JSONable. """
-    # Serialize.
-    serialized = json.dumps(message)
+    # Serialize, using a codec that the receiver understands.
+    encoding = Application._Encoding(self.get_codecs(), message)
+    serialized, codec_name = encoding(self.__cube.get_peer_codecs(side))
     # Send it.
-    self.__cube.send_message(side, serialized)
+    self.__cube.send_message(side, serialized, codec_name)
+
+  def send_routed_message(self, cube_id, message):
+    """ Sends a message to any cube in the same cluster, even if it isn't
+    adjacent. It is forwarded through the cubes in between.
+    Args:
+      cube_id: The ID of the cube to send it to.
+      message: The message to send. Can be anything JSONable. """
+    encoding = Application._Encoding(self.get_codecs(), message)
+    self.__cube.route_message(cube_id, encoding)
+
+  def broadcast_message(self, message):
+    """ Sends a message to every other cube in the cluster that this cube is
+    part of. Each cube receives it exactly once.
+    Args:
+      message: The message to send. Can be anything JSONable. """
+    encoding = Application._Encoding(self.get_codecs(), message)
+    self.__cube.flood_message(encoding)
+
+  def multicast_message(self, message, sides, first_side=None):
+    """ Sends a message to every cube that can be reached by only following
+    connections on particular sides. Each cube receives it exactly once.
+    Args:
+      message: The message to send. Can be anything JSONable.
+      sides: The sides that the message is allowed to travel through. For
+             instance, (Cube.Sides.LEFT, Cube.Sides.RIGHT) sends it along a row.
+      first_side: If specified, the message is first sent to the cube
+                  connected on this side, and spreads out from there. """
+    encoding = Application._Encoding(self.get_codecs(), message)
+    self.__cube.flood_message(encoding, sides=sides, first_side=first_side)
+
+  def get_cluster_index(self):
+    """
+    Returns:
+      The ClusterIndex that tracks the cube this app is running on, or None if
+      there isn't one. It can be used to find out the shape of the cluster
+      without sending messages. """
+    return self.__cube.get_cluster_index()
 
   def draw_text(self, *args, **kwargs):
     """ Draws text on the cube screen. Arguments are passed transparently to the
@@ -59,6 +245,20 @@ class Application(object):
     display = self.__cube.get_display()
     return display.draw_text(*args, **kwargs)
 
+  def draw_rect(self, *args, **kwargs):
+    """ Draws a filled rectangle on the cube screen. Arguments are passed
+    transparently to the cube display object. This only works with the
+    framebuffer display backend. """
+    display = self.__cube.get_display()
+    return display.draw_rect(*args, **kwargs)
+
+  def draw_oval(self, *args, **kwargs):
+    """ Draws a filled oval on the cube screen. Arguments are passed
+    transparently to the cube display object. This only works with the
+    framebuffer display backend. """
+    display = self.__cube.get_display()
+    return display.draw_oval(*args, **kwargs)
+
   def clear_display(self):
     """ Clears the cube screen. """
     display = self.__cube.get_display()
@@ -0,0 +1,163 @@
+import collections
+
+from cube import Cube
+
+
+class ClusterIndex(object):
+  """ Keeps track of which cubes are connected to each other, either directly
+  or through other cubes. It is updated incrementally as links are made and
+  broken, so that looking up the cluster that a cube is in doesn't require
+  walking the whole arrangement. """
+
+  def __init__(self):
+    # Maps each cube to the set of cubes in its cluster. All the cubes in a
+    # cluster share the same set object.
+    self.__clusters = {}
+
+  def __walk(self, start):
+    """ Finds all the cubes reachable from a starting cube by following their
+    current connections.
+    Args:
+      start: The cube to start at.
+    Returns:
+      The set of reachable cubes, including the starting one. """
+    reached = set([start])
+    to_visit = collections.deque([start])
+
+    while to_visit:
+      cube = to_visit.popleft()
+      for other in cube.get_connections().itervalues():
+        if other is not None and other not in reached:
+          reached.add(other)
+          to_visit.append(other)
+
+    return reached
+
+  def __merge(self, cube1, cube2):
+    """ Merges the clusters of two cubes that were just linked.
+    Args:
+      cube1: The first cube.
+      cube2: The second cube. """
+    cluster1 = self.__clusters[cube1]
+    cluster2 = self.__clusters[cube2]
+    if cluster1 is cluster2:
+      # Already in the same cluster.
+      return
+
+    # Always move the smaller cluster into the larger one.
+    if len(cluster1) < len(cluster2):
+      cluster1, cluster2 = cluster2, cluster1
+
+    cluster1.update(cluster2)
+    for cube in cluster2:
+      self.__clusters[cube] = cluster1
+
+  def __split(self, cube1, cube2):
+    """ Splits a cluster if necessary after the link between two cubes was
+    broken.
+    Args:
+      cube1: The first cube.
+      cube2: The second cube. """
+    cluster = self.__clusters[cube1]
+    if cluster is not self.__clusters[cube2]:
+      # They're already in different clusters.
+      return
+
+    reached = self.__walk(cube1)
+    if cube2 in reached:
+      # They're still connected some other way.
+      return
+
+    for cube in reached:
+      self.__clusters[cube] = reached
+
+    # Several links might have been broken at once, so what's left could be
+    # split up further.
+    remaining = cluster - reached
+    while remaining:
+      reached = self.__walk(remaining.pop())
+      remaining -= reached
+      for cube in reached:
+        self.__clusters[cube] = reached
+
+  def add_cube(self, cube):
+    """ Adds a new cube to the index. It must not be connected to anything.
+    Args:
+      cube: The cube to add. """
+    self.__clusters[cube] = set([cube])
+
+  def update(self, cube, added, removed):
+    """ Updates the index after the connections of a cube changed. It is fine
+    to report the same link from the cubes at both ends of it.
+    Args:
+      cube: The cube whose connections changed.
+      added: Dictionary of the cubes that were connected, keyed by side.
+      removed: Dictionary of the cubes that were disconnected, keyed by
+               side. """
+    for other in removed.itervalues():
+      self.__split(cube, other)
+    for other in added.itervalues():
+      self.__merge(cube, other)
+
+  def get_cluster(self, cube):
+    """ Gets all the cubes in the same cluster as a cube.
+    Args:
+      cube: The cube to look up.
+    Returns:
+      A frozenset of the cubes in the cluster, including this one. """
+    return frozenset(self.__clusters[cube])
+
+  def get_cluster_size(self, cube):
+    """ Gets the number of cubes in the same cluster as a cube.
+    Args:
+      cube: The cube to look up.
+    Returns:
+      The size of the cluster, including this cube. """
+    return len(self.__clusters[cube])
+
+  def in_same_cluster(self, cube1, cube2):
+    """ Checks whether two cubes are in the same cluster.
+    Args:
+      cube1: The first cube.
+      cube2: The second cube.
+    Returns:
+      True if they are connected, false otherwise. """
+    return self.__clusters[cube1] is self.__clusters[cube2]
+
+  def __get_line(self, cube, backward, forward):
+    """ Gets the unbroken line of cubes that a cube is part of.
+    Args:
+      cube: The cube to look up.
+      backward: The side to walk towards to find the start of the line.
+      forward: The side to walk towards to find the end of the line.
+    Returns:
+      A list of the cubes in the line, in order. """
+    start = cube
+    while True:
+      previous = start.get_connections()[backward]
+      if previous is None:
+        break
+      start = previous
+
+    line = []
+    while start is not None:
+      line.append(start)
+      start = start.get_connections()[forward]
+
+    return line
+
+  def get_row(self, cube):
+    """ Gets the row of directly-connected cubes that a cube is part of.
+    Args:
+      cube: The cube to look up.
+    Returns:
+      A list of the cubes in the row, from left to right. """
+    return self.__get_line(cube, Cube.Sides.LEFT, Cube.Sides.RIGHT)
+
+  def get_column(self, cube):
+    """ Gets the column of directly-connected cubes that a cube is part of.
+    Args:
+      cube: The cube to look up.
+    Returns:
+      A list of the cubes in the column, from top to bottom. """
+    return self.__get_line(cube, Cube.Sides.TOP, Cube.Sides.BOTTOM)
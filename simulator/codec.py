@@ -0,0 +1,280 @@
+import json
+import struct
+
+
+""" Codecs that applications use to serialize the messages they send to each
+other. Every application advertises the codecs that it understands, and the
+sender picks the first one in its own preference order that the receiver also
+understands. """
+
+
+class Codec(object):
+  """ Base class for all message codecs. """
+
+  # Unique name of the codec. This is what gets negotiated between apps.
+  NAME = None
+
+  def encode(self, message):
+    """ Serializes a message.
+    Args:
+      message: The message to serialize.
+    Returns:
+      The serialized message. """
+    raise NotImplementedError("encode() must be implemented by subclass.")
+
+  def decode(self, data):
+    """ Deserializes a message.
+    Args:
+      data: The serialized message.
+    Returns:
+      The deserialized message. """
+    raise NotImplementedError("decode() must be implemented by subclass.")
+
+
+class JsonCodec(Codec):
+  """ Encodes messages as JSON strings. This is the most portable codec. """
+
+  NAME = "json"
+
+  def encode(self, message):
+    return json.dumps(message, separators=(",", ":"))
+
+  def decode(self, data):
+    return json.loads(data)
+
+
+class LocalCodec(Codec):
+  """ Skips serialization entirely, and hands the message object straight to
+  the receiver. This is only valid when both cubes live in the same host
+  process. Since the receiver gets the very same object, messages sent this way
+  should not be modified after they are sent. """
+
+  NAME = "local"
+
+  def encode(self, message):
+    return message
+
+  def decode(self, data):
+    return data
+
+
+class BinaryCodec(Codec):
+  """ Compact binary encoding. It is a subset of MessagePack, supporting None,
+  booleans, integers, floats, strings, lists and dicts. Strings are always
+  decoded to unicode, like they are with JSON. """
+
+  NAME = "binary"
+
+  # Type tags.
+  _NONE = 0xc0
+  _FALSE = 0xc2
+  _TRUE = 0xc3
+  _FLOAT64 = 0xcb
+  _INT64 = 0xd3
+  _STR32 = 0xdb
+  _ARRAY32 = 0xdd
+  _MAP32 = 0xdf
+
+  # Masks for the types that store their length or value in the tag itself.
+  _FIXMAP = 0x80
+  _FIXARRAY = 0x90
+  _FIXSTR = 0xa0
+  _NEGATIVE_FIXINT = 0xe0
+
+  # Range of integers that can be encoded.
+  _INT64_MIN = -2 ** 63
+  _INT64_MAX = 2 ** 63 - 1
+
+  # Pre-packed single-byte tags, so we don't have to build them every time.
+  _BYTES = [chr(i) for i in range(256)]
+
+  # Structs for multi-byte values.
+  _INT64_STRUCT = struct.Struct(">q")
+  _UINT32_STRUCT = struct.Struct(">I")
+  _FLOAT64_STRUCT = struct.Struct(">d")
+
+  def __encode_length(self, fixed_tag, long_tag, length, chunks):
+    """ Encodes the tag for a variable-length item.
+    Args:
+      fixed_tag: The tag to use if the length fits in it.
+      long_tag: The tag to use otherwise.
+      length: The length of the item.
+      chunks: The list of chunks to append the encoded tag to. """
+    fixed_max = 0x20 if fixed_tag == self._FIXSTR else 0x10
+    if length < fixed_max:
+      chunks.append(self._BYTES[fixed_tag | length])
+    else:
+      chunks.append(self._BYTES[long_tag])
+      chunks.append(self._UINT32_STRUCT.pack(length))
+
+  def __encode_item(self, item, chunks):
+    """ Encodes a single item.
+    Args:
+      item: The item to encode.
+      chunks: The list of chunks to append the encoded item to. """
+    if item is None:
+      chunks.append(self._BYTES[self._NONE])
+    elif item is True:
+      chunks.append(self._BYTES[self._TRUE])
+    elif item is False:
+      chunks.append(self._BYTES[self._FALSE])
+    elif isinstance(item, (int, long)):
+      if 0 <= item < 0x80:
+        chunks.append(self._BYTES[item])
+      elif -0x20 <= item < 0:
+        chunks.append(self._BYTES[item & 0xff])
+      elif self._INT64_MIN <= item <= self._INT64_MAX:
+        chunks.append(self._BYTES[self._INT64])
+        chunks.append(self._INT64_STRUCT.pack(item))
+      else:
+        raise ValueError("Cannot encode %d, integers must fit in 64 bits." % \
+                         (item))
+    elif isinstance(item, float):
+      chunks.append(self._BYTES[self._FLOAT64])
+      chunks.append(self._FLOAT64_STRUCT.pack(item))
+    elif isinstance(item, basestring):
+      if isinstance(item, unicode):
+        item = item.encode("utf-8")
+      self.__encode_length(self._FIXSTR, self._STR32, len(item), chunks)
+      chunks.append(item)
+    elif isinstance(item, (list, tuple)):
+      self.__encode_length(self._FIXARRAY, self._ARRAY32, len(item), chunks)
+      for element in item:
+        self.__encode_item(element, chunks)
+    elif isinstance(item, dict):
+      self.__encode_length(self._FIXMAP, self._MAP32, len(item), chunks)
+      for key, value in item.iteritems():
+        self.__encode_item(key, chunks)
+        self.__encode_item(value, chunks)
+    else:
+      raise TypeError("Cannot encode item of type %s." % (type(item)))
+
+  def __check_length(self, data, offset, length):
+    """ Makes sure that there is enough data left to read from.
+    Args:
+      data: The bytearray being decoded.
+      offset: The offset in data where the read starts.
+      length: The number of bytes that will be read. """
+    if offset + length > len(data):
+      raise ValueError("Truncated message.")
+
+  def __decode_item(self, data, offset):
+    """ Decodes a single item.
+    Args:
+      data: The bytearray to decode from.
+      offset: The offset in data where the item starts.
+    Returns:
+      The decoded item, and the offset of the next item. """
+    self.__check_length(data, offset, 1)
+    tag = data[offset]
+    offset += 1
+
+    if tag < 0x80:
+      return tag, offset
+    if tag >= self._NEGATIVE_FIXINT:
+      return tag - 0x100, offset
+
+    if tag & 0xe0 == self._FIXSTR:
+      length = tag & 0x1f
+      tag = self._STR32
+    elif tag & 0xf0 == self._FIXARRAY:
+      length = tag & 0x0f
+      tag = self._ARRAY32
+    elif tag & 0xf0 == self._FIXMAP:
+      length = tag & 0x0f
+      tag = self._MAP32
+    elif tag in (self._STR32, self._ARRAY32, self._MAP32):
+      self.__check_length(data, offset, 4)
+      length, = self._UINT32_STRUCT.unpack_from(data, offset)
+      offset += 4
+    elif tag == self._NONE:
+      return None, offset
+    elif tag == self._TRUE:
+      return True, offset
+    elif tag == self._FALSE:
+      return False, offset
+    elif tag == self._INT64:
+      self.__check_length(data, offset, 8)
+      value, = self._INT64_STRUCT.unpack_from(data, offset)
+      return value, offset + 8
+    elif tag == self._FLOAT64:
+      self.__check_length(data, offset, 8)
+      value, = self._FLOAT64_STRUCT.unpack_from(data, offset)
+      return value, offset + 8
+    else:
+      raise ValueError("Invalid type tag 0x%x." % (tag))
+
+    if tag == self._STR32:
+      self.__check_length(data, offset, length)
+      end = offset + length
+      return data[offset:end].decode("utf-8"), end
+    if tag == self._ARRAY32:
+      items = []
+      for _ in range(length):
+        item, offset = self.__decode_item(data, offset)
+        items.append(item)
+      return items, offset
+
+    # Otherwise, it has to be a map.
+    items = {}
+    for _ in range(length):
+      key, offset = self.__decode_item(data, offset)
+      value, offset = self.__decode_item(data, offset)
+      items[key] = value
+    return items, offset
+
+  def encode(self, message):
+    chunks = []
+    self.__encode_item(message, chunks)
+    return "".join(chunks)
+
+  def decode(self, data):
+    message, end = self.__decode_item(bytearray(data), 0)
+    if end != len(data):
+      raise ValueError("Got %d trailing bytes after message." % \
+                       (len(data) - end))
+
+    return message
+
+
+# Singleton instances of every codec, keyed by name.
+_CODECS = {JsonCodec.NAME: JsonCodec(),
+           LocalCodec.NAME: LocalCodec(),
+           BinaryCodec.NAME: BinaryCodec()}
+# Cache of negotiation results, keyed by the two lists of codec names.
+_negotiated = {}
+
+def get_codec(name):
+  """ Gets a codec by name.
+  Args:
+    name: The name of the codec.
+  Returns:
+    The codec instance. """
+  codec = _CODECS.get(name)
+  if codec is None:
+    raise ValueError("Unknown codec '%s'." % (name))
+
+  return codec
+
+def negotiate(ours, theirs):
+  """ Chooses the codec to use for sending a message.
+  Args:
+    ours: Tuple of codec names that the sender supports, in order of
+          preference.
+    theirs: Tuple of codec names that the receiver supports.
+  Returns:
+    The codec instance to use. """
+  key = (ours, theirs)
+  codec = _negotiated.get(key)
+  if codec is not None:
+    return codec
+
+  for name in ours:
+    if name in theirs:
+      codec = get_codec(name)
+      break
+  else:
+    raise ValueError("No common codec between %s and %s." % (ours, theirs))
+
+  _negotiated[key] = codec
+  return codec
@@ -12,6 +12,10 @@ _parser = ConfigParser.ConfigParser()
 if not _parser.read(_CONFIG_FILE):
   raise ValueError("Could not open config file '%s'." % (_CONFIG_FILE))
 
+# Values that have already been looked up, keyed by section and attribute.
+# Drawing a cube looks up a lot of them, and ConfigParser is slow.
+_cache = {}
+
 def get(section, attribute):
   """ Gets the value of an attribute from the config file.
   Args:
@@ -19,7 +23,13 @@ def get(section, attribute):
     attribute: The attribute to read in that section.
   Returns:
     The value of the attribute. """
-  return _parser.get(section, attribute)
+  key = (section, attribute)
+  value = _cache.get(key)
+  if value is None:
+    value = _parser.get(section, attribute)
+    _cache[key] = value
+
+  return value
 
 def items(section):
   """ Gets a list of the attributes in a section.
@@ -1,8 +1,17 @@
+import collections
+import contextlib
+
+from virtual_cube import metrics
+import codec
 import config
 import display
 import event
 import logging
 import obj_canvas
+import profiling
+import routing
+import time
+import tracing
 
 
 logger = logging.getLogger(__name__)
@@ -59,17 +68,95 @@ class Cube(object):
         A list of all sides """
       return cls._ALL
 
+  class Buttons(object):
+    """ Represents the buttons on the front of the cube. """
+
+    LEFT = "left"
+    CENTER = "center"
+    RIGHT = "right"
+
+    # List of each button, from left to right.
+    _ALL = (LEFT, CENTER, RIGHT)
+
+    @classmethod
+    def all(cls):
+      """ Gets a list of all buttons
+      Returns:
+        A list of all buttons, from left to right. """
+      return cls._ALL
+
+  class Connections(dict):
+    """ The connection configuration that gets passed to applications when it
+    changes. It is a dictionary like the one returned by get_connections(), but
+    it also records what changed since the last reconfiguration. """
+
+    def __init__(self, connections, added, removed):
+      """
+      Args:
+        connections: The current connections, as returned by
+                     get_connections().
+        added: Dictionary of the cubes that were connected, keyed by side.
+        removed: Dictionary of the cubes that were disconnected, keyed by
+                 side. """
+      super(Cube.Connections, self).__init__(connections)
+
+      self.added = added
+      self.removed = removed
+
   # Currently selected cube. There can be only one.
   _selected = None
-
-  def __init__(self, canvas, idx, color):
+  # The cube that the user is holding a button down on, if any.
+  _held = None
+
+  # How many topology change batches are currently open.
+  _batch_depth = 0
+  # For every cube whose connections changed during the current batch, the
+  # connections it had before the batch started.
+  _batch_before = collections.OrderedDict()
+  # Incremented every time a link is made or broken, so that cubes can tell
+  # when their routing tables are out of date.
+  _topology_version = 0
+
+  class Detail(object):
+    """ How much of a cube gets drawn. """
+
+    # Nothing is drawn, because the cube isn't in view.
+    NONE = 0
+    # Only the case is drawn.
+    CASE = 1
+    # Everything is drawn, including the display and buttons.
+    FULL = 2
+
+  # Internal counter to use for generating unique cube IDs.
+  _CUBE_ID = 0
+  # The canvas scale that cubes have to be viewed at to be drawn in full
+  # detail. Displays can't be scaled, so this is the only one that works.
+  _FULL_DETAIL_SCALE = 1.0
+
+  __slots__ = ("__canvas", "__idx", "__cluster_index", "__id", "__routes",
+               "__routes_version", "__color", "__dragging", "__cube_shapes",
+               "__connected", "__application", "__screen", "__detail",
+               "__held_button", "__prev_mouse_x", "__prev_mouse_y")
+
+  def __init__(self, canvas, idx, color, cluster_index=None):
     """
     Args:
       canvas: The canvas to draw the cube on.
       idx: The grid indices where the new cube is located.
-      color: The color of the cube. """
+      color: The color of the cube.
+      cluster_index: The ClusterIndex to keep updated with this cube's
+                     connections, if any. """
     self.__canvas = canvas
     self.__idx = idx
+    self.__cluster_index = cluster_index
+
+    # Assign an ID to this cube.
+    self.__id = Cube._CUBE_ID
+    Cube._CUBE_ID += 1
+    # Routing table for sending messages to cubes that aren't adjacent, and the
+    # topology version that it was built for. It gets built when we need it.
+    self.__routes = None
+    self.__routes_version = None
 
     # Determine position from index
     (x, y) = self.__idx
@@ -77,25 +164,28 @@ class Cube(object):
     y *= int(config.get('CUBE', 'CUBE_SIZE'))
     x += int(config.get('CUBE', 'GRID_OFFSET'))
     y += int(config.get('CUBE', 'GRID_OFFSET'))
-    self.__pos = (x, y)
-
-    self.__color = color
 
     # Whether the cube is currently being dragged.
     self.__dragging = False
+    # The button that the user is holding down, if any.
+    self.__held_button = None
     # List of shapes in the cube.
     self.__cube_shapes = []
+    # The current application running on the cube. If None, then no application
+    # is running.
+    self.__application = None
+
+    self.__color = color
     # List of other cubes that are currently connected to this one. A None
     # in a position indicates that no cube is connected there.
     self.__connected = {Cube.Sides.LEFT: None,
                         Cube.Sides.RIGHT: None,
                         Cube.Sides.TOP: None,
                         Cube.Sides.BOTTOM: None}
-    # The current application running on the cube. If None, then no application
-    # is running.
-    self.__application = None
 
-    self.__draw_cube()
+    # Only the parts of the cube that can be seen get drawn.
+    self.__detail = self.__get_detail((x, y))
+    self.__draw_cube((x, y), color)
 
   @classmethod
   def get_selected(cls):
@@ -104,50 +194,240 @@ class Cube(object):
       The currently selected cube. """
     return cls._selected
 
-  def __draw_cube(self):
-    """ Draws the cube on the canvas. """
-    x, y = self.__pos
+  @classmethod
+  def release_held_button(cls, timestamp=None):
+    """ Releases the button that the user is holding down, if there is one.
+    Args:
+      timestamp: When it was released, in seconds since the epoch. Defaults to
+                 now.
+    Returns:
+      True if a button was released. """
+    held = cls._held
+    if held is None:
+      return False
+
+    cls._held = None
+    button = held.__held_button
+    held.__held_button = None
+    held.receive_button_event(button, False, timestamp)
+    return True
+
+  @classmethod
+  def _begin_batch(cls):
+    """ Starts batching topology changes. Until the matching call to
+    _end_batch(), applications will not be notified of reconfigurations.
+    Batches can be nested. """
+    cls._batch_depth += 1
+
+  @classmethod
+  def _end_batch(cls):
+    """ Ends a topology change batch. When the outermost batch ends, every cube
+    whose connections changed gets exactly one reconfiguration event. """
+    assert cls._batch_depth > 0
+    cls._batch_depth -= 1
+    if cls._batch_depth:
+      # Still inside an outer batch.
+      return
+
+    # Apps might reconfigure things in response, so start a fresh batch.
+    changed = cls._batch_before
+    cls._batch_before = collections.OrderedDict()
+
+    # Work out all the changes before telling any apps, so that everything is
+    # consistent by the time they hear about it.
+    recorder = tracing.get_recorder()
+    configs = []
+    for cube, before in changed.iteritems():
+      config = cube.__compute_changes(before)
+      if config is not None:
+        configs.append((cube, config))
+        if recorder is not None:
+          recorder.record_topology(cube, config)
+
+    for cube, config in configs:
+      cube.__report_changes(config)
+
+  @classmethod
+  @contextlib.contextmanager
+  def batch_changes(cls):
+    """ Context manager that batches all topology changes made within it. """
+    cls._begin_batch()
+    try:
+      yield
+    finally:
+      cls._end_batch()
+
+  def __draw_cube(self, pos, color):
+    """ Draws the cube on the canvas.
+    Args:
+      pos: The position to draw it at.
+      color: The color of the cube. """
+    x, y = pos
+    hide_case = self.__detail < Cube.Detail.CASE
+    hide_rest = self.__detail < Cube.Detail.FULL
 
     # Draw the actual cube shapes.
     base_size = int(config.get('CUBE', 'CUBE_SIZE'))
-    case = obj_canvas.Rectangle(self.__canvas, self.__pos,
-                                (base_size, base_size),
-                                fill=self.__color, outline=self.__color)
-    self.__screen = display.Display(self.__canvas, (x, y - 20), (180, 140))
+    case = obj_canvas.Rectangle(self.__canvas, pos, (base_size, base_size),
+                                fill=color, outline=color, hidden=hide_case)
+    self.__screen = display.make_display(self.__canvas, (x, y - 20),
+                                         hidden=hide_rest)
     button_l = obj_canvas.Rectangle(self.__canvas, (x - 65, y + 75), (50, 30),
                                     fill=config.get('COLORS', 'BUTTONS'),
-                                    outline=config.get('COLORS', 'BUTTONS'))
+                                    outline=config.get('COLORS', 'BUTTONS'),
+                                    hidden=hide_rest)
     button_c = obj_canvas.Rectangle(self.__canvas, (x, y + 75), (50, 30),
                                     fill=config.get('COLORS', 'BUTTONS'),
-                                    outline=config.get('COLORS', 'BUTTONS'))
+                                    outline=config.get('COLORS', 'BUTTONS'),
+                                    hidden=hide_rest)
     button_r = obj_canvas.Rectangle(self.__canvas, (x + 65, y + 75), (50, 30),
                                     fill=config.get('COLORS', 'BUTTONS'),
-                                    outline=config.get('COLORS', 'BUTTONS'))
+                                    outline=config.get('COLORS', 'BUTTONS'),
+                                    hidden=hide_rest)
 
     self.__cube_shapes.extend([case, self.__screen, button_l, button_c, button_r])
 
     # Bind mouse events for the cube.
     case.bind_event(event.MousePressEvent, self.__cube_clicked)
 
+  def __get_detail(self, pos):
+    """ Works out how much of the cube should be drawn.
+    Args:
+      pos: The position of the cube.
+    Returns:
+      The Detail level to draw it at. """
+    x, y = pos
+    half_size = int(config.get('CUBE', 'CUBE_SIZE')) / 2
+    if not self.__canvas.is_visible((x - half_size, y - half_size,
+                                     x + half_size, y + half_size)):
+      return Cube.Detail.NONE
+    if self.__canvas.get_scale() < Cube._FULL_DETAIL_SCALE:
+      return Cube.Detail.CASE
+    return Cube.Detail.FULL
+
+  def get_detail(self):
+    """
+    Returns:
+      The Detail level that the cube is being drawn at. """
+    return self.__detail
+
+  def update_detail(self):
+    """ Shows or hides parts of the cube, depending on whether it is in view,
+    and how far the canvas is zoomed out. This has to be called whenever the
+    canvas view changes. """
+    detail = self.__get_detail(self.get_pos())
+    if detail == self.__detail:
+      return
+    self.__detail = detail
+
+    # The case comes first, so that it gets drawn below everything else.
+    case = self.__cube_shapes[0]
+    if detail >= Cube.Detail.CASE:
+      case.show()
+    else:
+      case.hide()
+    for shape in self.__cube_shapes[1:]:
+      if detail >= Cube.Detail.FULL:
+        shape.show()
+      else:
+        shape.hide()
+
+  def __get_button_at(self, pos):
+    """ Finds the button at a position.
+    Args:
+      pos: The position.
+    Returns:
+      The button from Cube.Buttons, or None if there isn't one there. """
+    if self.__detail < Cube.Detail.FULL:
+      # The buttons aren't drawn, so they can't be pressed.
+      return None
+
+    for button, shape in zip(Cube.Buttons.all(), self.__cube_shapes[2:]):
+      if shape.point_within(pos):
+        return button
+    return None
+
   def __cube_clicked(self, event):
     """ Called when the user presses the mouse button over the cube. """
+    button = self.__get_button_at(event.get_pos())
+    if button is not None:
+      # Pressing a button doesn't pick up the cube.
+      self.__held_button = button
+      Cube._held = self
+      self.receive_button_event(button, True)
+      return
+
     # We are now dragging this cube.
     self.__dragging = True
     # The cube is now selected.
     Cube._selected = self
+    # Everything that happens until the cube is dropped counts as a single
+    # move, so apps only find out about the net effect.
+    Cube._begin_batch()
     # As soon as the cube is selected, all connections are broken.
     self.__clear_connections()
     # When moving, keeps track of the previous mouse position.
     self.__prev_mouse_x, self.__prev_mouse_y = event.get_pos()
 
-  def __config_changed_hook(self):
-    """ Run when the connection configuration changes. It takes care of
-    notifying the running application. """
+  def __will_change(self):
+    """ Must be run before the connection configuration changes. It remembers
+    the original configuration so that we can report the changes once the
+    current batch ends. """
+    assert Cube._batch_depth > 0
+    if self not in Cube._batch_before:
+      Cube._batch_before[self] = self.get_connections()
+
+    # Messages can be routed before the batch ends, and they have to follow the
+    # links as they are now.
+    Cube._topology_version += 1
+
+  def __compute_changes(self, before):
+    """ Run when a topology change batch ends. It works out how the connection
+    configuration changed, and updates the cluster index accordingly.
+    Args:
+      before: The connections that the cube had before the batch.
+    Returns:
+      The new Connections, or None if nothing changed. """
+    added = {}
+    removed = {}
+    for side, other in self.__connected.iteritems():
+      old_other = before[side]
+      if other is old_other:
+        continue
+
+      if old_other is not None:
+        removed[side] = old_other
+      if other is not None:
+        added[side] = other
+
+    if not (added or removed):
+      # Everything ended up the way it was.
+      return
+
+    if self.__cluster_index is not None:
+      self.__cluster_index.update(self, added, removed)
+
+    return Cube.Connections(self.__connected, added, removed)
+
+  def __report_changes(self, config):
+    """ Notifies the running application that the connection configuration
+    changed.
+    Args:
+      config: The new Connections. """
+    recorder = tracing.get_recorder()
+    if recorder is not None:
+      recorder.record_reconfiguration(self, config)
+
     if self.__application is None:
       # No application.
       return
 
-    self.__application.on_reconfiguration(self.get_connections())
+    if profiling.active is None:
+      self.__application.on_reconfiguration(config)
+    else:
+      profiling.active.call(self.__application, self.__id,
+                            profiling.RECONFIGURATION,
+                            self.__application.on_reconfiguration, config)
 
   def __add_connection(self, other, side):
     """ Adds a connection from this cube to another one.
@@ -159,25 +439,23 @@ class Cube(object):
     if self.__connected[side] == other:
       return False
 
+    self.__will_change()
     self.__connected[side] = other
     return True
 
   def __clear_connections(self):
     """ Clears all connections to this cube. """
-    changed = False
+    with Cube.batch_changes():
+      for side in self.__connected.iterkeys():
+        if self.__connected[side] is None:
+          continue
 
-    for side in self.__connected.iterkeys():
-      if self.__connected[side] is not None:
         # Clear the connection on the other side.
         opposite = Cube.Sides.opposite(side)
         self.__connected[side].disconnect(opposite)
-        changed = True
 
-      self.__connected[side] = None
-
-    if changed:
-      # Report a state change.
-      self.__config_changed_hook()
+        self.__will_change()
+        self.__connected[side] = None
 
   def get_connections(self):
     """
@@ -199,9 +477,9 @@ class Cube(object):
     if self.__connected[side] is None:
       return
 
-    self.__connected[side] = None
-    # Report a state change.
-    self.__config_changed_hook()
+    with Cube.batch_changes():
+      self.__will_change()
+      self.__connected[side] = None
 
   def get_pos(self):
     """
@@ -221,7 +499,9 @@ class Cube(object):
     x += int(config.get('CUBE', 'GRID_OFFSET'))
     y += int(config.get('CUBE', 'GRID_OFFSET'))
     self._set_pos(x, y)
-    self.update_connections(others)
+
+    with Cube.batch_changes():
+      self.update_connections(others)
 
   def _set_pos(self, x, y):
     """ Sets the pixel position of the cube.
@@ -232,30 +512,71 @@ class Cube(object):
     old_x, old_y = self.get_pos()
     move_x = x - old_x
     move_y = y - old_y
-    self.__pos = (x, y)
 
     for shape in self.__cube_shapes:
       shape.move(move_x, move_y)
+    # It might have moved into or out of view.
+    self.update_detail()
 
     # Update the canvas.
     self.__canvas.update()
 
-    message = "cube changed position from " + str((old_x, old_y)) + " to " + str((x, y))
-    logger.info(message)
+    # This happens on every drag event, so don't format anything unless it
+    # actually gets logged.
+    if logger.isEnabledFor(logging.INFO):
+      logger.info("cube changed position from %s to %s", (old_x, old_y), (x, y),
+                  extra={"cube_id": self.__id, "old_pos": (old_x, old_y),
+                         "new_pos": (x, y)})
 
   def get_color(self):
     return self.__color
 
+  def get_id(self):
+    """
+    Returns:
+      The unique ID of this cube. """
+    return self.__id
+
+  def get_routing_table(self):
+    """ Gets the routing table for this cube, rebuilding it if the topology has
+    changed since it was last used.
+    Returns:
+      The RoutingTable for this cube. """
+    if self.__routes_version != Cube._topology_version:
+      self.__routes = routing.RoutingTable(self)
+      self.__routes_version = Cube._topology_version
+
+    return self.__routes
+
+  def get_cluster_index(self):
+    """
+    Returns:
+      The ClusterIndex tracking this cube, or None if there isn't one. """
+    return self.__cluster_index
+
   def get_display(self):
     """
     Returns:
       The display object for this cube. """
     return self.__screen
 
+  def get_button_pos(self, button):
+    """
+    Args:
+      button: The button, from Cube.Buttons.
+    Returns:
+      The position of the center of the button, as (x, y). """
+    index = Cube.Buttons.all().index(button)
+    return self.__cube_shapes[2 + index].get_pos()
+
   def run_app(self, app):
     """ Run a new application on the cube.
     Args:
       app: The class of the app to run. """
+    recorder = tracing.get_recorder()
+    if recorder is not None:
+      recorder.record_app(self, app)
+
     self.__application = app
     self.__application.run(self)
 
@@ -292,31 +613,212 @@ class Cube(object):
     assert Cube._selected == self
     Cube._selected = None
 
-  def send_message(self, side, message):
+    # The move is complete, so report what changed.
+    Cube._end_batch()
+
+  def get_peer_codecs(self, side):
+    """ Gets the codecs understood by the app running on a connected cube.
+    Args:
+      side: The side that the other cube is connected on.
+    Returns:
+      The names of the codecs that the app supports, or an empty tuple if no
+      app is running there. """
+    other = self.__connected[side]
+    if other is None:
+      # Make sure there's something there.
+      raise ValueError("No cube connected on side %s'." % (side))
+
+    return other.get_codecs()
+
+  def get_codecs(self):
+    """ Gets the codecs understood by the app running on this cube.
+    Returns:
+      The names of the codecs that the app supports, or an empty tuple if no
+      app is running. """
+    if self.__application is None:
+      return ()
+    return self.__application.get_codecs()
+
+  def send_message(self, side, message, codec_name=codec.JsonCodec.NAME):
     """ Sends a message to a cube directly connected to this one.
     Args:
       side: The side that the recipient is connected on.
-      message: The string message to send. """
+      message: The serialized message to send.
+      codec_name: The name of the codec that the message was encoded with. """
     other = self.__connected[side]
     if other is None:
       # Make sure there's something there.
       raise ValueError("No cube connected on side %s'." % (side))
 
+    recorder = tracing.get_recorder()
+    if recorder is not None:
+      recorder.record_send(self, side, message, codec_name)
+    registry = metrics.get_registry()
+    if registry is not None:
+      registry.get_counter("cube.messages_sent").increment(label=self.__id)
+
     # Pass the message to the cube.
     other_side = Cube.Sides.opposite(side)
-    other.receive_message(other_side, message)
+    other.receive_message(other_side, message, codec_name)
+
+  def flood_message(self, encoding, sides=None, first_side=None):
+    """ Sends a message to every cube that can be reached from this one by
+    following connections, without sending it to any cube twice.
+    Args:
+      encoding: Callable that takes the codec names supported by a receiver,
+                and returns the encoded message and the name of the codec
+                used.
+      sides: The sides that the message is allowed to travel through. By
+             default, it can go through all of them.
+      first_side: If specified, the message is first sent to the cube
+                  connected on this side, and spreads out from there. """
+    if sides is None:
+      sides = Cube.Sides.all()
+
+    visited = set([self])
+    # Cubes that we still have to deliver to, along with the side that the
+    # message arrives on.
+    to_visit = collections.deque()
+
+    def visit_neighbors(cube):
+      """ Queues up all the unvisited neighbors of a cube.
+      Args:
+        cube: The cube whose neighbors to visit. """
+      for side in sides:
+        other = cube.__connected[side]
+        if other is not None and other not in visited:
+          visited.add(other)
+          to_visit.append((other, Cube.Sides.opposite(side)))
+
+    if first_side is not None:
+      other = self.__connected[first_side]
+      if other is None:
+        # Make sure there's something there.
+        raise ValueError("No cube connected on side %s'." % (first_side))
+
+      visited.add(other)
+      to_visit.append((other, Cube.Sides.opposite(first_side)))
+    else:
+      visit_neighbors(self)
+
+    while to_visit:
+      cube, side = to_visit.popleft()
+      # Figure out where it goes next before the receiver gets a chance to
+      # change anything.
+      visit_neighbors(cube)
+
+      message, codec_name = encoding(cube.get_codecs())
+      cube.receive_message(side, message, codec_name)
+
+  def route_message(self, cube_id, encoding):
+    """ Sends a message to any cube that is reachable from this one. It gets
+    forwarded along the shortest path, with each cube on the way using its own
+    routing table to pick the next hop.
+    Args:
+      cube_id: The ID of the cube to send it to.
+      encoding: Callable that takes the codec names supported by the receiver,
+                and returns the encoded message and the name of the codec
+                used. """
+    sent_at = time.time()
+
+    hops = 0
+    current = self
+    while current.__id != cube_id:
+      side = current.get_routing_table().get_next_side(cube_id)
+      if side is None or current.__connected[side] is None:
+        raise ValueError("No route from cube %d to cube %d." % \
+                         (self.__id, cube_id))
+
+      current = current.__connected[side]
+      hops += 1
+      # No path can visit more cubes than there are, so we must be going around
+      # in circles.
+      if hops > Cube._CUBE_ID:
+        raise ValueError("Routing loop from cube %d to cube %d." % \
+                         (self.__id, cube_id))
+
+    message, codec_name = encoding(current.get_codecs())
+    routing.get_stats().record_delivery(hops, time.time() - sent_at)
+
+    current.receive_routed_message(self.__id, message, codec_name)
+
+  def receive_routed_message(self, source_id, message,
+                             codec_name=codec.JsonCodec.NAME):
+    """ Receives a message that was routed from another cube.
+    Args:
+      source_id: The ID of the cube that sent the message.
+      message: The serialized message being received.
+      codec_name: The name of the codec that the message was encoded with. """
+    recorder = tracing.get_recorder()
+    if recorder is not None:
+      recorder.record_routed(self, source_id, message, codec_name)
+
+    if not self.__application:
+      # With no app, the message gets dropped.
+      return
 
-  def receive_message(self, side, message):
+    self.__application.on_routed_message_receive(source_id, message,
+                                                  codec_name)
+
+  def receive_message(self, side, message, codec_name=codec.JsonCodec.NAME):
     """ Receives a message from a connected cube.
     Args:
       side: The side that the sender is connected to.
-      message: The string message being received. """
+      message: The serialized message being received.
+      codec_name: The name of the codec that the message was encoded with. """
+    recorder = tracing.get_recorder()
+    if recorder is not None:
+      recorder.record_receive(self, side, message, codec_name)
+    registry = metrics.get_registry()
+    if registry is not None:
+      registry.get_counter("cube.messages_received").increment(label=self.__id)
+
     if not self.__application:
       # With no app, the message gets dropped.
       return
 
     # Otherwise, pass it to the app.
-    self.__application.on_message_receive(side, message)
+    if registry is None:
+      self.__application.on_message_receive(side, message, codec_name)
+      return
+
+    start_time = time.time()
+    self.__application.on_message_receive(side, message, codec_name)
+    registry.get_histogram("app.message_handler_time") \
+        .observe(time.time() - start_time)
+
+  def receive_button_event(self, button, pressed, timestamp=None):
+    """ Receives a button on the cube being pressed or released.
+    Args:
+      button: The button, from Cube.Buttons.
+      pressed: True if it was pressed, false if it was released.
+      timestamp: When it happened, in seconds since the epoch. Defaults to
+                 now. """
+    if timestamp is None:
+      timestamp = time.time()
+
+    recorder = tracing.get_recorder()
+    if recorder is not None:
+      recorder.record_button(self, button, pressed, timestamp)
+    registry = metrics.get_registry()
+    if registry is not None:
+      registry.get_counter("cube.button_events").increment(label=self.__id)
+
+    if not self.__application:
+      # With no app, nobody cares.
+      return
+
+    if registry is None:
+      self.__application.on_button_event(button, pressed, timestamp)
+      return
+
+    start_time = time.time()
+    # How long the event waited before it got to the app.
+    registry.get_histogram("app.button_latency") \
+        .observe(start_time - timestamp)
+    self.__application.on_button_event(button, pressed, timestamp)
+    registry.get_histogram("app.button_handler_time") \
+        .observe(time.time() - start_time)
 
   def snap_to_grid(self, grid_size, others, offset = 0):
     """ Snap this cube to grid.
@@ -337,19 +839,29 @@ class Cube(object):
     offset = int(config.get("CUBE", "GRID_OFFSET"))
     size = int(config.get("CUBE", "CUBE_SIZE"))
 
-    x2 = (new_x - offset) // size
-    y2 = (new_y - offset) // size
+    # Mouse positions can be fractional if the view is zoomed.
+    x2 = int(new_x - offset) // size
+    y2 = int(new_y - offset) // size
+    # If it was dropped off the edge of the grid, it goes in the closest spot.
+    x2 = max(0, min(x2, len(others[0]) - 1))
+    y2 = max(0, min(y2, len(others) - 1))
     swap_cube = others[y2][x2]
     others[y2][x2] = self
     others[y1][x1] = swap_cube
 
-    if swap_cube:
-        swap_cube.__clear_connections()
-        swap_cube.set_idx(x1, y1, others)
+    # Both cubes move as part of the same topology change.
+    with Cube.batch_changes():
+      if swap_cube:
+          swap_cube.__clear_connections()
+          swap_cube.set_idx(x1, y1, others)
 
-    self.set_idx(x2, y2, others)
+      self.set_idx(x2, y2, others)
 
   def update_connections(self, others):
+    """ Connects this cube to any cubes that are adjacent to it on the grid.
+    This must be called within a topology change batch.
+    Args:
+      others: 2D array representing all cubes in their locations. """
     # Maximum size of the grid.
     max_height = len(others)
     max_width = len(others[0])
@@ -369,9 +881,5 @@ class Cube(object):
 
       # If a cube exists on this side, add connections
       if other:
-        self_changed = self.__add_connection(other, side)
-        other_changed = other.__add_connection(self, Cube.Sides.opposite(side))
-        if self_changed:
-          self.__config_changed_hook()
-        if other_changed:
-          other.__config_changed_hook()
+        self.__add_connection(other, side)
+        other.__add_connection(self, Cube.Sides.opposite(side))
@@ -1,38 +1,169 @@
-import logging
-import config
-
-
-class CubeLogger(logging.Logger):
-  """ Logger for the simulator. """
-
-  def __init__(self, name):
-    """
-    Args:
-      name: The name of the logger. """
-    super(CubeLogger, self).__init__(name)
-
-    # Set the root logging level.
-    self.setLevel(logging.DEBUG)
-
-    log_location = config.get('LOGGING', 'log_location')
-
-    # Create the Handler for logging data to a file
-    file_handler = logging.FileHandler(log_location, mode="w")
-    file_handler.setLevel(logging.DEBUG)
-    # Create the Handler for logging important messages to stdout.
-    stream_handler = logging.StreamHandler()
-    stream_handler.setLevel(logging.INFO)
-
-    # Create a Formatter for formatting the log messages
-    logger_formatter = logging.Formatter('%(name)s - %(levelname)s - %(message)s')
-
-    # Add the Formatter to the handlers.
-    file_handler.setFormatter(logger_formatter)
-    stream_handler.setFormatter(logger_formatter)
-
-    # Add the handlers to the Logger
-    self.addHandler(file_handler)
-    self.addHandler(stream_handler)
-
-
-logging.setLoggerClass(CubeLogger)
+import atexit
+import json
+import logging
+import Queue
+import threading
+
+import config
+
+
+# Attributes that every LogRecord has. Anything else on a record was passed in
+# with "extra", and gets written out as a structured field.
+_STANDARD_ATTRIBUTES = set(logging.LogRecord("", 0, "", 0, "", (), None) \
+                           .__dict__.keys())
+
+
+class QueueHandler(logging.Handler):
+  """ Handler that just puts records on a queue, so that the caller doesn't
+  have to wait for them to be formatted and written. Messages are formatted
+  later, so arguments passed to the logger must not be changed afterwards. """
+
+  def __init__(self, queue):
+    """
+    Args:
+      queue: The queue to put records on. """
+    super(QueueHandler, self).__init__()
+    self.__queue = queue
+
+  def emit(self, record):
+    try:
+      self.__queue.put_nowait(record)
+    except Exception:
+      self.handleError(record)
+
+
+class QueueListener(object):
+  """ Takes records off a queue in a background thread, and passes them to the
+  handlers that actually write them. """
+
+  def __init__(self, queue, *handlers):
+    """
+    Args:
+      queue: The queue to take records from.
+      All other arguments are the handlers to pass records to. """
+    self.__queue = queue
+    self.__handlers = handlers
+    self.__thread = None
+
+  def __run(self):
+    """ Handles records until the listener is stopped. """
+    while True:
+      record = self.__queue.get()
+      if record is None:
+        # We were stopped.
+        return
+
+      for handler in self.__handlers:
+        if record.levelno >= handler.level:
+          handler.handle(record)
+
+  def start(self):
+    """ Starts handling records in the background. """
+    self.__thread = threading.Thread(target=self.__run)
+    self.__thread.daemon = True
+    self.__thread.start()
+
+  def stop(self):
+    """ Handles any remaining records, and stops the background thread. """
+    if self.__thread is None:
+      return
+
+    self.__queue.put(None)
+    self.__thread.join()
+    self.__thread = None
+
+    for handler in self.__handlers:
+      handler.flush()
+
+
+class JsonLinesFormatter(logging.Formatter):
+  """ Formats records as JSON objects, one per line, so that they can be
+  processed by other tools. Anything passed to the logger with "extra" is
+  included as a field. """
+
+  def format(self, record):
+    entry = {"time": record.created,
+             "name": record.name,
+             "level": record.levelname,
+             "message": record.getMessage()}
+    for key, value in record.__dict__.iteritems():
+      if key not in _STANDARD_ATTRIBUTES:
+        entry[key] = value
+    if record.exc_info:
+      entry["exception"] = self.formatException(record.exc_info)
+
+    return json.dumps(entry, default=repr)
+
+
+def _make_queue_handler():
+  """ Creates the handlers that write the log, and starts writing from the
+  background.
+  Returns:
+    The QueueHandler that loggers should use. """
+  level = logging.getLevelName(config.get('LOGGING', 'level'))
+
+  # Create a Formatter for formatting the log messages
+  logger_formatter = logging.Formatter('%(name)s - %(levelname)s - %(message)s')
+
+  # Create the Handler for logging data to a file
+  file_handler = logging.FileHandler(config.get('LOGGING', 'log_location'),
+                                     mode="w")
+  file_handler.setLevel(level)
+  file_handler.setFormatter(logger_formatter)
+  # Create the Handler for logging important messages to stdout.
+  stream_handler = logging.StreamHandler()
+  stream_handler.setLevel(max(level, logging.INFO))
+  stream_handler.setFormatter(logger_formatter)
+  handlers = [file_handler, stream_handler]
+
+  json_location = config.get('LOGGING', 'json_log_location')
+  if json_location:
+    # Also write structured logs.
+    json_handler = logging.FileHandler(json_location, mode="w")
+    json_handler.setLevel(level)
+    json_handler.setFormatter(JsonLinesFormatter())
+    handlers.append(json_handler)
+
+  queue = Queue.Queue()
+  listener = QueueListener(queue, *handlers)
+  listener.start()
+  # Make sure everything gets written before we exit.
+  atexit.register(listener.stop)
+
+  return QueueHandler(queue)
+
+# The handler that all the loggers share.
+_queue_handler = None
+_queue_handler_lock = threading.Lock()
+
+def _get_queue_handler():
+  """
+  Returns:
+    The QueueHandler that all the loggers share. It is created the first time
+    that this is called. """
+  global _queue_handler
+  with _queue_handler_lock:
+    if _queue_handler is None:
+      _queue_handler = _make_queue_handler()
+    return _queue_handler
+
+
+class CubeLogger(logging.Logger):
+  """ Logger for the simulator. Records are written by a background thread, so
+  logging is cheap for the caller. Messages should be passed with separate
+  arguments, like logger.debug("Got %s", message), so that they only get
+  formatted if they are actually written. """
+
+  def __init__(self, name):
+    """
+    Args:
+      name: The name of the logger. """
+    super(CubeLogger, self).__init__(name)
+
+    # Set the root logging level.
+    self.setLevel(logging.getLevelName(config.get('LOGGING', 'level')))
+
+    self.addHandler(_get_queue_handler())
+
+
+logging.setLoggerClass(CubeLogger)
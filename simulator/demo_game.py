@@ -5,11 +5,20 @@
 import cube_logger
 
 
+from virtual_cube import metrics
 import config
+import profiling
 import word_app
 import tabletop
 
 
+if config.get('METRICS', 'enabled').lower() == "true":
+  metrics.enable(dump_path=config.get('METRICS', 'dump_location'),
+                 dump_interval=float(config.get('METRICS', 'dump_interval')))
+if config.get('PROFILING', 'enabled').lower() == "true":
+  profiling.start(
+      use_cprofile=config.get('PROFILING', 'cprofile').lower() == "true")
+
 table = tabletop.Tabletop()
 
 colors = list(config.items('COLORS'))
@@ -28,3 +37,12 @@ app = word_app.WordGameChecker()
 checker_cube.run_app(app)
 
 table.run()
+
+# Write out the final metrics.
+metrics.disable()
+
+profiler = profiling.stop()
+if profiler is not None:
+  profiler.dump_collapsed(config.get('PROFILING', 'collapsed_location'))
+  if config.get('PROFILING', 'cprofile').lower() == "true":
+    profiler.dump_pstats(config.get('PROFILING', 'pstats_location'))
@@ -1,58 +1,133 @@
+import collections
+
 import config
+import framebuffer
 import obj_canvas
 
 
 class Display(obj_canvas.Shape):
-  """ Simulates the display hardware for the cube. """
+  """ Simulates the display hardware for the cube. It keeps a retained list of
+  everything on the screen. When an app clears the screen and draws it again,
+  the new items are matched up with the old ones, so that only the things that
+  actually changed need to be touched on the canvas. """
   # TODO (danielp): Re-implement this with a better class hierarchy, possibly
   # with a generic "Container" superclass.
 
-  def __init__(self, canvas, pos, size):
+  __slots__ = ("__size", "__background", "__text_items", "__stale_items",
+               "__flush_scheduled")
+
+  def __init__(self, canvas, pos, size, hidden=False):
     """
     Args:
       canvas: The canvas to draw on.
       pos: The initial position of the display.
-      size: The size of the display. """
+      size: The size of the display.
+      hidden: If true, the display isn't drawn until show() is called. """
     self.__size = size
+    color = config.get('COLORS', 'SCREEN')
 
-    # Object representing the display background.
-    self.__background = None
-    # List of all the canvas objects on-screen.
-    self.__display_objs = []
+    # Object representing the display background. It gets drawn along with the
+    # rest of the display.
+    self.__background = obj_canvas.Rectangle(canvas, pos, size, fill=color,
+                                             outline=color, hidden=True)
+    # The text items currently on-screen, as a list of tuples containing the
+    # parameters that were used to draw them and the canvas object.
+    self.__text_items = []
+    # Text items from before the last clear() that haven't been reused yet,
+    # keyed by the parameters that were used to draw them.
+    self.__stale_items = collections.OrderedDict()
+    # Whether we have already scheduled a removal of the stale items.
+    self.__flush_scheduled = False
 
     # Draw on the canvas.
-    super(Display, self).__init__(canvas, pos,
-                                  fill=config.get('COLORS', 'SCREEN'),
-                                  outline=config.get('COLORS', 'SCREEN'))
+    super(Display, self).__init__(canvas, pos, fill=color, outline=color,
+                                  hidden=hidden)
 
   def _draw_object(self):
-    # Draw the background.
-    pos = (self._pos_x, self._pos_y)
-    self.__background = obj_canvas.Rectangle(self._canvas, pos, self.__size,
-                                             fill=self._fill,
-                                             outline=self._outline)
+    # The background comes first, so that it ends up below the text.
+    for item in self.__all_items():
+      item.show()
 
-    self.__display_objs.append(self.__background)
     # In this case, reference just points to the background.
     self._reference = self.__background._reference
 
+  def _erase_object(self):
+    for item in self.__all_items():
+      item.hide()
+
+    self._reference = None
+
+  def __all_items(self):
+    """ Gets every canvas object that is part of the display.
+    Returns:
+      A list of the objects. """
+    items = [self.__background]
+    items.extend([item for _, item in self.__text_items])
+    for stale in self.__stale_items.itervalues():
+      items.extend(stale)
+
+    return items
+
+  def __take_stale_item(self, params):
+    """ Takes an item left over from before the last clear() that we can reuse.
+    Args:
+      params: The parameters of the item that we want to draw.
+    Returns:
+      The item, and whether it already matches the parameters, or None and
+      False if there is nothing to reuse. """
+    if not self.__stale_items:
+      return None, False
+
+    exact = params in self.__stale_items
+    if exact:
+      key = params
+    else:
+      # Take the oldest one and change it.
+      key = next(self.__stale_items.iterkeys())
+
+    stale = self.__stale_items[key]
+    item = stale.pop()
+    if not stale:
+      del self.__stale_items[key]
+
+    return item, exact
+
+  def __flush_stale_items(self):
+    """ Removes any stale items that didn't get reused from the canvas. """
+    self.__flush_scheduled = False
+
+    for stale in self.__stale_items.itervalues():
+      for item in stale:
+        item.delete()
+    self.__stale_items.clear()
+
   def get_bbox(self):
     # To implement this, we can just use the bbox of the background.
     return self.__background.get_bbox()
 
+  def set_fill(self, fill):
+    if fill == self._fill:
+      # It's already that color.
+      return
+    self._fill = fill
+
+    self.__background.set_fill(fill)
+
   def move(self, x_shift, y_shift):
     self._pos_x += x_shift
     self._pos_y += y_shift
 
-    for item in self.__display_objs:
+    for item in self.__all_items():
       item.move(x_shift, y_shift)
 
   def delete(self):
-    for item in self.__display_objs:
+    for item in self.__all_items():
       item.delete()
 
-    self.__display_objs = []
+    self.__text_items = []
+    self.__stale_items.clear()
     self._reference = None
+    self._hidden = False
 
   def draw_text(self, text, pos, size):
     """ Draws text on the display.
@@ -65,21 +140,264 @@ class Display(obj_canvas.Shape):
     # The pos is relative to the screen center.
     screen_x, screen_y = self.__background.get_pos()
     rel_x = screen_x + pos[0]
-    rel_y = screen_y + pos[0]
-    rel_pos = (rel_x, rel_y)
+    rel_y = screen_y + pos[1]
 
-    item = obj_canvas.Text(self._canvas, rel_pos, text, font)
+    params = (text, pos, size)
+    item, exact = self.__take_stale_item(params)
+    if item is None:
+      # Nothing to reuse, so we have to make a new one.
+      item = obj_canvas.Text(self._canvas, (rel_x, rel_y), text, font,
+                             hidden=self._hidden)
+    elif not exact:
+      # Change the old item to look like the new one.
+      item.set_text(text, font)
+      item_x, item_y = item.get_pos()
+      if (item_x, item_y) != (rel_x, rel_y):
+        item.move(rel_x - item_x, rel_y - item_y)
 
     # Add to the list of display objects.
-    self.__display_objs.append(item)
+    self.__text_items.append((params, item))
+
+  def draw_rect(self, pos, size, color=None):
+    """ Shapes are only supported by the framebuffer backend. """
+    raise NotImplementedError( \
+        "Shapes can only be drawn with the framebuffer display backend.")
+
+  def draw_oval(self, pos, size, color=None):
+    """ Shapes are only supported by the framebuffer backend. """
+    raise NotImplementedError( \
+        "Shapes can only be drawn with the framebuffer display backend.")
+
+  def clear(self):
+    """ Clears all objects from the display. Items get reused if the same
+    things are drawn again, and anything that is not reused gets removed once
+    the canvas is idle. """
+    # Anything still stale from the previous frame is definitely not needed.
+    self.__flush_stale_items()
+
+    for params, item in self.__text_items:
+      self.__stale_items.setdefault(params, []).append(item)
+    self.__text_items = []
+
+    if (self.__stale_items and not self.__flush_scheduled):
+      self.__flush_scheduled = True
+      self._canvas.call_when_idle(self.__flush_stale_items)
+
+
+class FramebufferDisplay(obj_canvas.Shape):
+  """ Simulates the display hardware for the cube by rasterizing everything
+  into a framebuffer at the resolution of the real screen, like the cube
+  graphics library does. The framebuffer gets copied to the canvas as a single
+  image, at most once per frame, so the cost of drawing doesn't depend on how
+  many things are on the screen. """
+
+  # Color that text and shapes get drawn in by default.
+  _FOREGROUND = "#000000"
+
+  __slots__ = ("__size", "__framebuffer", "__image", "__draw_calls",
+               "__blit_scheduled")
+
+  def __init__(self, canvas, pos, size, hidden=False):
+    """
+    Args:
+      canvas: The canvas to draw on.
+      pos: The initial position of the display.
+      size: The size of the display, in px.
+      hidden: If true, the display isn't drawn until show() is called. """
+    self.__size = size
+    self.__framebuffer = framebuffer.Framebuffer(size,
+                                                 config.get('COLORS', 'SCREEN'))
+
+    # The image that shows the framebuffer on the canvas.
+    self.__image = obj_canvas.Image(canvas, pos, size, hidden=True)
+    # Everything drawn since the last clear(), as a list of tuples of the
+    # framebuffer method and its arguments. This is used to redraw the screen
+    # if the background changes.
+    self.__draw_calls = []
+    # Whether we have already scheduled copying the framebuffer to the canvas.
+    self.__blit_scheduled = False
+
+    # Draw on the canvas.
+    super(FramebufferDisplay, self).__init__(
+        canvas, pos, fill=config.get('COLORS', 'SCREEN'),
+        outline=config.get('COLORS', 'SCREEN'), hidden=hidden)
+
+  def _draw_object(self):
+    self.__image.show()
+    self._reference = self.__image._reference
+
+    # The image starts out blank, so all of it has to be copied.
+    self.__framebuffer.mark_dirty(0, 0, *self.__size)
+    self.__blit()
+
+  def _erase_object(self):
+    # The framebuffer is kept up to date, and copied again when it is shown.
+    self.__image.hide()
+    self._reference = None
+
+  def __blit(self):
+    """ Copies the framebuffer to the canvas if anything changed. """
+    self.__blit_scheduled = False
+
+    dirty = self.__framebuffer.pop_dirty()
+    if dirty is None:
+      # Nothing to do.
+      return
+
+    if dirty == (0, 0) + self.__size:
+      self.__image.set_ppm(self.__framebuffer.to_ppm())
+    else:
+      # Only copy the part that changed.
+      self.__image.set_ppm(self.__framebuffer.to_ppm(dirty), dirty[:2])
+
+  def __schedule_blit(self):
+    """ Makes sure that the framebuffer gets copied to the canvas once the
+    current frame is done. """
+    if (self._reference is None or self.__blit_scheduled):
+      return
+
+    self.__blit_scheduled = True
+    self._canvas.call_when_idle(self.__blit)
+
+  def __draw(self, method, *args):
+    """ Draws something in the framebuffer.
+    Args:
+      method: The framebuffer method to draw with.
+      All other arguments are passed to the method. """
+    method(*args)
+    self.__draw_calls.append((method, args))
+
+    self.__schedule_blit()
+
+  def __to_screen(self, pos):
+    """ Converts a position relative to the screen center to framebuffer
+    coordinates.
+    Args:
+      pos: The position relative to the screen center.
+    Returns:
+      The position in the framebuffer. """
+    width, height = self.__size
+    return (width // 2 + pos[0], height // 2 + pos[1])
+
+  def update_region(self, x, y, width, height, pixels):
+    """ Replaces part of the screen with raw pixels, such as the ones from a
+    DisplayUpdate message. Only that part gets copied to the canvas.
+    Args:
+      x: The left edge of the region.
+      y: The top edge of the region.
+      width: The width of the region.
+      height: The height of the region.
+      pixels: The new pixels, in row-major RGB order. """
+    self.__framebuffer.paste(x, y, width, height, pixels)
+    self.__schedule_blit()
+
+  def mirror(self, reader, interval=16):
+    """ Keeps the display showing the contents of an external framebuffer, such
+    as the one for a cube VM. Only the regions that change get copied.
+    Anything drawn on the display directly will get overwritten.
+    Args:
+      reader: The ShmFramebufferReader to read the framebuffer from. It must
+              be the same size as the display.
+      interval: How often to check for changes, in ms. """
+    if (self._reference is None and not self._hidden):
+      # The display was deleted.
+      return
+
+    update = reader.read_update()
+    if update is not None:
+      self.update_region(*update)
+
+    self._canvas.call_later(interval, lambda: self.mirror(reader, interval))
+
+  def get_framebuffer(self):
+    """
+    Returns:
+      The Framebuffer holding the screen contents. """
+    return self.__framebuffer
+
+  def get_bbox(self):
+    return self.__image.get_bbox()
+
+  def set_fill(self, fill):
+    if fill == self._fill:
+      # It's already that color.
+      return
+    self._fill = fill
+
+    # Everything has to be drawn again on top of the new background.
+    self.__framebuffer.fill(fill)
+    for method, args in self.__draw_calls:
+      method(*args)
+
+    self.__schedule_blit()
+
+  def move(self, x_shift, y_shift):
+    self._pos_x += x_shift
+    self._pos_y += y_shift
+
+    self.__image.move(x_shift, y_shift)
+
+  def delete(self):
+    self.__image.delete()
+
+    self.__draw_calls = []
+    self._reference = None
+    self._hidden = False
+
+  def draw_text(self, text, pos, size):
+    """ Draws text on the display.
+    Args:
+      text: The text to draw.
+      pos: The position on the display to draw at.
+      size: The size of the text. """
+    self.__draw(self.__framebuffer.draw_text, text, self.__to_screen(pos),
+                size, self._FOREGROUND)
+
+  def draw_rect(self, pos, size, color=_FOREGROUND):
+    """ Draws a filled rectangle on the display.
+    Args:
+      pos: The position on the display of the center of the rectangle.
+      size: The width and height of the rectangle.
+      color: The color of the rectangle. """
+    self.__draw(self.__framebuffer.draw_rect, self.__to_screen(pos), size,
+                color)
+
+  def draw_oval(self, pos, size, color=_FOREGROUND):
+    """ Draws a filled oval on the display.
+    Args:
+      pos: The position on the display of the center of the oval.
+      size: The width and height of the oval.
+      color: The color of the oval. """
+    self.__draw(self.__framebuffer.draw_oval, self.__to_screen(pos), size,
+                color)
 
   def clear(self):
     """ Clears all objects from the display. """
-    for item in self.__display_objs:
-      if item == self.__background:
-        # Don't delete the background.
-        continue
+    if not self.__draw_calls:
+      # It's already clear.
+      return
 
-      item.delete()
+    self.__framebuffer.fill(self._fill)
+    self.__draw_calls = []
+
+    self.__schedule_blit()
+
+
+def make_display(canvas, pos, hidden=False):
+  """ Creates a display using the backend selected in the configuration.
+  Args:
+    canvas: The canvas to draw on.
+    pos: The initial position of the display.
+    hidden: If true, the display isn't drawn until show() is called.
+  Returns:
+    The display object. """
+  size = (int(config.get('CUBE', 'SCREEN_WIDTH')),
+          int(config.get('CUBE', 'SCREEN_HEIGHT')))
+
+  backend = config.get('CUBE', 'DISPLAY_BACKEND')
+  if backend == "framebuffer":
+    return FramebufferDisplay(canvas, pos, size, hidden=hidden)
+  elif backend == "vector":
+    return Display(canvas, pos, size, hidden=hidden)
 
-    self.__display_objs = [self.__background]
+  raise ValueError("Unknown display backend '%s'." % (backend))
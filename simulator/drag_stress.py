@@ -0,0 +1,159 @@
+#!/usr/bin/python
+
+import argparse
+import logging
+import random
+import sys
+import time
+
+import config
+import cube
+import event
+import tabletop
+
+
+""" Stress tests dragging cubes around with synthetic mouse events. Everything
+runs headless, so no display is needed. Every drag is made up of a lot of
+motion events, which are posted to the canvas and handled from its event loop,
+just like the ones from the user. Afterwards, the tabletop is checked to make
+sure that every cube ended up in a grid spot, and that the connections match
+the grid. """
+
+
+# Seed for choosing drags, so they are the same on every run.
+_SEED = 42
+
+
+def _get_spot_pos(x, y):
+  """ Gets the pixel position of the center of a grid spot.
+  Args:
+    x: The x index of the spot.
+    y: The y index of the spot.
+  Returns:
+    The position, as (x, y). """
+  size = int(config.get('CUBE', 'CUBE_SIZE'))
+  offset = int(config.get('CUBE', 'GRID_OFFSET'))
+  return (x * size + offset, y * size + offset)
+
+def _check_tabletop(table):
+  """ Checks that the cubes are all in their grid spots, and connected to the
+  cubes next to them.
+  Args:
+    table: The tabletop to check.
+  Returns:
+    A list of descriptions of the problems that were found. """
+  grid = table.get_cubes()
+  grid_width = len(grid[0])
+  grid_height = len(grid)
+
+  problems = []
+  for y, row in enumerate(grid):
+    for x, checked in enumerate(row):
+      if checked is None:
+        continue
+
+      if checked.get_pos() != _get_spot_pos(x, y):
+        problems.append("Cube %d in spot (%d, %d) is at %s." % \
+                        (checked.get_id(), x, y, checked.get_pos()))
+
+      connections = checked.get_connections()
+      for side in cube.Cube.Sides.all():
+        shift_x, shift_y = cube.Cube.Sides.coordinates(side)
+        other_x = x + shift_x
+        other_y = y + shift_y
+        expected = None
+        if (0 <= other_x < grid_width and 0 <= other_y < grid_height):
+          expected = grid[other_y][other_x]
+
+        if connections[side] is not expected:
+          problems.append("Cube %d in spot (%d, %d) has the wrong %s" \
+                          " connection." % (checked.get_id(), x, y, side))
+
+  return problems
+
+def run_stress(num_cubes, num_events, steps, grid_size):
+  """ Drags cubes around until enough motion events have been sent.
+  Args:
+    num_cubes: The number of cubes to put on the tabletop.
+    num_events: The number of motion events to send.
+    steps: The number of motion events in every drag.
+    grid_size: The width and height of the grid, in cubes.
+  Returns:
+    The results, and a list of problems with the tabletop afterwards. """
+  rand = random.Random(_SEED)
+  grid_width, grid_height = grid_size
+  spots = [(x, y) for y in range(grid_height) for x in range(grid_width)]
+  if num_cubes > len(spots):
+    raise ValueError("%d cubes don't fit on a %dx%d grid." % \
+                     (num_cubes, grid_width, grid_height))
+
+  table = tabletop.Tabletop(headless=True, grid_size=grid_size)
+  cubes = table.place_many(rand.sample(spots, num_cubes))
+  canvas = table.get_canvas()
+
+  events = 0
+  drags = 0
+  # Time of the next event, in ms. Motion events come about every frame.
+  event_time = 0
+  start_time = time.time()
+  while events < num_events:
+    moved = rand.choice(cubes)
+    start_x, start_y = canvas.to_window(moved.get_pos())
+    end_x, end_y = canvas.to_window(_get_spot_pos(*rand.choice(spots)))
+
+    canvas.post_event(event.MousePressEvent, (start_x, start_y), event_time)
+    for step in range(1, steps + 1):
+      event_time += 16
+      fraction = float(step) / steps
+      pos = (start_x + (end_x - start_x) * fraction,
+             start_y + (end_y - start_y) * fraction)
+      canvas.post_event(event.MouseDragEvent, pos, event_time)
+    canvas.post_event(event.MouseReleaseEvent, (end_x, end_y), event_time)
+
+    # The posted events get handled as part of the event loop.
+    canvas.update()
+    events += steps
+    drags += 1
+  elapsed = time.time() - start_time
+
+  results = {"cubes": num_cubes,
+             "drags": drags,
+             "events": events,
+             "time": elapsed,
+             "events_per_s": events / elapsed if elapsed else None}
+  return results, _check_tabletop(table)
+
+
+def main():
+  parser = argparse.ArgumentParser(
+      description="Stress tests dragging cubes with synthetic mouse events.")
+  parser.add_argument("-n", "--cubes", type=int, default=100,
+                      help="Number of cubes to put on the tabletop.")
+  parser.add_argument("-e", "--events", type=int, default=1000000,
+                      help="Number of motion events to send.")
+  parser.add_argument("-s", "--steps", type=int, default=100,
+                      help="Number of motion events in every drag.")
+  parser.add_argument("-g", "--grid-size", type=int, nargs=2,
+                      default=(20, 20), help="Width and height of the grid.")
+  args = parser.parse_args()
+
+  # Logging every move would dominate the results.
+  logging.disable(logging.INFO)
+
+  results, problems = run_stress(args.cubes, args.events, args.steps,
+                                 tuple(args.grid_size))
+  print "%d drags, %d motion events in %.1f s, %.1f events/s" % \
+        (results["drags"], results["events"], results["time"],
+         results["events_per_s"] or 0)
+
+  for problem in problems:
+    print problem
+  if problems:
+    print "%d problems found." % (len(problems))
+    return 1
+
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -1,12 +1,47 @@
+import time
+
+
+class SyntheticEvent(object):
+  """ Stands in for a Tkinter event, so that events can be made without Tk, for
+  instance by tests and load generators. It has everything that our event
+  classes use from Tkinter events. """
+
+  __slots__ = ("x", "y", "time")
+
+  def __init__(self, x=0, y=0, event_time=None):
+    """
+    Args:
+      x: The x position of the mouse.
+      y: The y position of the mouse.
+      event_time: When the event happened, in ms. Defaults to now. """
+    self.x = x
+    self.y = y
+    if event_time is None:
+      event_time = int(time.time() * 1000)
+    self.time = event_time
+
+
 class Event(object):
   """ Represents a GUI event. """
 
+  __slots__ = ("_tk_event",)
+
   def __init__(self, tk_event):
     """
     Args:
-      tk_event: The underlying Tkinter event to wrap. """
+      tk_event: The underlying Tkinter event to wrap, or a SyntheticEvent. """
     self._tk_event = tk_event
 
+  @classmethod
+  def synthesize(cls, pos=(0, 0), event_time=None):
+    """ Makes an event without Tk.
+    Args:
+      pos: The position of the mouse.
+      event_time: When the event happened, in ms. Defaults to now.
+    Returns:
+      The new event. """
+    return cls(SyntheticEvent(pos[0], pos[1], event_time))
+
   @classmethod
   def get_identifier(cls):
     """
@@ -14,9 +49,19 @@ class Event(object):
       The Tkinter identifier for this event. """
     raise NotImplementedError("Must be implemented by subclass.")
 
+  def get_time(self):
+    """
+    Returns:
+      When the event happened, in ms. Tk and synthetic events count from
+      different starting points, so only compare times from the same source.
+    """
+    return self._tk_event.time
+
 class MouseEvent(Event):
   """ Event involving the mouse. """
 
+  __slots__ = ()
+
   def get_pos(self):
     """
     Returns:
@@ -27,6 +72,8 @@ class MouseDragEvent(MouseEvent):
   """ Emitted every time the mouse is dragged with the primary button held down.
   """
 
+  __slots__ = ()
+
   @classmethod
   def get_identifier(cls):
     return "<B1-Motion>"
@@ -34,6 +81,8 @@ class MouseDragEvent(MouseEvent):
 class MousePressEvent(MouseEvent):
   """ Emitted every time the primary mouse button is pressed. """
 
+  __slots__ = ()
+
   @classmethod
   def get_identifier(cls):
     return "<Button-1>"
@@ -41,6 +90,45 @@ class MousePressEvent(MouseEvent):
 class MouseReleaseEvent(MouseEvent):
   """ Emitted every time the primary mouse button is released. """
 
+  __slots__ = ()
+
   @classmethod
   def get_identifier(cls):
     return "<ButtonRelease-1>"
+
+class MouseMiddlePressEvent(MouseEvent):
+  """ Emitted every time the middle mouse button is pressed. """
+
+  __slots__ = ()
+
+  @classmethod
+  def get_identifier(cls):
+    return "<Button-2>"
+
+class MouseMiddleDragEvent(MouseEvent):
+  """ Emitted every time the mouse is dragged with the middle button held down.
+  """
+
+  __slots__ = ()
+
+  @classmethod
+  def get_identifier(cls):
+    return "<B2-Motion>"
+
+class ScrollUpEvent(MouseEvent):
+  """ Emitted every time the mouse wheel is scrolled up. """
+
+  __slots__ = ()
+
+  @classmethod
+  def get_identifier(cls):
+    return "<Button-4>"
+
+class ScrollDownEvent(MouseEvent):
+  """ Emitted every time the mouse wheel is scrolled down. """
+
+  __slots__ = ()
+
+  @classmethod
+  def get_identifier(cls):
+    return "<Button-5>"
@@ -0,0 +1,125 @@
+import collections
+
+import tkFont
+
+
+""" Shared fonts and a cache of text measurements, so that we don't have to
+create a new font or ask Tk to measure a string every time we draw it. """
+
+
+class LruCache(object):
+  """ Simple cache that discards the least recently used entries once it is
+  full. """
+
+  def __init__(self, max_size):
+    """
+    Args:
+      max_size: The maximum number of entries to keep. """
+    self.__max_size = max_size
+    self.__entries = collections.OrderedDict()
+
+    # Statistics on how well the cache is working.
+    self.__hits = 0
+    self.__misses = 0
+
+  def get(self, key, compute):
+    """ Gets an entry from the cache, computing it if it's not there.
+    Args:
+      key: The key of the entry.
+      compute: Function that takes the key and computes the value for it.
+    Returns:
+      The value for the key. """
+    value = self.__entries.pop(key, None)
+    if value is None:
+      self.__misses += 1
+      value = compute(key)
+      if len(self.__entries) >= self.__max_size:
+        # Throw away the oldest entry.
+        self.__entries.popitem(last=False)
+    else:
+      self.__hits += 1
+
+    # Mark it as most recently used.
+    self.__entries[key] = value
+    return value
+
+  def clear(self):
+    """ Removes everything from the cache. """
+    self.__entries.clear()
+
+  def get_stats(self):
+    """
+    Returns:
+      The number of cache hits and misses so far. """
+    return (self.__hits, self.__misses)
+
+
+# Font objects, keyed by family and size.
+_fonts = {}
+# Text measurements, keyed by text, family and size.
+_measurements = LruCache(4096)
+# Whether to estimate text sizes instead of asking Tk.
+_estimate = False
+
+def use_estimates():
+  """ Makes text measurements work without Tk, by estimating them from the
+  font size. This is for when there is no display. Fonts are then described by
+  (family, size) tuples instead of font objects. """
+  global _estimate
+  _estimate = True
+  _measurements.clear()
+
+def get_font(family, size):
+  """ Gets a shared font object.
+  Args:
+    family: The font family.
+    size: The font size.
+  Returns:
+    The tkFont.Font object. """
+  key = (family, size)
+  if _estimate:
+    return key
+
+  font = _fonts.get(key)
+  if font is None:
+    font = tkFont.Font(family=family, size=size)
+    _fonts[key] = font
+
+  return font
+
+def _measure(key):
+  """ Actually measures some text, using Tk unless we are estimating.
+  Args:
+    key: Tuple of the text, font family and font size.
+  Returns:
+    The width and height of the text. """
+  text, family, size = key
+  lines = text.split("\n")
+  if _estimate:
+    # Most characters are a bit over half as wide as the font size, and lines
+    # are spaced a bit further apart than that.
+    size = abs(size)
+    width = max([len(line) for line in lines]) * size * 3 / 5
+    return (width, size * 4 / 3 * len(lines))
+
+  font = get_font(family, size)
+  width = max([font.measure(line) for line in lines])
+  height = font.metrics("linespace") * len(lines)
+
+  return (width, height)
+
+def measure_text(text, family, size):
+  """ Measures how much space some text takes up when it is drawn.
+  Args:
+    text: The text to measure.
+    family: The font family.
+    size: The font size.
+  Returns:
+    The width and height of the text, in pixels. """
+  return _measurements.get((text, family, size), _measure)
+
+def get_cache_stats():
+  """
+  Returns:
+    The number of text measurement cache hits and misses so far. """
+  return _measurements.get_stats()
@@ -0,0 +1,307 @@
+try:
+  import numpy as np
+except ImportError:
+  # The framebuffer backend is optional.
+  np = None
+
+
+""" A pixel framebuffer that rasterizes the same primitives that the real cube
+graphics library supports. """
+
+
+# Simple 5x7 bitmap font. Each glyph is a list of rows, with the leftmost pixel
+# in the most significant of the five bits. Lowercase letters are drawn using
+# the uppercase glyphs.
+_GLYPH_WIDTH = 5
+_GLYPH_HEIGHT = 7
+_GLYPHS = {
+  "A": [0x0E, 0x11, 0x11, 0x1F, 0x11, 0x11, 0x11],
+  "B": [0x1E, 0x11, 0x11, 0x1E, 0x11, 0x11, 0x1E],
+  "C": [0x0E, 0x11, 0x10, 0x10, 0x10, 0x11, 0x0E],
+  "D": [0x1E, 0x11, 0x11, 0x11, 0x11, 0x11, 0x1E],
+  "E": [0x1F, 0x10, 0x10, 0x1E, 0x10, 0x10, 0x1F],
+  "F": [0x1F, 0x10, 0x10, 0x1E, 0x10, 0x10, 0x10],
+  "G": [0x0E, 0x11, 0x10, 0x17, 0x11, 0x11, 0x0F],
+  "H": [0x11, 0x11, 0x11, 0x1F, 0x11, 0x11, 0x11],
+  "I": [0x0E, 0x04, 0x04, 0x04, 0x04, 0x04, 0x0E],
+  "J": [0x07, 0x02, 0x02, 0x02, 0x02, 0x12, 0x0C],
+  "K": [0x11, 0x12, 0x14, 0x18, 0x14, 0x12, 0x11],
+  "L": [0x10, 0x10, 0x10, 0x10, 0x10, 0x10, 0x1F],
+  "M": [0x11, 0x1B, 0x15, 0x15, 0x11, 0x11, 0x11],
+  "N": [0x11, 0x11, 0x19, 0x15, 0x13, 0x11, 0x11],
+  "O": [0x0E, 0x11, 0x11, 0x11, 0x11, 0x11, 0x0E],
+  "P": [0x1E, 0x11, 0x11, 0x1E, 0x10, 0x10, 0x10],
+  "Q": [0x0E, 0x11, 0x11, 0x11, 0x15, 0x12, 0x0D],
+  "R": [0x1E, 0x11, 0x11, 0x1E, 0x14, 0x12, 0x11],
+  "S": [0x0F, 0x10, 0x10, 0x0E, 0x01, 0x01, 0x1E],
+  "T": [0x1F, 0x04, 0x04, 0x04, 0x04, 0x04, 0x04],
+  "U": [0x11, 0x11, 0x11, 0x11, 0x11, 0x11, 0x0E],
+  "V": [0x11, 0x11, 0x11, 0x11, 0x11, 0x0A, 0x04],
+  "W": [0x11, 0x11, 0x11, 0x15, 0x15, 0x15, 0x0A],
+  "X": [0x11, 0x11, 0x0A, 0x04, 0x0A, 0x11, 0x11],
+  "Y": [0x11, 0x11, 0x11, 0x0A, 0x04, 0x04, 0x04],
+  "Z": [0x1F, 0x01, 0x02, 0x04, 0x08, 0x10, 0x1F],
+  "0": [0x0E, 0x11, 0x13, 0x15, 0x19, 0x11, 0x0E],
+  "1": [0x04, 0x0C, 0x04, 0x04, 0x04, 0x04, 0x0E],
+  "2": [0x0E, 0x11, 0x01, 0x02, 0x04, 0x08, 0x1F],
+  "3": [0x1F, 0x02, 0x04, 0x02, 0x01, 0x11, 0x0E],
+  "4": [0x02, 0x06, 0x0A, 0x12, 0x1F, 0x02, 0x02],
+  "5": [0x1F, 0x10, 0x1E, 0x01, 0x01, 0x11, 0x0E],
+  "6": [0x06, 0x08, 0x10, 0x1E, 0x11, 0x11, 0x0E],
+  "7": [0x1F, 0x01, 0x02, 0x04, 0x08, 0x08, 0x08],
+  "8": [0x0E, 0x11, 0x11, 0x0E, 0x11, 0x11, 0x0E],
+  "9": [0x0E, 0x11, 0x11, 0x0F, 0x01, 0x02, 0x0C],
+  " ": [0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00],
+  "!": [0x04, 0x04, 0x04, 0x04, 0x04, 0x00, 0x04],
+  "?": [0x0E, 0x11, 0x01, 0x02, 0x04, 0x00, 0x04],
+  ".": [0x00, 0x00, 0x00, 0x00, 0x00, 0x0C, 0x0C],
+  ",": [0x00, 0x00, 0x00, 0x00, 0x0C, 0x04, 0x08],
+  "-": [0x00, 0x00, 0x00, 0x1F, 0x00, 0x00, 0x00],
+  ":": [0x00, 0x0C, 0x0C, 0x00, 0x0C, 0x0C, 0x00],
+  "'": [0x04, 0x04, 0x08, 0x00, 0x00, 0x00, 0x00],
+}
+# Glyph to use for characters that we don't have.
+_UNKNOWN_GLYPH = "?"
+
+# Rendered glyph masks, keyed by character and scale.
+_glyph_masks = {}
+
+
+def parse_color(color):
+  """ Converts a Tk-style color string to RGB values.
+  Args:
+    color: The color, in "#RRGGBB" form.
+  Returns:
+    A tuple of the red, green and blue values. """
+  if (len(color) != 7 or color[0] != "#"):
+    raise ValueError("Expected color of the form #RRGGBB, got '%s'." % (color))
+
+  return (int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16))
+
+def _get_glyph_mask(char, scale):
+  """ Gets the pixel mask for a character.
+  Args:
+    char: The character.
+    scale: How many pixels each font pixel takes up in each direction.
+  Returns:
+    A boolean array that is True where the character should be drawn. """
+  key = (char, scale)
+  mask = _glyph_masks.get(key)
+  if mask is not None:
+    return mask
+
+  rows = _GLYPHS.get(char.upper(), _GLYPHS[_UNKNOWN_GLYPH])
+  bits = [[bool(row & (1 << (_GLYPH_WIDTH - 1 - col))) \
+           for col in range(_GLYPH_WIDTH)] for row in rows]
+  mask = np.kron(np.array(bits, dtype=np.uint8),
+                 np.ones((scale, scale), dtype=np.uint8)).astype(bool)
+
+  _glyph_masks[key] = mask
+  return mask
+
+
+class Framebuffer(object):
+  """ An RGB framebuffer, stored as a NumPy array. It keeps track of the region
+  that changed since it was last checked, so that only that part needs to be
+  copied anywhere. """
+
+  def __init__(self, size, background):
+    """
+    Args:
+      size: The width and height of the framebuffer, in pixels.
+      background: The initial background color. """
+    if np is None:
+      raise RuntimeError("The framebuffer requires NumPy.")
+
+    self.__width, self.__height = size
+    self.__pixels = np.zeros((self.__height, self.__width, 3), dtype=np.uint8)
+
+    # The region that changed, as (x1, y1, x2, y2), with the second corner
+    # exclusive. None if nothing changed.
+    self.__dirty = None
+
+    self.fill(background)
+
+  def __mark_dirty(self, x1, y1, x2, y2):
+    """ Adds a region to the dirty region.
+    Args:
+      x1: The left edge of the region.
+      y1: The top edge of the region.
+      x2: The right edge of the region, exclusive.
+      y2: The bottom edge of the region, exclusive. """
+    if self.__dirty is None:
+      self.__dirty = (x1, y1, x2, y2)
+      return
+
+    old_x1, old_y1, old_x2, old_y2 = self.__dirty
+    self.__dirty = (min(x1, old_x1), min(y1, old_y1),
+                    max(x2, old_x2), max(y2, old_y2))
+
+  def __clip(self, x1, y1, x2, y2):
+    """ Clips a region to the framebuffer.
+    Args:
+      x1: The left edge of the region.
+      y1: The top edge of the region.
+      x2: The right edge of the region, exclusive.
+      y2: The bottom edge of the region, exclusive.
+    Returns:
+      The clipped region, or None if it is entirely outside. """
+    x1 = max(x1, 0)
+    y1 = max(y1, 0)
+    x2 = min(x2, self.__width)
+    y2 = min(y2, self.__height)
+    if (x1 >= x2 or y1 >= y2):
+      return None
+
+    return (x1, y1, x2, y2)
+
+  def __paint_mask(self, x1, y1, mask, color):
+    """ Paints a color wherever a mask is set.
+    Args:
+      x1: The x position of the mask's left edge.
+      y1: The y position of the mask's top edge.
+      mask: The boolean mask to paint.
+      color: The color to paint, as an RGB tuple. """
+    mask_height, mask_width = mask.shape
+    region = self.__clip(x1, y1, x1 + mask_width, y1 + mask_height)
+    if region is None:
+      return
+
+    clip_x1, clip_y1, clip_x2, clip_y2 = region
+    mask = mask[clip_y1 - y1:clip_y2 - y1, clip_x1 - x1:clip_x2 - x1]
+    self.__pixels[clip_y1:clip_y2, clip_x1:clip_x2][mask] = color
+    self.__mark_dirty(*region)
+
+  def get_size(self):
+    """
+    Returns:
+      The width and height of the framebuffer. """
+    return (self.__width, self.__height)
+
+  def get_pixels(self):
+    """
+    Returns:
+      The underlying pixel array, with shape (height, width, 3). """
+    return self.__pixels
+
+  def pop_dirty(self):
+    """ Gets the region that changed since the last call, and resets it.
+    Returns:
+      The region as (x1, y1, x2, y2), with the second corner exclusive, or None
+      if nothing changed. """
+    dirty = self.__dirty
+    self.__dirty = None
+    return dirty
+
+  def mark_dirty(self, x1, y1, x2, y2):
+    """ Marks a region as changed after the pixels were modified directly.
+    Args:
+      x1: The left edge of the region.
+      y1: The top edge of the region.
+      x2: The right edge of the region, exclusive.
+      y2: The bottom edge of the region, exclusive. """
+    region = self.__clip(x1, y1, x2, y2)
+    if region is not None:
+      self.__mark_dirty(*region)
+
+  def paste(self, x, y, width, height, pixels):
+    """ Replaces a region with raw pixel data.
+    Args:
+      x: The left edge of the region.
+      y: The top edge of the region.
+      width: The width of the region.
+      height: The height of the region.
+      pixels: The pixels for the region, in row-major RGB order. """
+    if (x < 0 or y < 0 or x + width > self.__width or \
+        y + height > self.__height):
+      raise ValueError("Region does not fit in the framebuffer.")
+
+    region = np.frombuffer(pixels, dtype=np.uint8)
+    self.__pixels[y:y + height, x:x + width] = region.reshape((height, width,
+                                                              3))
+    self.__mark_dirty(x, y, x + width, y + height)
+
+  def fill(self, color):
+    """ Fills the whole framebuffer with a color.
+    Args:
+      color: The color, in "#RRGGBB" form. """
+    self.__pixels[:, :] = parse_color(color)
+    self.__mark_dirty(0, 0, self.__width, self.__height)
+
+  def draw_rect(self, center, size, color):
+    """ Draws a filled rectangle.
+    Args:
+      center: The center of the rectangle.
+      size: The width and height of the rectangle.
+      color: The color, in "#RRGGBB" form. """
+    center_x, center_y = center
+    width, height = size
+    x1 = center_x - width // 2
+    y1 = center_y - height // 2
+
+    region = self.__clip(x1, y1, x1 + width, y1 + height)
+    if region is None:
+      return
+
+    x1, y1, x2, y2 = region
+    self.__pixels[y1:y2, x1:x2] = parse_color(color)
+    self.__mark_dirty(*region)
+
+  def draw_oval(self, center, size, color):
+    """ Draws a filled oval.
+    Args:
+      center: The center of the oval.
+      size: The width and height of the oval.
+      color: The color, in "#RRGGBB" form. """
+    center_x, center_y = center
+    width, height = size
+    x1 = center_x - width // 2
+    y1 = center_y - height // 2
+
+    # Sample at pixel centers.
+    rows, cols = np.ogrid[0:height, 0:width]
+    norm_y = (rows + 0.5 - height / 2.0) / (height / 2.0)
+    norm_x = (cols + 0.5 - width / 2.0) / (width / 2.0)
+    mask = norm_x ** 2 + norm_y ** 2 <= 1.0
+
+    self.__paint_mask(x1, y1, mask, parse_color(color))
+
+  def draw_text(self, text, center, size, color):
+    """ Draws a single line of text.
+    Args:
+      text: The text to draw.
+      center: The center of the text.
+      size: The height of the text, in px.
+      color: The color, in "#RRGGBB" form. """
+    if not text:
+      return
+
+    # Each font pixel gets scaled up to a square block of pixels. There is one
+    # font pixel of space between characters.
+    scale = max(1, int(round(float(size) / _GLYPH_HEIGHT)))
+    advance = (_GLYPH_WIDTH + 1) * scale
+    text_width = advance * len(text) - scale
+    text_height = _GLYPH_HEIGHT * scale
+
+    center_x, center_y = center
+    x = center_x - text_width // 2
+    y = center_y - text_height // 2
+
+    rgb = parse_color(color)
+    for char in text:
+      self.__paint_mask(x, y, _get_glyph_mask(char, scale), rgb)
+      x += advance
+
+  def to_ppm(self, region=None):
+    """ Converts the framebuffer to a binary PPM image.
+    Args:
+      region: If specified, only this region is converted, as
+              (x1, y1, x2, y2), with the second corner exclusive.
+    Returns:
+      The image data. """
+    if region is None:
+      region = (0, 0, self.__width, self.__height)
+    x1, y1, x2, y2 = region
+
+    header = "P6 %d %d 255\n" % (x2 - x1, y2 - y1)
+    return header + self.__pixels[y1:y2, x1:x2].tobytes()
@@ -1,15 +1,28 @@
+import base64
+import collections
+import heapq
+import time
 import Tkinter as tk
 
+from virtual_cube import metrics
+
 import event
+import fonts
 
 
 class GuiObject(object):
   """ A high-level class that spans all objects used in the GUI. """
 
+  # There can be a lot of objects on the canvas, so everything that gets drawn
+  # declares its attributes in __slots__, instead of having a __dict__.
+  __slots__ = ()
+
   class Callback(object):
     """ A special class that wraps a callback. Whenever it is called, it will
     wrap the Tkinter event in an Event object and pass it on. """
 
+    __slots__ = ("__event_type", "__callback")
+
     def __init__(self, event_type, callback):
       """
       Args:
@@ -50,20 +63,151 @@ class GuiObject(object):
     self._do_event_bind(tk_name, wrapped)
 
 
+class _HeadlessWindow(object):
+  """ Stands in for the Tk window when there is no display. It runs the event
+  loop callbacks, but the only input events are the ones that are injected
+  into the Canvas. """
+
+  # Screen size to report, since there is no actual screen.
+  _SCREEN_SIZE = (1920, 1080)
+
+  def __init__(self):
+    # Callbacks waiting to be run, as tuples of the time to run them at, a
+    # sequence number to keep them in order, and the callback.
+    self.__pending = []
+    self.__sequence = 0
+    self.__running = False
+
+  def winfo_screenwidth(self):
+    return self._SCREEN_SIZE[0]
+
+  def winfo_screenheight(self):
+    return self._SCREEN_SIZE[1]
+
+  def after(self, delay, callback):
+    self.__sequence += 1
+    heapq.heappush(self.__pending,
+                   (time.time() + delay / 1000.0, self.__sequence, callback))
+
+  def after_idle(self, callback):
+    self.after(0, callback)
+
+  def update(self):
+    """ Runs all the callbacks that are due. """
+    now = time.time()
+    while (self.__pending and self.__pending[0][0] <= now):
+      _, _, callback = heapq.heappop(self.__pending)
+      callback()
+
+  def mainloop(self):
+    """ Runs callbacks until there are none left, or quit() is called. """
+    self.__running = True
+    while (self.__running and self.__pending):
+      delay = self.__pending[0][0] - time.time()
+      if delay > 0:
+        time.sleep(delay)
+      self.update()
+
+  def quit(self):
+    self.__running = False
+
+
+class _HeadlessCanvas(object):
+  """ Stands in for the Tk canvas when there is no display. Items are only
+  assigned IDs, and never drawn. """
+
+  def __init__(self):
+    self.__next_id = 1
+
+  def __create(self, *args, **kwargs):
+    """ Creates a new item.
+    Returns:
+      The ID of the item. """
+    item_id = self.__next_id
+    self.__next_id += 1
+    return item_id
+
+  create_oval = __create
+  create_rectangle = __create
+  create_text = __create
+  create_line = __create
+  create_image = __create
+
+  def __ignore(self, *args, **kwargs):
+    """ Does nothing, for operations that only affect what is drawn. """
+    pass
+
+  move = __ignore
+  scale = __ignore
+  delete = __ignore
+  itemconfig = __ignore
+  configure = __ignore
+  config = __ignore
+  pack = __ignore
+  # Events can only come from Canvas.inject_event().
+  bind = __ignore
+
+
+class _ViewEvent(object):
+  """ Wraps a Tkinter event, with the position converted from window
+  coordinates to canvas coordinates. Everything else comes from the original
+  event. """
+
+  __slots__ = ("__tk_event", "x", "y")
+
+  def __init__(self, tk_event, pos):
+    """
+    Args:
+      tk_event: The Tkinter event.
+      pos: The position of the event, in canvas coordinates. """
+    self.__tk_event = tk_event
+    self.x, self.y = pos
+
+  def __getattr__(self, name):
+    return getattr(self.__tk_event, name)
+
+
 class Canvas(GuiObject):
-  """ Simple wrapper around Tkinter canvas. """
+  """ Simple wrapper around Tkinter canvas. Objects are positioned in canvas
+  coordinates. The window shows a view of part of the canvas, which can be
+  moved around and scaled. """
 
-  def __init__(self, window_width=None, window_height=None, background="white"):
+  def __init__(self, window_width=None, window_height=None, background="white",
+               headless=False):
     """
     Args:
       window_width: The width of the window.
-      window_height: The height of the window. """
+      window_height: The height of the window.
+      background: The background color.
+      headless: If true, nothing is actually drawn, and no display is needed.
+                The event loop still works, but there is no user input. """
     # A dictionary keyed by event types. For each event type, there is a list of
     # tuples containing children and their corresponding callbacks. This is used
     # to determine when we should dispatch an event to a child object.
     self.__child_dispatches = {}
-
-    self.__window = tk.Tk()
+    self.__headless = headless
+    # The handler for each bound event, keyed by the Tkinter event name. These
+    # are the same handlers that get bound to the Tkinter canvas, so events
+    # can be injected without going through Tk.
+    self.__handlers = {}
+    # Injected events waiting to be handled, as tuples of the event class and
+    # the SyntheticEvent.
+    self.__posted_events = collections.deque()
+    # Whether we have already scheduled handling the posted events.
+    self.__flush_scheduled = False
+
+    # The canvas coordinates of the top left corner of the window.
+    self.__view_x = 0.0
+    self.__view_y = 0.0
+    # How many window pixels there are for every canvas pixel.
+    self.__scale = 1.0
+
+    if headless:
+      self.__window = _HeadlessWindow()
+      # Tk can't measure text without a window.
+      fonts.use_estimates()
+    else:
+      self.__window = tk.Tk()
 
     self.__window_width = window_width
     self.__window_height = window_height
@@ -75,8 +219,11 @@ class Canvas(GuiObject):
       # Use the full screen height.
       self.__window_height = self.__window.winfo_screenheight()
 
-    self.__canvas = tk.Canvas(self.__window, width=self.__window_width,
-                              height=self.__window_height)
+    if headless:
+      self.__canvas = _HeadlessCanvas()
+    else:
+      self.__canvas = tk.Canvas(self.__window, width=self.__window_width,
+                                height=self.__window_height)
     self.__canvas.configure(background=self.__background)
     self.__canvas.pack()
 
@@ -100,8 +247,57 @@ class Canvas(GuiObject):
         break
 
   def _do_event_bind(self, event_name, callback):
-    # We can directly bind to the Tkinter canvas.
-    self.__canvas.bind(event_name, callback)
+    # We can directly bind to the Tkinter canvas, but the event has to be
+    # converted to canvas coordinates first.
+    def convert(tk_event):
+      pos = self.to_canvas((tk_event.x, tk_event.y))
+      return callback(_ViewEvent(tk_event, pos))
+
+    self.__handlers[event_name] = convert
+    self.__canvas.bind(event_name, convert)
+
+  def inject_event(self, event_type, pos, event_time=None):
+    """ Handles an event right away, exactly as if it came from the user. This
+    works without Tk, so it can be used to drive a headless canvas.
+    Args:
+      event_type: The event class.
+      pos: The position of the mouse, in window coordinates.
+      event_time: When the event happened, in ms. Defaults to now.
+    Returns:
+      True if anything handled the event. """
+    handler = self.__handlers.get(event_type.get_identifier())
+    if handler is None:
+      return False
+
+    handler(event.SyntheticEvent(pos[0], pos[1], event_time))
+    return True
+
+  def post_event(self, event_type, pos, event_time=None):
+    """ Queues an event to be handled from the event loop, like the ones that
+    come from the user. Events are handled in the order that they are posted.
+    Args:
+      event_type: The event class.
+      pos: The position of the mouse, in window coordinates.
+      event_time: When the event happened, in ms. Defaults to now. """
+    self.__posted_events.append(
+        (event_type, event.SyntheticEvent(pos[0], pos[1], event_time)))
+
+    if not self.__flush_scheduled:
+      self.__flush_scheduled = True
+      self.call_when_idle(self.flush_events)
+
+  def flush_events(self):
+    """ Handles all the events that have been posted. """
+    self.__flush_scheduled = False
+
+    # Handlers can post more events, which also get handled.
+    posted = self.__posted_events
+    handlers = self.__handlers
+    while posted:
+      event_type, synthetic = posted.popleft()
+      handler = handlers.get(event_type.get_identifier())
+      if handler is not None:
+        handler(synthetic)
 
   def bind_to_child(self, child, event_type, callback):
     """ Certain events can be bound to children of the canvas, specifically,
@@ -127,16 +323,43 @@ class Canvas(GuiObject):
 
   def update(self):
     """ Updates the canvas. """
+    registry = metrics.get_registry()
+    if registry is None:
+      self.__window.update()
+      return
+
+    start_time = time.time()
     self.__window.update()
+    registry.get_histogram("canvas.update_time") \
+        .observe(time.time() - start_time)
 
   def wait_for_events(self):
     """ Runs the event loop forever. """
     self.__window.mainloop()
 
-  def move_object(self, *args, **kwargs):
-    """ Shortcut for moving an object on the underlying canvas. The arguments
-    are passed transparently to canvas.move. """
-    self.__canvas.move(*args, **kwargs)
+  def call_later(self, delay, callback):
+    """ Runs a callback once from the event loop after a delay.
+    Args:
+      delay: The delay, in ms.
+      callback: The callback to run. It takes no arguments. """
+    self.__window.after(delay, callback)
+
+  def call_when_idle(self, callback):
+    """ Runs a callback once from the event loop, as soon as it has nothing else
+    to do.
+    Args:
+      callback: The callback to run. It takes no arguments. """
+    self.__window.after_idle(callback)
+
+  def move_object(self, reference, x_shift, y_shift):
+    """ Shortcut for moving an object on the underlying canvas.
+    Args:
+      reference: The reference of the object on the underlying canvas.
+      x_shift: How far to move it in the x direction, in canvas coordinates.
+      y_shift: How far to move it in the y direction, in canvas coordinates.
+    """
+    self.__canvas.move(reference, x_shift * self.__scale,
+                       y_shift * self.__scale)
 
   def delete_object(self, *args, **kwargs):
     """ Shortcut for deleting an object from the underlying canvas. The
@@ -151,6 +374,91 @@ class Canvas(GuiObject):
     """ Returns: The window width and height, as a tuple. """
     return (self.__window_width, self.__window_height)
 
+  def to_window(self, pos):
+    """ Converts canvas coordinates to window coordinates.
+    Args:
+      pos: The position in canvas coordinates.
+    Returns:
+      The position in window coordinates. """
+    x, y = pos
+    return ((x - self.__view_x) * self.__scale,
+            (y - self.__view_y) * self.__scale)
+
+  def to_canvas(self, pos):
+    """ Converts window coordinates to canvas coordinates.
+    Args:
+      pos: The position in window coordinates.
+    Returns:
+      The position in canvas coordinates. """
+    x, y = pos
+    return (x / self.__scale + self.__view_x, y / self.__scale + self.__view_y)
+
+  def get_view(self):
+    """
+    Returns:
+      The canvas coordinates of the top left corner of the window, and the
+      scale of the view. """
+    return ((self.__view_x, self.__view_y), self.__scale)
+
+  def get_scale(self):
+    """
+    Returns:
+      How many window pixels there are for every canvas pixel. """
+    return self.__scale
+
+  def get_visible_region(self):
+    """
+    Returns:
+      The part of the canvas that is shown in the window, as a bounding box in
+      canvas coordinates. """
+    right, bottom = self.to_canvas(self.get_window_size())
+    return (self.__view_x, self.__view_y, right, bottom)
+
+  def is_visible(self, bbox):
+    """ Checks whether any part of a bounding box is shown in the window.
+    Args:
+      bbox: The bounding box, in canvas coordinates.
+    Returns:
+      True if it is at least partly visible. """
+    left, top, right, bottom = self.get_visible_region()
+    p1_x, p1_y, p2_x, p2_y = bbox
+    return (p2_x >= left and p1_x <= right and p2_y >= top and p1_y <= bottom)
+
+  def set_view(self, pos, scale):
+    """ Changes which part of the canvas is shown in the window. Everything
+    that is drawn is moved and scaled to match, but text and images keep their
+    size until they are drawn again.
+    Args:
+      pos: The canvas coordinates of the new top left corner of the window.
+      scale: How many window pixels there should be for every canvas pixel. """
+    if scale <= 0:
+      raise ValueError("Scale must be positive.")
+
+    new_x, new_y = pos
+    factor = float(scale) / self.__scale
+    if factor != 1.0:
+      # Scaling around the window origin gives us what the old view would
+      # look like at the new scale.
+      self.__canvas.scale("all", 0, 0, factor, factor)
+    shift_x = (self.__view_x - new_x) * scale
+    shift_y = (self.__view_y - new_y) * scale
+    if (shift_x or shift_y):
+      self.__canvas.move("all", shift_x, shift_y)
+
+    self.__view_x = float(new_x)
+    self.__view_y = float(new_y)
+    self.__scale = float(scale)
+
+  def is_headless(self):
+    """
+    Returns:
+      True if nothing is actually being drawn. """
+    return self.__headless
+
+  def quit(self):
+    """ Makes wait_for_events() return. """
+    self.__window.quit()
+
   def set_background_color(self, color):
     """ Sets the background color of the canvas.
     Args:
@@ -160,11 +468,14 @@ class Canvas(GuiObject):
 class CanvasObject(GuiObject):
   """ Handles drawing an object in a Tkinter canvas window. """
 
-  def __init__(self, canvas, fill=None, outline="black"):
+  __slots__ = ("_canvas", "_reference", "_fill", "_outline", "_hidden")
+
+  def __init__(self, canvas, fill=None, outline="black", hidden=False):
     """
     Args:
       canvas: The Canvas to draw on.
-      fill: The fill color of the object. """
+      fill: The fill color of the object.
+      hidden: If true, the object isn't drawn until show() is called. """
     self._canvas = canvas
 
     # Keeps track of the reference for this object.
@@ -173,8 +484,11 @@ class CanvasObject(GuiObject):
     self._fill = fill
     # The object's outline color.
     self._outline = outline
+    # Whether the object has been taken off the canvas with hide().
+    self._hidden = hidden
 
-    self.__draw_object()
+    if not hidden:
+      self.__draw_object()
 
   def __draw_object(self):
     """ Wrapper for _draw_object that deletes an existing object first. """
@@ -190,6 +504,36 @@ class CanvasObject(GuiObject):
     canvas object, and set _pos_x and _pos_y accordingly. """
     raise NotImplementedError("_draw_object() must be implemented by subclass.")
 
+  def _erase_object(self):
+    """ Removes whatever _draw_object() drew from the canvas, without forgetting
+    anything about the object. Subclasses that draw more than one thing must
+    override this. """
+    self._canvas.delete_object(self._reference)
+    self._reference = None
+
+  def hide(self):
+    """ Takes the object off the canvas, so that it doesn't cost anything to
+    draw. It can still be changed and moved around while it is hidden. """
+    if self._hidden:
+      return
+
+    self._hidden = True
+    self._erase_object()
+
+  def show(self):
+    """ Draws the object again after it was hidden. """
+    if not self._hidden:
+      return
+
+    self._hidden = False
+    self.__draw_object()
+
+  def is_hidden(self):
+    """
+    Returns:
+      True if the object is hidden. """
+    return self._hidden
+
   def get_bbox(self):
     """ Gets the bounding box for this object. Must be implemented by the
     subclass.
@@ -221,16 +565,24 @@ class CanvasObject(GuiObject):
 
   def set_fill(self, fill):
     """ Changes the fill of the object. """
+    self._fill = fill
+    if self._hidden:
+      # It will get drawn with the new fill when it is shown.
+      return
+
     canvas = self._canvas.get_raw_canvas()
     canvas.itemconfig(self._reference, fill=fill)
     self._canvas.update()
 
   def delete(self):
     """ Deletes the object from the canvas. """
-    self._canvas.delete_object(self._reference)
+    if self._reference is not None:
+      self._canvas.delete_object(self._reference)
 
     # Indicates that the object is not present.
     self._reference = None
+    # It can't be shown again.
+    self._hidden = False
 
   def bind_event(self, event_type, callback):
     # Delegate the binding to the canvas.
@@ -277,6 +629,8 @@ class CanvasObject(GuiObject):
 class Shape(CanvasObject):
   """ Class that adds position functionality to CanvasObject"""
 
+  __slots__ = ("_pos_x", "_pos_y")
+
   def __init__(self, canvas, pos, **kwargs):
     """
     Args:
@@ -305,6 +659,8 @@ class Shape(CanvasObject):
     self._pos_x = new_x
     self._pos_y = new_y
 
+    if self._hidden:
+      return
     self._canvas.move_object(self._reference, move_x, move_y)
     self._canvas.update()
 
@@ -318,11 +674,14 @@ class Shape(CanvasObject):
     self._pos_x += x_shift
     self._pos_y += y_shift
 
-    self._canvas.move_object(self._reference, x_shift, y_shift)
+    if not self._hidden:
+      self._canvas.move_object(self._reference, x_shift, y_shift)
 
 class Circle(Shape):
   """ Draws a circle on the canvas. """
 
+  __slots__ = ("__radius",)
+
   def __init__(self, canvas, pos, radius, **kwargs):
     """
     Args:
@@ -338,7 +697,9 @@ class Circle(Shape):
     # Get the raw canvas to draw with.
     canvas = self._canvas.get_raw_canvas()
 
-    p1_x, p1_y, p2_x, p2_y = self.get_bbox()
+    bbox = self.get_bbox()
+    p1_x, p1_y = self._canvas.to_window(bbox[:2])
+    p2_x, p2_y = self._canvas.to_window(bbox[2:])
     self._reference = canvas.create_oval(p1_x, p1_y, p2_x, p2_y,
                                          fill=self._fill,
                                          outline=self._outline)
@@ -356,6 +717,8 @@ class Circle(Shape):
 class Rectangle(Shape):
   """ Draws a rectangle on the canvas. """
 
+  __slots__ = ("__width", "__height")
+
   def __init__(self, canvas, pos, size, **kwargs):
     """
     Args:
@@ -371,7 +734,9 @@ class Rectangle(Shape):
     # Get the raw canvas to draw with.
     canvas = self._canvas.get_raw_canvas()
 
-    p1_x, p1_y, p2_x, p2_y = self.get_bbox()
+    bbox = self.get_bbox()
+    p1_x, p1_y = self._canvas.to_window(bbox[:2])
+    p2_x, p2_y = self._canvas.to_window(bbox[2:])
     self._reference = canvas.create_rectangle(p1_x, p1_y, p2_x, p2_y,
                                               fill=self._fill,
                                               outline=self._outline)
@@ -388,13 +753,15 @@ class Rectangle(Shape):
 class Text(Shape):
   """ Draws text on the canvas. """
 
+  __slots__ = ("__text", "__font")
+
   def __init__(self, canvas, pos, text, font, **kwargs):
     """
     Args:
       canvas: The canvas to draw on.
       pos: The center position of the text.
       text: The actual text.
-      font: The Tkinter font to use. """
+      font: The font to use, as a tuple of the family and size. """
     self.__text = text
     self.__font = font
 
@@ -408,18 +775,130 @@ class Text(Shape):
     # Get the raw canvas to draw with.
     canvas = self._canvas.get_raw_canvas()
 
-    self._reference = canvas.create_text(self._pos_x, self._pos_y,
-                                         text=self.__text,
-                                         font=self.__font,
+    pos_x, pos_y = self._canvas.to_window((self._pos_x, self._pos_y))
+    self._reference = canvas.create_text(pos_x, pos_y, text=self.__text,
+                                         font=self.__get_window_font(),
                                          fill=self._fill)
 
+  def __get_window_font(self):
+    """
+    Returns:
+      The font to draw with, scaled to match the canvas view. """
+    family, size = self.__font
+    size = max(int(round(size * self._canvas.get_scale())), 1)
+    return fonts.get_font(family, size)
+
+  def get_text(self):
+    """
+    Returns:
+      The text being displayed. """
+    return self.__text
+
+  def get_font(self):
+    """
+    Returns:
+      The font being used. """
+    return self.__font
+
+  def set_text(self, text, font):
+    """ Changes the text and font without redrawing the object. It does not
+    update the canvas afterwards.
+    Args:
+      text: The new text.
+      font: The new font, as a tuple of the family and size. """
+    if (text == self.__text and font == self.__font):
+      # Nothing to change.
+      return
+
+    self.__text = text
+    self.__font = font
+    if self._hidden:
+      return
+
+    canvas = self._canvas.get_raw_canvas()
+    canvas.itemconfig(self._reference, text=text,
+                      font=self.__get_window_font())
+
   def get_bbox(self):
-    # TODO (danielp): Real bounding box calculation.
-    return (self._pos_x, self._pos_y, self._pos_x, self._pos_y)
+    # The text is centered on its position.
+    width, height = fonts.measure_text(self.__text, *self.__font)
+    p1_x = self._pos_x - width / 2
+    p1_y = self._pos_y - height / 2
+    p2_x = self._pos_x + width / 2
+    p2_y = self._pos_y + height / 2
+
+    return (p1_x, p1_y, p2_x, p2_y)
+
+class Image(Shape):
+  """ Draws an image on the canvas, from raw pixel data. """
+
+  __slots__ = ("__width", "__height", "__photo")
+
+  def __init__(self, canvas, pos, size, **kwargs):
+    """
+    Args:
+      canvas: The canvas to draw on.
+      pos: The center position of the image.
+      size: The width and height of the image. """
+    self.__width, self.__height = size
+    # The Tk image that holds the pixels.
+    self.__photo = None
+
+    super(Image, self).__init__(canvas, pos, **kwargs)
+
+  def _draw_object(self):
+    """ Draw the image on the canvas. """
+    # Get the raw canvas to draw with.
+    canvas = self._canvas.get_raw_canvas()
+
+    if not self._canvas.is_headless():
+      self.__photo = tk.PhotoImage(master=canvas, width=self.__width,
+                                   height=self.__height)
+    pos_x, pos_y = self._canvas.to_window((self._pos_x, self._pos_y))
+    self._reference = canvas.create_image(pos_x, pos_y, image=self.__photo)
+
+  def _erase_object(self):
+    super(Image, self)._erase_object()
+    # The pixels don't need to be kept around while nothing is drawn.
+    self.__photo = None
+
+  def set_ppm(self, data, offset=None):
+    """ Replaces the contents of the image. It does not update the canvas
+    afterwards.
+    Args:
+      data: The new contents, as a binary PPM image.
+      offset: If specified, only the part of the image at this offset gets
+              replaced. Otherwise, the data must be the same size as the
+              image. """
+    if self.__photo is None:
+      # Nothing is being drawn.
+      return
+
+    # Tk wants binary image data to be base64-encoded.
+    data = base64.b64encode(data)
+    if offset is None:
+      self.__photo.configure(data=data, format="ppm")
+      return
+
+    # PhotoImage.put() doesn't let us specify the format.
+    x, y = offset
+    self.__photo.tk.call(self.__photo.name, "put", data, "-format", "ppm",
+                         "-to", x, y)
+
+  def get_bbox(self):
+    # Calculate corner points.
+    p1_x = self._pos_x - self.__width / 2
+    p1_y = self._pos_y - self.__height / 2
+    p2_x = self._pos_x + self.__width / 2
+    p2_y = self._pos_y + self.__height / 2
+
+    return (p1_x, p1_y, p2_x, p2_y)
 
 class Line(CanvasObject):
   """ Extends functionality of CanvasObject to draw lines"""
 
+  __slots__ = ("_x_1", "_y_1", "_x_2", "_y_2")
+
   def __init__(self, canvas, pos1, pos2, **kwargs):
     """
     Args:
@@ -436,7 +915,9 @@ class Line(CanvasObject):
     """ Draw the Line on the canvas. """
     # Get the raw canvas to draw with.
     canvas = self._canvas.get_raw_canvas()
-    self._reference = canvas.create_line(self._x_1, self._y_1, self._x_2, self._y_2, fill = self._fill)
+    x_1, y_1 = self._canvas.to_window((self._x_1, self._y_1))
+    x_2, y_2 = self._canvas.to_window((self._x_2, self._y_2))
+    self._reference = canvas.create_line(x_1, y_1, x_2, y_2, fill = self._fill)
 
   def get_bbox(self):
     return(self._x_1, self._y_1, self._x_2, self._y_2)
@@ -0,0 +1,233 @@
+import cProfile
+import pstats
+import time
+
+
+""" Times the hooks that apps implement, and attributes the time to each app
+class and cube, so that it's possible to find out which app is slowing the
+tabletop down.
+
+Apps often run inside each other's hooks, since sending a message runs the
+receiver's handler right away. Time spent in nested hooks is only counted
+for the innermost one. """
+
+
+# Names of the hooks that get profiled.
+START_APP = "_start_app"
+MESSAGE_RECEIVE = "_on_message_receive"
+RECONFIGURATION = "on_reconfiguration"
+BUTTON_PRESS = "_on_button_press"
+BUTTON_RELEASE = "_on_button_release"
+
+
+class _HookStats(object):
+  """ Timing statistics for one hook on one cube. """
+
+  def __init__(self):
+    self.calls = 0
+    # Time spent in the hook itself, not counting nested hooks, in seconds.
+    self.total_time = 0.0
+    self.max_time = 0.0
+
+  def add(self, elapsed):
+    """ Records a call.
+    Args:
+      elapsed: How long the call took, in seconds. """
+    self.calls += 1
+    self.total_time += elapsed
+    self.max_time = max(self.max_time, elapsed)
+
+  def merge(self, other):
+    """ Adds the statistics from another _HookStats to this one.
+    Args:
+      other: The _HookStats to add. """
+    self.calls += other.calls
+    self.total_time += other.total_time
+    self.max_time = max(self.max_time, other.max_time)
+
+  def to_dict(self):
+    """
+    Returns:
+      The statistics, as a dictionary. """
+    return {"calls": self.calls, "total_time": self.total_time,
+            "max_time": self.max_time}
+
+
+class _Frame(object):
+  """ A hook that is currently running. """
+
+  def __init__(self, name, profile):
+    """
+    Args:
+      name: The name to use for this hook in collapsed stacks.
+      profile: The cProfile.Profile for the app, or None. """
+    self.name = name
+    self.profile = profile
+    # Time spent in nested hooks, in seconds.
+    self.nested_time = 0.0
+
+
+class Profiler(object):
+  """ Collects timing for app hooks. Use start() to install one. """
+
+  def __init__(self, use_cprofile=False):
+    """
+    Args:
+      use_cprofile: If true, each app instance also gets its own cProfile
+                    profiler, so the time can be broken down by function. This
+                    makes everything a lot slower. """
+    self.__use_cprofile = use_cprofile
+
+    # Statistics, keyed by app class name, cube ID and hook name.
+    self.__stats = {}
+    # cProfile profilers for each app instance, keyed by the app.
+    self.__profiles = {}
+    # Time spent in each stack of nested hooks, not counting the hooks nested
+    # in them, keyed by the stack of frame names.
+    self.__stacks = {}
+    # The hooks that are running right now, innermost last.
+    self.__running = []
+
+  def __get_profile(self, app):
+    """
+    Args:
+      app: The app to get the profiler for.
+    Returns:
+      The cProfile profiler for the app, or None if we aren't using them. """
+    if not self.__use_cprofile:
+      return None
+
+    profile = self.__profiles.get(app)
+    if profile is None:
+      profile = cProfile.Profile()
+      self.__profiles[app] = profile
+
+    return profile
+
+  def call(self, app, cube_id, hook, function, *args):
+    """ Runs a hook, and records how long it took.
+    Args:
+      app: The app that the hook belongs to.
+      cube_id: The ID of the cube that the app is running on.
+      hook: The name of the hook.
+      function: The function to run.
+      All other arguments are passed to the function.
+    Returns:
+      Whatever the function returns. """
+    app_class = app.__class__.__name__
+    profile = self.__get_profile(app)
+    frame = _Frame("%s[%d].%s" % (app_class, cube_id, hook), profile)
+
+    outer = self.__running[-1] if self.__running else None
+    if (outer is not None and outer.profile is not None):
+      # Only one cProfile profiler can run at once.
+      outer.profile.disable()
+    self.__running.append(frame)
+
+    start_time = time.time()
+    try:
+      if profile is not None:
+        return profile.runcall(function, *args)
+      return function(*args)
+
+    finally:
+      elapsed = time.time() - start_time
+      self.__running.pop()
+      if outer is not None:
+        outer.nested_time += elapsed
+        if outer.profile is not None:
+          outer.profile.enable()
+
+      self_time = max(elapsed - frame.nested_time, 0.0)
+      key = (app_class, cube_id, hook)
+      stats = self.__stats.get(key)
+      if stats is None:
+        stats = _HookStats()
+        self.__stats[key] = stats
+      stats.add(self_time)
+
+      stack = tuple(running.name for running in self.__running) + \
+              (frame.name,)
+      self.__stacks[stack] = self.__stacks.get(stack, 0.0) + self_time
+
+  def __aggregate(self, get_key):
+    """ Adds up the statistics in groups.
+    Args:
+      get_key: Function that takes the app class name, cube ID and hook name,
+               and returns the group to put them in.
+    Returns:
+      A dictionary mapping groups to dictionaries of statistics for each hook.
+    """
+    groups = {}
+    for (app_class, cube_id, hook), stats in self.__stats.iteritems():
+      hooks = groups.setdefault(get_key(app_class, cube_id, hook), {})
+      hooks.setdefault(hook, _HookStats()).merge(stats)
+
+    return dict((group, dict((hook, stats.to_dict()) \
+                             for hook, stats in hooks.iteritems())) \
+                for group, hooks in groups.iteritems())
+
+  def get_stats_by_class(self):
+    """
+    Returns:
+      The statistics for each hook, keyed by app class name and then hook
+      name. """
+    return self.__aggregate(lambda app_class, cube_id, hook: app_class)
+
+  def get_stats_by_cube(self):
+    """
+    Returns:
+      The statistics for each hook, keyed by cube ID and then hook name. """
+    return self.__aggregate(lambda app_class, cube_id, hook: cube_id)
+
+  def dump_pstats(self, path):
+    """ Writes the combined cProfile statistics for all the apps, so that they
+    can be loaded with pstats.
+    Args:
+      path: The file to write to. """
+    if not self.__profiles:
+      raise ValueError("No cProfile data. Was the profiler created with" \
+                       " use_cprofile?")
+
+    profiles = self.__profiles.values()
+    stats = pstats.Stats(profiles[0])
+    for profile in profiles[1:]:
+      stats.add(profile)
+    stats.dump_stats(path)
+
+  def dump_collapsed(self, path):
+    """ Writes the time spent in each stack of nested hooks, in the collapsed
+    stack format that flame graph tools read. Times are in microseconds.
+    Args:
+      path: The file to write to. """
+    with open(path, "w") as collapsed_file:
+      for stack, total_time in sorted(self.__stacks.iteritems()):
+        collapsed_file.write("%s %d\n" % (";".join(stack),
+                                          int(total_time * 1000000)))
+
+
+# The Profiler that is running, or None if profiling is off. Hot paths check
+# this directly, so that profiling costs nothing else when it is off.
+active = None
+
+def start(use_cprofile=False):
+  """ Starts profiling app hooks.
+  Args:
+    use_cprofile: Whether to also run cProfile for each app instance.
+  Returns:
+    The Profiler. """
+  global active
+  if active is not None:
+    raise ValueError("Already profiling.")
+
+  active = Profiler(use_cprofile=use_cprofile)
+  return active
+
+def stop():
+  """ Stops profiling app hooks.
+  Returns:
+    The Profiler that was running, or None if there wasn't one. """
+  global active
+  profiler = active
+  active = None
+  return profiler
@@ -0,0 +1,133 @@
+import collections
+
+
+class RoutingTable(object):
+  """ Shortest-path routing table for a single cube. For every cube that can be
+  reached from it, it stores which side to send a message out of, and how many
+  hops it takes. """
+
+  def __init__(self, cube):
+    """ Builds the routing table using a breadth-first search of the current
+    connections.
+    Args:
+      cube: The cube that this table is for. """
+    # Maps the ID of each reachable cube to the side to send on.
+    self.__next_side = {}
+    # Maps the ID of each reachable cube to its distance in hops.
+    self.__hops = {cube.get_id(): 0}
+
+    # Cubes to visit, along with the side that we leave the source from to
+    # get to them.
+    to_visit = collections.deque()
+    for side, other in cube.get_connections().iteritems():
+      if other is not None and other.get_id() not in self.__hops:
+        self.__hops[other.get_id()] = 1
+        self.__next_side[other.get_id()] = side
+        to_visit.append((other, side))
+
+    while to_visit:
+      current, first_side = to_visit.popleft()
+      hops = self.__hops[current.get_id()] + 1
+
+      for other in current.get_connections().itervalues():
+        if other is None or other.get_id() in self.__hops:
+          continue
+
+        self.__hops[other.get_id()] = hops
+        self.__next_side[other.get_id()] = first_side
+        to_visit.append((other, first_side))
+
+  def get_next_side(self, cube_id):
+    """ Gets the side to send a message out of to reach a cube.
+    Args:
+      cube_id: The ID of the destination cube.
+    Returns:
+      The side to send on, or None if the cube can't be reached. """
+    return self.__next_side.get(cube_id)
+
+  def get_hops(self, cube_id):
+    """ Gets the number of hops needed to reach a cube.
+    Args:
+      cube_id: The ID of the destination cube.
+    Returns:
+      The number of hops, or None if the cube can't be reached. """
+    return self.__hops.get(cube_id)
+
+  def get_reachable(self):
+    """
+    Returns:
+      The IDs of all the cubes that can be reached, including this one. """
+    return self.__hops.keys()
+
+
+class RoutingStats(object):
+  """ Keeps track of how routed messages perform. """
+
+  def __init__(self):
+    self.reset()
+
+  def reset(self):
+    """ Clears all the statistics. """
+    # Number of messages that were delivered.
+    self.__delivered = 0
+    # Total and maximum number of hops taken by the messages.
+    self.__total_hops = 0
+    self.__max_hops = 0
+    # Total and maximum time it took to deliver the messages, in seconds.
+    self.__total_latency = 0.0
+    self.__max_latency = 0.0
+
+  def record_delivery(self, hops, latency):
+    """ Records a delivered message.
+    Args:
+      hops: The number of hops that the message took.
+      latency: How long it took to deliver, in seconds. """
+    self.__delivered += 1
+    self.__total_hops += hops
+    self.__max_hops = max(self.__max_hops, hops)
+    self.__total_latency += latency
+    self.__max_latency = max(self.__max_latency, latency)
+
+  def get_delivered(self):
+    """
+    Returns:
+      The number of messages that were delivered. """
+    return self.__delivered
+
+  def get_average_hops(self):
+    """
+    Returns:
+      The average number of hops per message. """
+    if not self.__delivered:
+      return 0.0
+    return float(self.__total_hops) / self.__delivered
+
+  def get_max_hops(self):
+    """
+    Returns:
+      The largest number of hops that a message took. """
+    return self.__max_hops
+
+  def get_average_latency(self):
+    """
+    Returns:
+      The average delivery time per message, in seconds. """
+    if not self.__delivered:
+      return 0.0
+    return self.__total_latency / self.__delivered
+
+  def get_max_latency(self):
+    """
+    Returns:
+      The longest time that a message took to be delivered, in seconds. """
+    return self.__max_latency
+
+
+# Statistics for all the routed messages in the simulation.
+_stats = RoutingStats()
+
+def get_stats():
+  """
+  Returns:
+    The RoutingStats for all the routed messages in the simulation. """
+  return _stats
@@ -0,0 +1,224 @@
+import cPickle as pickle
+import importlib
+import mmap
+import struct
+
+
+""" Saves the layout of a tabletop to a compact binary snapshot, so that it can
+be loaded again without rebuilding it by hand.
+
+A snapshot starts with a magic string and a header, followed by a table with a
+fixed-size record for every cube, and then the strings that the records refer
+to. Strings are stored once, with a 32-bit length in front of them, and
+records refer to them by their offset in the file. Since the cube records are
+all the same size, a snapshot can be memory-mapped, and any cube can be read
+without reading the ones before it. """
+
+
+# Identifies snapshot files.
+_MAGIC = "MCSNAP\x00\x01"
+
+# Grid width, grid height and number of cubes.
+_HEADER = struct.Struct("<HHI")
+# Grid x and y index, and the offsets of the color, app class path, pickled
+# app constructor arguments and pickled app state strings. The class path
+# offset is zero if the cube has no app.
+_CUBE = struct.Struct("<HHIIII")
+# Length that goes in front of every string.
+_LENGTH = struct.Struct("<I")
+
+# Offset of the cube table.
+_CUBES_OFFSET = len(_MAGIC) + _HEADER.size
+
+# Stands in for a missing app.
+_NO_APP = 0
+
+
+class _StringTable(object):
+  """ Lays out the strings at the end of a snapshot. """
+
+  def __init__(self, offset):
+    """
+    Args:
+      offset: The offset in the file that the strings start at. """
+    self.__offset = offset
+    # The packed strings.
+    self.__chunks = []
+    # Offsets of the strings that have been added, keyed by string.
+    self.__offsets = {}
+
+  def add(self, string):
+    """ Adds a string, unless it was already added.
+    Args:
+      string: The string to add.
+    Returns:
+      The offset of the string in the file. """
+    offset = self.__offsets.get(string)
+    if offset is None:
+      offset = self.__offset
+      self.__offsets[string] = offset
+
+      self.__chunks.append(_LENGTH.pack(len(string)))
+      self.__chunks.append(string)
+      self.__offset += _LENGTH.size + len(string)
+
+    return offset
+
+  def get_chunks(self):
+    """
+    Returns:
+      The packed strings, as a list of chunks to write in order. """
+    return self.__chunks
+
+
+def write(path, grid_size, cubes):
+  """ Writes a snapshot.
+  Args:
+    path: The file to write to.
+    grid_size: The width and height of the grid, in cubes.
+    cubes: A list of tuples of the x and y index, color, and app of each cube.
+           The app can be None. """
+  grid_width, grid_height = grid_size
+  strings = _StringTable(_CUBES_OFFSET + _CUBE.size * len(cubes))
+
+  records = []
+  for x, y, color, app in cubes:
+    class_offset = args_offset = state_offset = _NO_APP
+    if app is not None:
+      app_class = app.get_app_class()
+      class_offset = strings.add("%s.%s" % (app_class.__module__,
+                                            app_class.__name__))
+      args_offset = strings.add(pickle.dumps(tuple(app.get_init_args()),
+                                             pickle.HIGHEST_PROTOCOL))
+      state_offset = strings.add(pickle.dumps(app.get_state(),
+                                              pickle.HIGHEST_PROTOCOL))
+
+    records.append(_CUBE.pack(x, y, strings.add(color), class_offset,
+                              args_offset, state_offset))
+
+  with open(path, "wb") as snapshot_file:
+    snapshot_file.write(_MAGIC)
+    snapshot_file.write(_HEADER.pack(grid_width, grid_height, len(cubes)))
+    snapshot_file.write("".join(records))
+    snapshot_file.write("".join(strings.get_chunks()))
+
+
+class SnapshotReader(object):
+  """ Reads a snapshot. The file is memory-mapped, and cubes are only decoded
+  when they are asked for. """
+
+  def __init__(self, path):
+    """
+    Args:
+      path: The file to read. """
+    with open(path, "rb") as snapshot_file:
+      self.__data = mmap.mmap(snapshot_file.fileno(), 0,
+                              access=mmap.ACCESS_READ)
+
+    if self.__data[:len(_MAGIC)] != _MAGIC:
+      self.__data.close()
+      raise ValueError("'%s' is not a tabletop snapshot." % (path))
+
+    grid_width, grid_height, self.__num_cubes = \
+        _HEADER.unpack_from(self.__data, len(_MAGIC))
+    self.__grid_size = (grid_width, grid_height)
+
+    # Strings that have already been read, keyed by offset.
+    self.__strings = {}
+    # App classes that have already been imported, keyed by class path.
+    self.__classes = {}
+
+  def __get_string(self, offset):
+    """
+    Args:
+      offset: The offset of the string in the file.
+    Returns:
+      The string. """
+    string = self.__strings.get(offset)
+    if string is None:
+      length, = _LENGTH.unpack_from(self.__data, offset)
+      start = offset + _LENGTH.size
+      string = self.__data[start:start + length]
+      self.__strings[offset] = string
+
+    return string
+
+  def __get_class(self, class_path):
+    """
+    Args:
+      class_path: The full name of an app class.
+    Returns:
+      The class. """
+    app_class = self.__classes.get(class_path)
+    if app_class is None:
+      module_name, class_name = class_path.rsplit(".", 1)
+      module = importlib.import_module(module_name)
+      app_class = getattr(module, class_name)
+      self.__classes[class_path] = app_class
+
+    return app_class
+
+  def __get_record(self, index):
+    """
+    Args:
+      index: The index of the cube.
+    Returns:
+      The unpacked record for the cube. """
+    if (index < 0 or index >= self.__num_cubes):
+      raise IndexError("Snapshot has no cube %d." % (index))
+    return _CUBE.unpack_from(self.__data, _CUBES_OFFSET + _CUBE.size * index)
+
+  def get_grid_size(self):
+    """
+    Returns:
+      The width and height of the grid, in cubes. """
+    return self.__grid_size
+
+  def get_num_cubes(self):
+    """
+    Returns:
+      The number of cubes in the snapshot. """
+    return self.__num_cubes
+
+  def get_pos(self, index):
+    """
+    Args:
+      index: The index of the cube.
+    Returns:
+      The grid indices of the cube, as (x, y). """
+    x, y, _, _, _, _ = self.__get_record(index)
+    return (x, y)
+
+  def get_color(self, index):
+    """
+    Args:
+      index: The index of the cube.
+    Returns:
+      The color of the cube. """
+    _, _, color_offset, _, _, _ = self.__get_record(index)
+    return self.__get_string(color_offset)
+
+  def make_app(self, index):
+    """ Recreates the app that was running on a cube, and restores its state.
+    Args:
+      index: The index of the cube.
+    Returns:
+      The app, which has not been started yet, or None if the cube didn't
+      have one. """
+    _, _, _, class_offset, args_offset, state_offset = \
+        self.__get_record(index)
+    if class_offset == _NO_APP:
+      return None
+
+    app_class = self.__get_class(self.__get_string(class_offset))
+    app = app_class(*pickle.loads(self.__get_string(args_offset)))
+
+    state = pickle.loads(self.__get_string(state_offset))
+    if state is not None:
+      app.set_state(state)
+
+    return app
+
+  def close(self):
+    """ Closes the snapshot. """
+    self.__data.close()
@@ -1,12 +1,19 @@
 import logging
+import math
 import sys
+import time
 
 from cube import Cube
 from obj_canvas import Line
+from virtual_cube import metrics
+from virtual_cube import vm_switch
+import cluster_index
 import config
 import display
 import event
 import obj_canvas
+import snapshot
+import vm_cube
 
 
 logger = logging.getLogger(__name__)
@@ -15,38 +22,82 @@ logger = logging.getLogger(__name__)
 class Tabletop(object):
   """ Simulates a "tabletop" in which the cubes exist. """
 
-  def __init__(self):
+  # How many cubes to add at once when a snapshot is being loaded in the
+  # background.
+  _LOAD_CHUNK_SIZE = 500
+
+  # How far the view can be zoomed out and in.
+  _MIN_SCALE = 0.05
+  _MAX_SCALE = 1.0
+  # How much one step of the mouse wheel zooms by.
+  _ZOOM_STEP = 1.25
+
+  def __init__(self, headless=False, grid_size=None):
+    """
+    Args:
+      headless: If true, nothing is drawn, and no display is needed.
+      grid_size: The width and height of the grid, in cubes. By default, this
+                 comes from the configuration. """
     logger.info("Creating new tabletop")
 
+    if grid_size is None:
+      grid_size = (int(config.get('CUBE', 'GRID_WIDTH')),
+                   int(config.get('CUBE', 'GRID_HEIGHT')))
+    grid_width, grid_height = grid_size
+
     # List of cubes.
-    self.__cubes = [[None for x in range(int(config.get('CUBE', 'GRID_WIDTH')))]
-                     for y in range(int(config.get('CUBE', 'GRID_HEIGHT')))]
+    self.__cubes = [[None for x in range(grid_width)]
+                     for y in range(grid_height)]
+    # Where to start looking for a free spot for the next cube.
+    self.__next_spot = 0
+
+    # Keeps track of which cubes are connected to each other.
+    self.__clusters = cluster_index.ClusterIndex()
+    # Passes messages directly between adjacent VM-backed cubes.
+    self.__vm_switch = vm_switch.VmSwitch()
 
     # List of lines making up the grid
     self.__grid = []
     self.__drawngrid = False
 
     # Canvas on which to draw cubes.
-    self.__canvas = obj_canvas.Canvas(background = config.get('COLORS', 'BACKGROUND'))
+    self.__canvas = obj_canvas.Canvas(background = config.get('COLORS', 'BACKGROUND'),
+                                      headless=headless)
     # When we drag the mouse, we want to move the currently-selected cube.
     self.__canvas.bind_event(event.MouseDragEvent, self.__mouse_dragged)
     # When we release the mouse button, we want to clear the dragging state for
     # all the cubes.
     self.__canvas.bind_event(event.MouseReleaseEvent, self.__mouse_released)
+    # The view can be moved by dragging with the middle button, and zoomed
+    # with the mouse wheel.
+    self.__canvas.bind_event(event.MouseMiddlePressEvent, self.__pan_started)
+    self.__canvas.bind_event(event.MouseMiddleDragEvent, self.__pan_dragged)
+    self.__canvas.bind_event(event.ScrollUpEvent, self.__scrolled_up)
+    self.__canvas.bind_event(event.ScrollDownEvent, self.__scrolled_down)
+
+    # The point on the canvas that is being dragged to move the view.
+    self.__pan_anchor = None
 
   def __mouse_released(self, event):
     """ Called when the user releases the mouse button. """
+    if Cube.release_held_button():
+      # A button was being held down, so no cube was picked up.
+      return
+
     # Clear the dragging state of the selected cube.
     selected_cube = Cube.get_selected()
     if selected_cube is None:
       # No cube is selected. Do nothing.
       return
 
-    # Places the cube
-    selected_cube.snap_to_grid(int(config.get('CUBE', 'CUBE_SIZE')),
-                               self.__cubes,
-                               offset = int(config.get('CUBE', 'GRID_OFFSET')))
-    selected_cube.clear_drag()
+    # Places the cube. Clearing the drag state is what reports the move to the
+    # apps, so it has to happen even if placement fails.
+    try:
+      selected_cube.snap_to_grid(int(config.get('CUBE', 'CUBE_SIZE')),
+                                 self.__cubes,
+                                 offset = int(config.get('CUBE', 'GRID_OFFSET')))
+    finally:
+      selected_cube.clear_drag()
 
     # Clear the grid
     self.clear_grid()
@@ -60,6 +111,10 @@ class Tabletop(object):
       # No cube is selected. Do nothing.
       return
 
+    registry = metrics.get_registry()
+    if registry is not None:
+      start_time = time.time()
+
     # Shows the grid if necessary
     if (self.__drawngrid == False):
       self.__grid = self.draw_grid()
@@ -68,6 +123,123 @@ class Tabletop(object):
     # Move the cube.
     selected_cube.drag(event)
 
+    if registry is not None:
+      registry.get_histogram("tabletop.drag_time") \
+          .observe(time.time() - start_time)
+
+  def __pan_started(self, event):
+    """ Called when the user presses the middle mouse button. """
+    # Whatever is under the mouse stays under it while it is dragged.
+    self.__pan_anchor = event.get_pos()
+
+  def __pan_dragged(self, event):
+    """ Called when the user drags with the middle mouse button. """
+    if self.__pan_anchor is None:
+      return
+
+    anchor_x, anchor_y = self.__pan_anchor
+    mouse_x, mouse_y = event.get_pos()
+    (view_x, view_y), scale = self.__canvas.get_view()
+    self.set_view((view_x + anchor_x - mouse_x, view_y + anchor_y - mouse_y),
+                  scale)
+
+  def __scrolled_up(self, event):
+    """ Called when the user scrolls the mouse wheel up. """
+    self.zoom(self._ZOOM_STEP, center=event.get_pos())
+
+  def __scrolled_down(self, event):
+    """ Called when the user scrolls the mouse wheel down. """
+    self.zoom(1.0 / self._ZOOM_STEP, center=event.get_pos())
+
+  def __get_spots(self, region):
+    """ Finds the grid spots that a region of the canvas covers.
+    Args:
+      region: The region, as a bounding box in canvas coordinates.
+    Returns:
+      The range of grid indices, as (x1, y1, x2, y2), with the second corner
+      exclusive. """
+    size = float(config.get('CUBE', 'CUBE_SIZE'))
+    offset = int(config.get('CUBE', 'GRID_OFFSET'))
+    left, top, right, bottom = region
+
+    # Cubes are centered on their spots, so round outwards to catch the ones
+    # that stick into the region.
+    x1 = max(int(math.floor((left - offset) / size)), 0)
+    y1 = max(int(math.floor((top - offset) / size)), 0)
+    x2 = min(int(math.ceil((right - offset) / size)) + 1, len(self.__cubes[0]))
+    y2 = min(int(math.ceil((bottom - offset) / size)) + 1, len(self.__cubes))
+    return (x1, y1, x2, y2)
+
+  def __update_detail(self, spots, skip=None):
+    """ Updates how much of every cube in a range of spots is drawn.
+    Args:
+      spots: The range of spots, as returned by __get_spots().
+      skip: If specified, another range of spots to leave alone. """
+    x1, y1, x2, y2 = spots
+    for y in xrange(y1, y2):
+      row = self.__cubes[y]
+      for x in xrange(x1, x2):
+        cube = row[x]
+        if cube is None:
+          continue
+        if (skip is not None and skip[0] <= x < skip[2] and \
+            skip[1] <= y < skip[3]):
+          continue
+
+        cube.update_detail()
+
+  def set_view(self, pos, scale):
+    """ Changes which part of the tabletop is shown. Cubes that aren't in view
+    are not drawn at all, and cubes are only drawn in full detail when the view
+    isn't zoomed out.
+    Args:
+      pos: The canvas coordinates of the top left corner of the window.
+      scale: How many window pixels there should be for every canvas pixel. It
+             gets limited to a reasonable range. """
+    scale = min(max(scale, self._MIN_SCALE), self._MAX_SCALE)
+    old_scale = self.__canvas.get_scale()
+    old_spots = self.__get_spots(self.__canvas.get_visible_region())
+
+    self.__canvas.set_view(pos, scale)
+    new_spots = self.__get_spots(self.__canvas.get_visible_region())
+
+    # Only cubes that were or are now in view can change. If the scale didn't
+    # change either, the ones that stayed in view can be skipped.
+    self.__update_detail(old_spots, skip=new_spots)
+    if scale == old_scale:
+      self.__update_detail(new_spots, skip=old_spots)
+    else:
+      self.__update_detail(new_spots)
+
+    self.__canvas.update()
+
+  def pan(self, x_shift, y_shift):
+    """ Moves the view.
+    Args:
+      x_shift: How far to move it in the x direction, in window pixels.
+      y_shift: How far to move it in the y direction, in window pixels. """
+    (view_x, view_y), scale = self.__canvas.get_view()
+    self.set_view((view_x + x_shift / scale, view_y + y_shift / scale), scale)
+
+  def zoom(self, factor, center=None):
+    """ Zooms the view in or out.
+    Args:
+      factor: How much to zoom by. Values above one zoom in.
+      center: The point to zoom around, in canvas coordinates. It stays in the
+              same place in the window. By default, this is the middle of the
+              window. """
+    (view_x, view_y), scale = self.__canvas.get_view()
+    if center is None:
+      left, top, right, bottom = self.__canvas.get_visible_region()
+      center = ((left + right) / 2.0, (top + bottom) / 2.0)
+    center_x, center_y = center
+
+    new_scale = min(max(scale * factor, self._MIN_SCALE), self._MAX_SCALE)
+    # Keep the center at the same window position.
+    ratio = scale / new_scale
+    self.set_view((center_x - (center_x - view_x) * ratio,
+                   center_y - (center_y - view_y) * ratio), new_scale)
+
   def make_cube(self, color=config.get('COLORS', 'CUBE_RED')):
     """ Adds a new cube to the canvas.
     Args:
@@ -76,53 +248,267 @@ class Tabletop(object):
       The cube that it made. """
     logger.info("adding a cube to our tabletop")
 
-    cube = Cube(self.__canvas, (0, 0), color)
-    x, y = 0, 0
-    while self.__cubes[y][x]:
-      x += 1
+    cube = Cube(self.__canvas, (0, 0), color,
+                cluster_index=self.__clusters)
+    self.__place_cube(cube)
+
+    return cube
+
+  def make_vm_cube(self, vm, color=config.get('COLORS', 'CUBE_BLUE')):
+    """ Adds a new cube to the canvas that is backed by a cube VM.
+    Args:
+      vm: The running CubeVm to connect it to.
+      color: The color of the cube.
+    Returns:
+      The VmBackedCube that it made. """
+    logger.info("adding a VM-backed cube to our tabletop")
+
+    cube = vm_cube.VmBackedCube(self.__canvas, (0, 0), color, vm,
+                                cluster_index=self.__clusters,
+                                switch=self.__vm_switch)
+    self.__place_cube(cube)
+    # Deliver whatever the VM sends as part of our event loop.
+    cube.poll_periodically()
+
+    return cube
+
+  def __place_cube(self, cube):
+    """ Puts a new cube in a free spot on the tabletop.
+    Args:
+      cube: The cube to place. """
+    width = len(self.__cubes[0])
+    num_spots = width * len(self.__cubes)
+    # Cubes can be moved around, so spots before the last one we filled might
+    # have been freed up, but it's usually faster to start from there.
+    for i in xrange(num_spots):
+      spot = (self.__next_spot + i) % num_spots
+      y, x = divmod(spot, width)
+      if self.__cubes[y][x] is None:
+        break
+    else:
+      raise ValueError("There is no room on the tabletop for another cube.")
+    self.__next_spot = spot + 1
+
+    self.__clusters.add_cube(cube)
     self.__cubes[y][x] = cube
     cube.set_idx(x, y, self.__cubes)
 
-    return cube
+  def place_many(self, positions, apps=None,
+                 color=config.get('COLORS', 'CUBE_RED'), colors=None):
+    """ Adds a lot of cubes to the canvas at once. This is much faster than
+    adding them one at a time, and the apps only find out about the resulting
+    connections once, when everything has been placed.
+    Args:
+      positions: The grid indices to put the cubes at, as a list of (x, y).
+      apps: If specified, a list with an app to run on each cube. Entries can
+            be None to leave a cube without an app.
+      color: The color of the cubes.
+      colors: If specified, a list with the color of each cube, which is used
+              instead of color.
+    Returns:
+      The cubes that it made, in the same order as the positions. """
+    positions = [tuple(pos) for pos in positions]
+    if apps is not None and len(apps) != len(positions):
+      raise ValueError("Need exactly one app for every cube.")
+    if colors is None:
+      colors = [color] * len(positions)
+    elif len(colors) != len(positions):
+      raise ValueError("Need exactly one color for every cube.")
+    if len(set(positions)) != len(positions):
+      raise ValueError("Can't put more than one cube in the same spot.")
+
+    grid_width = len(self.__cubes[0])
+    grid_height = len(self.__cubes)
+    for x, y in positions:
+      if (x < 0 or x >= grid_width or y < 0 or y >= grid_height):
+        raise ValueError("Spot (%d, %d) is not on the tabletop." % (x, y))
+      if self.__cubes[y][x] is not None:
+        raise ValueError("Spot (%d, %d) already has a cube in it." % (x, y))
+
+    logger.info("adding %d cubes to our tabletop", len(positions))
+
+    cubes = []
+    with Cube.batch_changes():
+      for (x, y), cube_color in zip(positions, colors):
+        cube = Cube(self.__canvas, (x, y), cube_color,
+                    cluster_index=self.__clusters)
+        self.__clusters.add_cube(cube)
+        self.__cubes[y][x] = cube
+        cubes.append(cube)
+
+      if apps is not None:
+        for cube, app in zip(cubes, apps):
+          if app is not None:
+            cube.run_app(app)
+
+      # Nobody hears about the new connections until the batch ends, so every
+      # cube only gets one reconfiguration.
+      for cube in cubes:
+        cube.update_connections(self.__cubes)
+
+    self.__canvas.update()
+    return cubes
+
+  def save(self, path):
+    """ Saves the layout of the tabletop to a snapshot, including the apps that
+    are running on the cubes. VM-backed cubes can't be saved, and are left out.
+    Args:
+      path: The file to save it to. """
+    cubes = []
+    for y, row in enumerate(self.__cubes):
+      for x, cube in enumerate(row):
+        if cube is None:
+          continue
+        if isinstance(cube, vm_cube.VmBackedCube):
+          logger.warning("Not saving VM-backed cube %d.", cube.get_id())
+          continue
+
+        cubes.append((x, y, cube.get_color(), cube.get_app()))
+
+    grid_size = (len(self.__cubes[0]), len(self.__cubes))
+    snapshot.write(path, grid_size, cubes)
+    logger.info("saved %d cubes to %s", len(cubes), path)
+
+  @classmethod
+  def load(cls, path, lazy=True, **kwargs):
+    """ Creates a tabletop from a snapshot. The cubes that are on the screen
+    are placed right away.
+    Args:
+      path: The snapshot to load.
+      lazy: If true, the rest of the cubes are placed a few at a time from the
+            event loop, so that the tabletop can be used right away.
+            Otherwise, everything is placed before this returns.
+      All other keyword arguments are passed to the constructor.
+    Returns:
+      The new Tabletop. """
+    reader = snapshot.SnapshotReader(path)
+    table = cls(grid_size=reader.get_grid_size(), **kwargs)
+
+    # Figure out which cubes are on the screen.
+    x1, y1, x2, y2 = table.__get_spots(table.__canvas.get_visible_region())
+    visible = []
+    hidden = []
+    for i in xrange(reader.get_num_cubes()):
+      x, y = reader.get_pos(i)
+      if (x1 <= x < x2 and y1 <= y < y2):
+        visible.append(i)
+      else:
+        hidden.append(i)
+
+    logger.info("loading %d cubes from %s", reader.get_num_cubes(), path)
+
+    table.__place_from_snapshot(reader, visible)
+    if not lazy:
+      table.__place_from_snapshot(reader, hidden)
+      reader.close()
+      return table
+
+    def place_chunk():
+      chunk = hidden[:cls._LOAD_CHUNK_SIZE]
+      del hidden[:cls._LOAD_CHUNK_SIZE]
+      table.__place_from_snapshot(reader, chunk)
+
+      if hidden:
+        # This has to be scheduled after the chunk is placed, because placing
+        # it updates the canvas, which runs anything that is scheduled.
+        table.__canvas.call_when_idle(place_chunk)
+      else:
+        reader.close()
+        logger.info("finished loading %s", path)
+
+    if hidden:
+      table.__canvas.call_when_idle(place_chunk)
+    else:
+      reader.close()
+
+    return table
+
+  def __place_from_snapshot(self, reader, indices):
+    """ Places cubes from a snapshot.
+    Args:
+      reader: The SnapshotReader to read the cubes from.
+      indices: The indices of the cubes to place. """
+    positions = []
+    colors = []
+    apps = []
+    for i in indices:
+      x, y = reader.get_pos(i)
+      if self.__cubes[y][x] is not None:
+        # The user put something here before we got to it.
+        logger.warning("Not loading cube at (%d, %d), the spot is taken.",
+                       x, y)
+        continue
+
+      positions.append((x, y))
+      colors.append(reader.get_color(i))
+      apps.append(reader.make_app(i))
+
+    self.place_many(positions, apps=apps, colors=colors)
 
   def get_cubes(self):
     #return the list of cubes we have
     return self.__cubes
 
+  def get_cluster_index(self):
+    """
+    Returns:
+      The ClusterIndex that tracks which cubes are connected. """
+    return self.__clusters
+
   def start_app_on_all(self, app_type):
     """ Starts an application on all the cubes.
     Args:
       app_type: The class of the app to start. """
 
-    message = "starting " + str(app_type) + " on all cubes on our tabletop"
-    logger.info(message)
+    logger.info("starting %s on all cubes on our tabletop", app_type)
+
+    for row in self.__cubes:
+      for cube in row:
+        if cube is None:
+          continue
 
-    for cube in self.__cubes:
-      # Make a new instance for this cube.
-      app = app_type()
-      # Run it.
-      cube.run_app(app)
+        # Make a new instance for this cube.
+        app = app_type()
+        # Run it.
+        cube.run_app(app)
+
+  def attach_app_pool(self, pool):
+    """ Makes the tabletop apply everything that apps running in an AppPool do
+    to their cubes, as part of its event loop.
+    Args:
+      pool: The AppPool to attach. """
+    pool.poll_periodically(self.__canvas)
 
   def run(self):
     """ Runs the tabletop simulation indefinitely. """
     self.__canvas.wait_for_events()
 
+  def get_canvas(self):
+    """
+    Returns:
+      The canvas that the tabletop is drawn on. """
+    return self.__canvas
+
   def draw_grid(self):
     """ Creates Line objects for grid
     Returns:
       The list of line objects in the grid."""
     grid = []
-    window_x, window_y = self.__canvas.get_window_size()
-    i = 0
-    while i < window_x:
-      line = Line(self.__canvas, (i, 0), (i, window_y), fill = config.get('COLORS', 'GRID'))
+    size = int(config.get('CUBE', 'CUBE_SIZE'))
+    # Only the part of the grid that is in view gets drawn.
+    left, top, right, bottom = self.__canvas.get_visible_region()
+    left = max(int(left), 0)
+    top = max(int(top), 0)
+    i = left - left % size
+    while i < right:
+      line = Line(self.__canvas, (i, top), (i, bottom), fill = config.get('COLORS', 'GRID'))
       grid.append(line)
-      i += int(config.get('CUBE', 'CUBE_SIZE'))
-    j = 0
-    while j < window_y:
-      line = Line(self.__canvas, (0, j), (window_x, j), fill = config.get('COLORS', 'GRID'))
+      i += size
+    j = top - top % size
+    while j < bottom:
+      line = Line(self.__canvas, (left, j), (right, j), fill = config.get('COLORS', 'GRID'))
       grid.append(line)
-      j += int(config.get('CUBE', 'CUBE_SIZE'))
+      j += size
     return grid
 
   def clear_grid(self):
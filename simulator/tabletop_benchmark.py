@@ -0,0 +1,316 @@
+#!/usr/bin/python
+
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import platform
+import random
+import resource
+import sys
+import time
+
+from virtual_cube import metrics
+import application
+import config
+import cube
+import event
+import tabletop
+import word_app
+
+
+""" Benchmarks how the tabletop scales with the number of cubes. Everything
+runs headless, so no display is needed. Each tabletop size is run in its own
+process, so that the peak memory usage can be measured separately. """
+
+
+# Numbers of cubes to benchmark with.
+_SIZES = (10, 100, 1000, 10000)
+# What fraction of the grid spots should have cubes in them.
+_DENSITY = 0.5
+# How many cubes, out of every so many, send word requests.
+_REQUESTER_INTERVAL = 4
+# Letters to put on the cubes.
+_LETTERS = "ETANS"
+
+# Seed for choosing moves, so they are the same on every run.
+_SEED = 42
+
+
+class _CountingLetter(word_app.WordGameLetter):
+  """ A word game letter that counts how often it is reconfigured. """
+
+  # Total reconfigurations across all the cubes.
+  reconfigurations = 0
+
+  def on_reconfiguration(self, config):
+    _CountingLetter.reconfigurations += 1
+    super(_CountingLetter, self).on_reconfiguration(config)
+
+  def _on_button_press(self, button, timestamp):
+    # Show which button was pressed, like an interactive app would.
+    self.clear_display()
+    self.draw_text(button, (0, 0), 30)
+
+
+class _WordRequester(application.Application):
+  """ Asks the cubes to its right for the word that they spell, like the word
+  game checker does. """
+
+  # Number of words that were received.
+  words_received = 0
+
+  def __init__(self):
+    # Whether there is a cube connected on the right.
+    self.__have_right = False
+
+  def on_reconfiguration(self, config):
+    self.__have_right = config[cube.Cube.Sides.RIGHT] is not None
+
+  def request_word(self):
+    """ Sends a word request, if anything is connected on the right.
+    Returns:
+      True if a request was sent. """
+    if not self.__have_right:
+      return False
+
+    self.send_message(cube.Cube.Sides.RIGHT, {"type": "word"})
+    return True
+
+  def _on_message_receive(self, side, message):
+    if message["type"] == "word_resp":
+      _WordRequester.words_received += 1
+
+
+def _send_event(table, event_type, pos):
+  """ Sends a mouse event to the tabletop, as if the user did it.
+  Args:
+    table: The tabletop.
+    event_type: The event class.
+    pos: Where the mouse is, in window coordinates. """
+  table.get_canvas().inject_event(event_type, pos)
+
+def _get_grid_size(num_cubes):
+  """ Works out how big the grid needs to be.
+  Args:
+    num_cubes: The number of cubes on the tabletop.
+  Returns:
+    The width and height of the grid, in cubes. """
+  spots = int(math.ceil(num_cubes / _DENSITY))
+  width = int(math.ceil(math.sqrt(spots)))
+  height = int(math.ceil(float(spots) / width))
+  return (width, height)
+
+def _get_spot_pos(x, y):
+  """ Gets the pixel position of the center of a grid spot.
+  Args:
+    x: The x index of the spot.
+    y: The y index of the spot.
+  Returns:
+    The position, as (x, y). """
+  size = int(config.get('CUBE', 'CUBE_SIZE'))
+  offset = int(config.get('CUBE', 'GRID_OFFSET'))
+  return (x * size + offset, y * size + offset)
+
+def _rate(count, elapsed):
+  """
+  Args:
+    count: The number of operations.
+    elapsed: How long they took, in seconds.
+  Returns:
+    The number of operations per second. """
+  if not elapsed:
+    return None
+  return count / elapsed
+
+def _get_peak_memory():
+  """
+  Returns:
+    The peak memory usage of this process so far, in KB. """
+  # This is in KB on Linux.
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def run_benchmark(num_cubes, num_moves, num_words, num_views=0,
+                  num_presses=0):
+  """ Runs the benchmark for a single tabletop size.
+  Args:
+    num_cubes: The number of cubes to put on the tabletop.
+    num_moves: The number of cubes to move.
+    num_words: The number of word requests to make.
+    num_views: The number of times to pan or zoom the view.
+    num_presses: The number of buttons to press.
+  Returns:
+    The results. """
+  rand = random.Random(_SEED)
+  registry = metrics.enable()
+  grid_width, grid_height = _get_grid_size(num_cubes)
+
+  # Build the tabletop. Nothing has been freed yet at this point, so the growth
+  # in the peak memory usage is what the cubes use.
+  memory_before = _get_peak_memory()
+  start_time = time.time()
+  table = tabletop.Tabletop(headless=True, grid_size=(grid_width, grid_height))
+  cubes = []
+  requesters = []
+  for i in range(num_cubes):
+    new_cube = table.make_cube()
+    if i % _REQUESTER_INTERVAL == 0:
+      app = _WordRequester()
+      requesters.append(app)
+    else:
+      app = _CountingLetter(_LETTERS[i % len(_LETTERS)])
+    new_cube.run_app(app)
+    cubes.append(new_cube)
+  build_time = time.time() - start_time
+  build_memory = _get_peak_memory() - memory_before
+
+  # Move cubes around, the same way that the user would.
+  reconfigurations_before = _CountingLetter.reconfigurations
+  start_time = time.time()
+  for _ in range(num_moves):
+    moved = rand.choice(cubes)
+    target = _get_spot_pos(rand.randrange(grid_width),
+                           rand.randrange(grid_height))
+
+    _send_event(table, event.MousePressEvent, moved.get_pos())
+    _send_event(table, event.MouseDragEvent, target)
+    _send_event(table, event.MouseReleaseEvent, target)
+  move_time = time.time() - start_time
+  reconfigurations = _CountingLetter.reconfigurations - \
+                     reconfigurations_before
+
+  # Send word requests around.
+  messages_before = registry.get_counter("cube.messages_sent").get_value()
+  start_time = time.time()
+  requests = 0
+  for _ in range(num_words):
+    if rand.choice(requesters).request_word():
+      requests += 1
+  word_time = time.time() - start_time
+  messages = registry.get_counter("cube.messages_sent").get_value() - \
+             messages_before
+
+  # Press buttons on the cubes that are in view, and time how long it takes
+  # until the display has been redrawn.
+  canvas = table.get_canvas()
+  pressable = [pressed for pressed in cubes \
+               if (pressed.get_detail() == cube.Cube.Detail.FULL and \
+                   isinstance(pressed.get_app(), _CountingLetter))]
+  latencies = []
+  for _ in range(num_presses if pressable else 0):
+    pressed = rand.choice(pressable)
+    button = rand.choice(cube.Cube.Buttons.all())
+    pos = canvas.to_window(pressed.get_button_pos(button))
+
+    start_time = time.time()
+    _send_event(table, event.MousePressEvent, pos)
+    _send_event(table, event.MouseReleaseEvent, pos)
+    # The display gets redrawn from the event loop.
+    canvas.update()
+    latencies.append(time.time() - start_time)
+
+  # Pan and zoom around, with the mouse. This happens last, since cubes can
+  # only be moved by the benchmark when the view hasn't changed.
+  window_width, window_height = table.get_canvas().get_window_size()
+  start_time = time.time()
+  for _ in range(num_views):
+    mouse = (rand.randrange(window_width), rand.randrange(window_height))
+    action = rand.randrange(3)
+    if action == 0:
+      _send_event(table, event.ScrollUpEvent, mouse)
+    elif action == 1:
+      _send_event(table, event.ScrollDownEvent, mouse)
+    else:
+      _send_event(table, event.MouseMiddlePressEvent, mouse)
+      _send_event(table, event.MouseMiddleDragEvent,
+                  (rand.randrange(window_width),
+                   rand.randrange(window_height)))
+  view_time = time.time() - start_time
+
+  metrics.disable()
+
+  return {"cubes": num_cubes,
+          "grid_size": [grid_width, grid_height],
+          "build_time": build_time,
+          "cubes_per_s": _rate(num_cubes, build_time),
+          "bytes_per_cube": build_memory * 1024.0 / num_cubes,
+          "moves": num_moves,
+          "moves_per_s": _rate(num_moves, move_time),
+          "reconfigurations_per_move": \
+              float(reconfigurations) / num_moves if num_moves else None,
+          "word_requests": requests,
+          "words_received": _WordRequester.words_received,
+          "word_requests_per_s": _rate(requests, word_time),
+          "messages_per_word": \
+              float(messages) / requests if requests else None,
+          "button_presses": len(latencies),
+          "button_latency_mean": \
+              sum(latencies) / len(latencies) if latencies else None,
+          "button_latency_max": max(latencies) if latencies else None,
+          "view_changes": num_views,
+          "view_changes_per_s": _rate(num_views, view_time),
+          "peak_memory_kb": _get_peak_memory()}
+
+def _run_in_process(results, *args):
+  """ Runs the benchmark, and puts the results on a queue. This is run in a
+  separate process.
+  Args:
+    results: The queue to put the results on.
+    All other arguments are passed to run_benchmark(). """
+  results.put(run_benchmark(*args))
+
+
+def main():
+  parser = argparse.ArgumentParser(
+      description="Benchmarks the tabletop with large numbers of cubes.")
+  parser.add_argument("-o", "--output", default="tabletop_benchmark.json",
+                      help="File to write the results to.")
+  parser.add_argument("-s", "--sizes", type=int, nargs="+", default=_SIZES,
+                      help="Numbers of cubes to benchmark with.")
+  parser.add_argument("-m", "--moves", type=int, default=200,
+                      help="Number of cube moves to make.")
+  parser.add_argument("-w", "--words", type=int, default=200,
+                      help="Number of word requests to make.")
+  parser.add_argument("-v", "--views", type=int, default=200,
+                      help="Number of times to pan or zoom the view.")
+  parser.add_argument("-b", "--presses", type=int, default=200,
+                      help="Number of cube buttons to press.")
+  args = parser.parse_args()
+
+  # Logging every move would dominate the results.
+  logging.disable(logging.INFO)
+
+  results = []
+  for size in args.sizes:
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_in_process,
+                                      args=(queue, size, args.moves,
+                                            args.words, args.views,
+                                            args.presses))
+    process.start()
+    result = queue.get()
+    process.join()
+
+    print "%6d cubes: %8.1f cubes/s, %8.1f moves/s, %8.1f words/s, " \
+          "%8.1f view changes/s, %.2f ms button latency, " \
+          "%.2f reconfigurations/move, %d bytes/cube, %d KB peak" % \
+          (size, result["cubes_per_s"] or 0, result["moves_per_s"] or 0,
+           result["word_requests_per_s"] or 0,
+           result["view_changes_per_s"] or 0,
+           (result["button_latency_mean"] or 0) * 1000,
+           result["reconfigurations_per_move"] or 0,
+           result["bytes_per_cube"], result["peak_memory_kb"])
+    results.append(result)
+
+  with open(args.output, "w") as output:
+    json.dump({"python": platform.python_version(),
+               "time": time.time(),
+               "results": results},
+              output, indent=2, sort_keys=True)
+
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
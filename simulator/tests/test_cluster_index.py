@@ -0,0 +1,93 @@
+import unittest
+
+# The simulator modules import each other by their bare names.
+import config
+from cube import Cube
+import event
+import tabletop
+
+
+class TestClusterIndex(unittest.TestCase):
+  """ Tests for keeping track of clusters as cubes get moved around. """
+
+  def setUp(self):
+    self.__table = tabletop.Tabletop(headless=True, grid_size=(5, 4))
+    self.__index = self.__table.get_cluster_index()
+
+  def __drag(self, moved, x, y):
+    """ Drags a cube to a grid spot with synthetic mouse events.
+    Args:
+      moved: The cube to drag.
+      x: The x index of the spot.
+      y: The y index of the spot. """
+    size = int(config.get("CUBE", "CUBE_SIZE"))
+    offset = int(config.get("CUBE", "GRID_OFFSET"))
+
+    canvas = self.__table.get_canvas()
+    start = canvas.to_window(moved.get_pos())
+    end = canvas.to_window((x * size + offset, y * size + offset))
+
+    canvas.post_event(event.MousePressEvent, start, 0)
+    canvas.post_event(event.MouseDragEvent, end, 16)
+    canvas.post_event(event.MouseReleaseEvent, end, 32)
+    canvas.update()
+
+  def test_separate(self):
+    """ Tests that cubes that aren't next to each other are in different
+    clusters. """
+    cube1, cube2 = self.__table.place_many([(0, 0), (2, 0)])
+
+    self.assertFalse(self.__index.in_same_cluster(cube1, cube2))
+    self.assertEqual(frozenset([cube1]), self.__index.get_cluster(cube1))
+    self.assertEqual(1, self.__index.get_cluster_size(cube2))
+
+  def test_union(self):
+    """ Tests that clusters get merged when a cube links them. """
+    left, right, bridge = self.__table.place_many([(0, 0), (2, 0), (4, 3)])
+    self.assertFalse(self.__index.in_same_cluster(left, right))
+
+    self.__drag(bridge, 1, 0)
+
+    self.assertTrue(self.__index.in_same_cluster(left, right))
+    self.assertEqual(frozenset([left, bridge, right]),
+                     self.__index.get_cluster(right))
+    self.assertEqual([left, bridge, right], self.__index.get_row(bridge))
+    self.assertEqual([bridge], self.__index.get_column(bridge))
+
+  def test_split(self):
+    """ Tests that a cluster gets split when the cube linking it is moved
+    away. """
+    cubes = self.__table.place_many([(0, 1), (1, 1), (2, 1), (1, 0)])
+    left, middle = cubes[:2]
+    self.assertEqual(4, self.__index.get_cluster_size(left))
+
+    self.__drag(middle, 4, 3)
+
+    # Every cube that was attached to the middle one ends up on its own.
+    for cube in cubes:
+      self.assertEqual(frozenset([cube]), self.__index.get_cluster(cube))
+    self.assertEqual([left], self.__index.get_row(left))
+
+  def test_split_still_connected(self):
+    """ Tests that a cluster stays together when a link is broken but the cubes
+    are still connected some other way. """
+    cubes = self.__table.place_many([(0, 0), (1, 0), (0, 1), (1, 1), (2, 1)])
+    top_left, top_right, bottom_left, bottom_right, end = cubes
+
+    # The top right cube is still attached to the rest through the bottom row.
+    self.__drag(end, 4, 3)
+
+    self.assertEqual(frozenset([top_left, top_right, bottom_left,
+                                bottom_right]),
+                     self.__index.get_cluster(top_right))
+    self.assertEqual(frozenset([end]), self.__index.get_cluster(end))
+
+    # Breaking the loop doesn't split it either.
+    self.__drag(top_right, 4, 0)
+    self.assertEqual(3, self.__index.get_cluster_size(top_left))
+    below = top_left.get_connections()[Cube.Sides.BOTTOM]
+    self.assertEqual([bottom_left, bottom_right], self.__index.get_row(below))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+
+# The simulator modules import each other by their bare names.
+import codec
+
+
+class TestBinaryCodec(unittest.TestCase):
+  """ Tests for the binary codec. """
+
+  def setUp(self):
+    self.__codec = codec.BinaryCodec()
+
+  def test_wire_format(self):
+    """ Tests that items are encoded the same way as MessagePack. """
+    self.assertEqual("\xc0", self.__codec.encode(None))
+    self.assertEqual("\xc3", self.__codec.encode(True))
+    self.assertEqual("\xc2", self.__codec.encode(False))
+
+    # Small integers fit in the tag.
+    self.assertEqual("\x00", self.__codec.encode(0))
+    self.assertEqual("\x7f", self.__codec.encode(127))
+    self.assertEqual("\xff", self.__codec.encode(-1))
+    self.assertEqual("\xe0", self.__codec.encode(-32))
+    # Everything else is a 64-bit integer.
+    self.assertEqual("\xd3\x00\x00\x00\x00\x00\x00\x00\x80",
+                     self.__codec.encode(128))
+    self.assertEqual("\xd3\xff\xff\xff\xff\xff\xff\xff\xdf",
+                     self.__codec.encode(-33))
+
+    self.assertEqual("\xcb\x3f\xf8\x00\x00\x00\x00\x00\x00",
+                     self.__codec.encode(1.5))
+
+    # Short strings and containers store their length in the tag.
+    self.assertEqual("\xa2hi", self.__codec.encode("hi"))
+    self.assertEqual("\xa2\xc3\xa9", self.__codec.encode(u"\xe9"))
+    self.assertEqual("\x92\x01\x02", self.__codec.encode([1, 2]))
+    self.assertEqual("\x92\x01\x02", self.__codec.encode((1, 2)))
+    self.assertEqual("\x81\xa1a\x01", self.__codec.encode({"a": 1}))
+
+    # Longer ones have a 32-bit length.
+    self.assertEqual("\xdb\x00\x00\x00\x20" + "a" * 32,
+                     self.__codec.encode("a" * 32))
+    self.assertEqual("\xdd\x00\x00\x00\x10" + "\x00" * 16,
+                     self.__codec.encode([0] * 16))
+
+  def test_round_trip(self):
+    """ Tests that messages decode to what was encoded. """
+    message = {"type": "word", "letters": ["c", "a", "t"], "count": 3,
+               "big": -2 ** 63, "ratio": 0.25, "done": False, "extra": None,
+               "nested": {"list": range(20), "text": "x" * 40}}
+
+    decoded = self.__codec.decode(self.__codec.encode(message))
+    self.assertEqual(message, decoded)
+    # Strings always come back as unicode.
+    self.assertIsInstance(decoded["type"], unicode)
+
+  def test_big_integers(self):
+    """ Tests that integers that don't fit in 64 bits are rejected. """
+    self.assertEqual(2 ** 63 - 1,
+                     self.__codec.decode(self.__codec.encode(2 ** 63 - 1)))
+
+    for item in (2 ** 63, 2 ** 64, -2 ** 63 - 1, -2 ** 70):
+      with self.assertRaises(ValueError):
+        self.__codec.encode(item)
+      with self.assertRaises(ValueError):
+        self.__codec.encode({"value": [item]})
+
+  def test_unsupported_types(self):
+    """ Tests that items of other types are rejected. """
+    with self.assertRaises(TypeError):
+      self.__codec.encode(set([1]))
+    with self.assertRaises(TypeError):
+      self.__codec.encode([object()])
+
+  def test_bad_data(self):
+    """ Tests that invalid data is rejected. """
+    with self.assertRaises(ValueError):
+      self.__codec.decode("\x01\x02")
+    with self.assertRaises(ValueError):
+      self.__codec.decode("\xc1")
+
+  def test_truncated(self):
+    """ Tests that data which ends in the middle of an item is rejected. """
+    for data in ("", "\xd3\x00", "\x92\x01", "\xa5hi", "\xdb\x00\x00",
+                 "\xcb\x00", "\x81\x01"):
+      with self.assertRaises(ValueError) as context:
+        self.__codec.decode(data)
+      self.assertEqual("Truncated message.", str(context.exception))
+
+
+class TestCodecs(unittest.TestCase):
+  """ Tests for the other codecs and negotiation. """
+
+  def test_local_aliasing(self):
+    """ Tests that the local codec passes the very same object through. """
+    local = codec.LocalCodec()
+    message = {"letters": ["c", "a", "t"]}
+
+    decoded = local.decode(local.encode(message))
+    self.assertIs(message, decoded)
+    # Changes made by the sender show up for the receiver.
+    message["letters"].append("s")
+    self.assertEqual(["c", "a", "t", "s"], decoded["letters"])
+
+  def test_json(self):
+    """ Tests that the JSON codec encodes compactly and round-trips. """
+    json_codec = codec.JsonCodec()
+    self.assertEqual('{"a":[1,2]}', json_codec.encode({"a": [1, 2]}))
+    self.assertEqual({"a": [1, 2]}, json_codec.decode('{"a":[1,2]}'))
+
+  def test_get_codec(self):
+    """ Tests that codecs can be looked up by name. """
+    for codec_class in (codec.JsonCodec, codec.LocalCodec, codec.BinaryCodec):
+      self.assertIsInstance(codec.get_codec(codec_class.NAME), codec_class)
+
+    with self.assertRaises(ValueError):
+      codec.get_codec("pickle")
+
+  def test_negotiate(self):
+    """ Tests that the sender's preference wins. """
+    ours = (codec.LocalCodec.NAME, codec.BinaryCodec.NAME,
+            codec.JsonCodec.NAME)
+
+    chosen = codec.negotiate(ours, (codec.JsonCodec.NAME,
+                                    codec.BinaryCodec.NAME))
+    self.assertIsInstance(chosen, codec.BinaryCodec)
+    # The same result should come back the second time.
+    self.assertIs(chosen, codec.negotiate(ours, (codec.JsonCodec.NAME,
+                                                 codec.BinaryCodec.NAME)))
+
+    chosen = codec.negotiate(ours, (codec.JsonCodec.NAME,))
+    self.assertIsInstance(chosen, codec.JsonCodec)
+
+  def test_negotiate_no_common(self):
+    """ Tests that negotiation fails when there is no common codec. """
+    with self.assertRaises(ValueError):
+      codec.negotiate((codec.LocalCodec.NAME,), (codec.JsonCodec.NAME,))
+
+
+if __name__ == "__main__":
+  unittest.main()
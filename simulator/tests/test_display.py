@@ -0,0 +1,69 @@
+import mock
+import unittest
+
+# The simulator modules import each other by their bare names.
+import application
+import config
+import tabletop
+
+
+def _use_backend(backend):
+  """ Makes new displays use a particular backend.
+  Args:
+    backend: The name of the backend.
+  Returns:
+    The patcher, which has already been started. """
+  real_get = config.get
+
+  def get(section, attribute):
+    if (section, attribute) == ("CUBE", "DISPLAY_BACKEND"):
+      return backend
+    return real_get(section, attribute)
+
+  patcher = mock.patch("config.get", side_effect=get)
+  patcher.start()
+  return patcher
+
+
+class TestShapes(unittest.TestCase):
+  """ Tests for drawing shapes from apps. """
+
+  def __place(self, backend):
+    """ Places a cube with the display backend.
+    Args:
+      backend: The name of the backend.
+    Returns:
+      The cube, and the app running on it. """
+    self.addCleanup(_use_backend(backend).stop)
+
+    table = tabletop.Tabletop(headless=True, grid_size=(2, 1))
+    app = application.Application()
+    cube, = table.place_many([(0, 0)], apps=[app])
+    return cube, app
+
+  def test_framebuffer(self):
+    """ Tests that shapes get drawn with the framebuffer backend. """
+    cube, app = self.__place("framebuffer")
+    framebuffer = cube.get_display().get_framebuffer()
+    width, height = framebuffer.get_size()
+
+    # Positions are relative to the center of the screen.
+    app.draw_rect((-width // 4, 0), (4, 4), "#ff0000")
+    app.draw_oval((width // 4, 0), (5, 5), "#00ff00")
+
+    pixels = framebuffer.get_pixels()
+    self.assertEqual([0xff, 0, 0], list(pixels[height // 2, width // 4]))
+    self.assertEqual([0, 0xff, 0], list(pixels[height // 2, width * 3 // 4]))
+
+  def test_vector(self):
+    """ Tests that the vector backend refuses to draw shapes. """
+    _, app = self.__place("vector")
+
+    with self.assertRaises(NotImplementedError):
+      app.draw_rect((0, 0), (4, 4), "#ff0000")
+    with self.assertRaises(NotImplementedError):
+      app.draw_oval((0, 0), (4, 4), "#ff0000")
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,185 @@
+import unittest
+
+# The simulator modules import each other by their bare names.
+import application
+import config
+import event
+import routing
+import tabletop
+from cube import Cube
+
+
+class _Recorder(application.Application):
+  """ App that remembers the reconfigurations and routed messages that it
+  gets. """
+
+  def __init__(self):
+    # The configurations from every reconfiguration.
+    self.configs = []
+    # The routed messages, as tuples of the source cube ID and the message.
+    self.routed = []
+
+  def on_reconfiguration(self, config):
+    self.configs.append(config)
+
+  def _on_routed_message_receive(self, source_id, message):
+    self.routed.append((source_id, message))
+
+
+class TestRouting(unittest.TestCase):
+  """ Tests for routing messages between cubes, and for telling apps about
+  changes in the topology. """
+
+  def setUp(self):
+    self.__table = tabletop.Tabletop(headless=True, grid_size=(4, 3))
+    routing.get_stats().reset()
+
+  def __drag(self, moved, x, y):
+    """ Drags a cube to a grid spot with synthetic mouse events.
+    Args:
+      moved: The cube to drag.
+      x: The x index of the spot.
+      y: The y index of the spot. """
+    size = int(config.get("CUBE", "CUBE_SIZE"))
+    offset = int(config.get("CUBE", "GRID_OFFSET"))
+
+    canvas = self.__table.get_canvas()
+    start = canvas.to_window(moved.get_pos())
+    end = canvas.to_window((x * size + offset, y * size + offset))
+
+    canvas.post_event(event.MousePressEvent, start, 0)
+    canvas.post_event(event.MouseDragEvent, end, 16)
+    canvas.post_event(event.MouseReleaseEvent, end, 32)
+    canvas.update()
+
+  def __place(self, positions):
+    """ Places cubes that run _Recorders.
+    Args:
+      positions: The x and y indices of the cubes.
+    Returns:
+      The cubes, in the same order. """
+    apps = [_Recorder() for _ in positions]
+    return self.__table.place_many(positions, apps=apps)
+
+  def test_hops(self):
+    """ Tests that routing tables find the shortest paths. """
+    # A ring around the middle spot, with a tail sticking out of it.
+    positions = [(0, 0), (1, 0), (2, 0), (2, 1), (2, 2), (1, 2), (0, 2),
+                 (0, 1), (3, 2)]
+    cubes = self.__place(positions)
+    source = cubes[0]
+    table = routing.RoutingTable(source)
+
+    expected_hops = [0, 1, 2, 3, 4, 3, 2, 1, 5]
+    for cube, hops in zip(cubes, expected_hops):
+      self.assertEqual(hops, table.get_hops(cube.get_id()))
+    self.assertEqual(set(cube.get_id() for cube in cubes),
+                     set(table.get_reachable()))
+
+    # Going around the ring either way is just as short, but the first hop has
+    # to be along one of them.
+    self.assertEqual(Cube.Sides.RIGHT, table.get_next_side(cubes[2].get_id()))
+    self.assertEqual(Cube.Sides.BOTTOM,
+                     table.get_next_side(cubes[6].get_id()))
+
+    # Messages should take the shortest path too.
+    source.get_app().send_routed_message(cubes[8].get_id(), {"value": 1})
+    self.assertEqual([(source.get_id(), {"value": 1})],
+                     cubes[8].get_app().routed)
+    self.assertEqual(1, routing.get_stats().get_delivered())
+    self.assertEqual(5, routing.get_stats().get_max_hops())
+
+  def test_unreachable(self):
+    """ Tests that routing to a cube that isn't connected fails. """
+    cubes = self.__place([(0, 0), (1, 0), (3, 0)])
+    table = routing.RoutingTable(cubes[0])
+    self.assertIsNone(table.get_hops(cubes[2].get_id()))
+    self.assertIsNone(table.get_next_side(cubes[2].get_id()))
+
+    with self.assertRaises(ValueError):
+      cubes[0].get_app().send_routed_message(cubes[2].get_id(), {})
+
+  def test_broken_link(self):
+    """ Tests that routes get updated when a link is broken. """
+    cubes = self.__place([(0, 0), (1, 0), (2, 0)])
+    sender = cubes[0].get_app()
+    sender.send_routed_message(cubes[2].get_id(), "before")
+    self.assertEqual([(cubes[0].get_id(), "before")],
+                     cubes[2].get_app().routed)
+
+    # Moving the middle cube away breaks the only path.
+    self.__drag(cubes[1], 3, 2)
+
+    with self.assertRaises(ValueError):
+      sender.send_routed_message(cubes[2].get_id(), "after")
+    self.assertEqual(1, len(cubes[2].get_app().routed))
+
+  def test_one_reconfiguration_per_move(self):
+    """ Tests that every cube affected by a move finds out about it exactly
+    once. """
+    left, right, moved, bystander = self.__place([(0, 0), (2, 0), (3, 2),
+                                                  (0, 2)])
+    for cube in (left, right, moved, bystander):
+      del cube.get_app().configs[:]
+
+    # Filling the gap links the moved cube to two others at once.
+    self.__drag(moved, 1, 0)
+
+    moved_configs = moved.get_app().configs
+    self.assertEqual(1, len(moved_configs))
+    self.assertEqual({Cube.Sides.LEFT: left, Cube.Sides.RIGHT: right},
+                     moved_configs[0].added)
+    self.assertEqual({}, moved_configs[0].removed)
+
+    for neighbor, side in ((left, Cube.Sides.RIGHT), (right, Cube.Sides.LEFT)):
+      configs = neighbor.get_app().configs
+      self.assertEqual(1, len(configs))
+      self.assertEqual({side: moved}, configs[0].added)
+    self.assertEqual([], bystander.get_app().configs)
+
+    # Moving it from one place to another breaks and makes links in the same
+    # move.
+    for cube in (left, right, moved):
+      del cube.get_app().configs[:]
+    self.__drag(moved, 0, 1)
+
+    moved_configs = moved.get_app().configs
+    self.assertEqual(1, len(moved_configs))
+    self.assertEqual({Cube.Sides.TOP: left, Cube.Sides.BOTTOM: bystander},
+                     moved_configs[0].added)
+    self.assertEqual({Cube.Sides.LEFT: left, Cube.Sides.RIGHT: right},
+                     moved_configs[0].removed)
+
+    for cube in (left, right, bystander):
+      self.assertEqual(1, len(cube.get_app().configs))
+
+  def test_place_many_adjacency(self):
+    """ Tests that cubes placed all at once get linked to their neighbors, and
+    that each app only finds out once. """
+    positions = [(0, 0), (1, 0), (0, 1), (1, 1), (3, 1)]
+    cubes = self.__place(positions)
+    top_left, top_right, bottom_left, bottom_right, alone = cubes
+
+    expected = {top_left: {Cube.Sides.RIGHT: top_right,
+                           Cube.Sides.BOTTOM: bottom_left},
+                top_right: {Cube.Sides.LEFT: top_left,
+                            Cube.Sides.BOTTOM: bottom_right},
+                bottom_left: {Cube.Sides.TOP: top_left,
+                              Cube.Sides.RIGHT: bottom_right},
+                bottom_right: {Cube.Sides.TOP: top_right,
+                               Cube.Sides.LEFT: bottom_left},
+                alone: {}}
+    for cube, neighbors in expected.iteritems():
+      connected = dict((side, other) for side, other in \
+                       cube.get_connections().iteritems() if other is not None)
+      self.assertEqual(neighbors, connected)
+
+      configs = cube.get_app().configs
+      self.assertLessEqual(len(configs), 1)
+      if neighbors:
+        self.assertEqual(1, len(configs))
+        self.assertEqual(neighbors, configs[0].added)
+
+
+if __name__ == "__main__":
+  unittest.main()
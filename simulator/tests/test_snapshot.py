@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+# The simulator modules import each other by their bare names.
+import app_pool
+import application
+import tabletop
+import word_app
+
+
+class _CounterApp(application.Application):
+  """ App with constructor arguments and state that need to be saved. """
+
+  def __init__(self, step):
+    """
+    Args:
+      step: How much to count by. """
+    self.step = step
+    self.count = 0
+
+  def get_init_args(self):
+    return (self.step,)
+
+  def get_state(self):
+    return self.count
+
+  def set_state(self, state):
+    self.count = state
+
+
+class TestSnapshot(unittest.TestCase):
+  """ Tests for saving and loading tabletops. """
+
+  def setUp(self):
+    self.__temp_dir = tempfile.mkdtemp()
+    self.__path = os.path.join(self.__temp_dir, "table.snap")
+
+    self.__table = tabletop.Tabletop(headless=True, grid_size=(4, 3))
+
+  def tearDown(self):
+    shutil.rmtree(self.__temp_dir)
+
+  def __load(self):
+    """ Loads the saved tabletop.
+    Returns:
+      The grid of cubes from the loaded tabletop. """
+    loaded = tabletop.Tabletop.load(self.__path, lazy=False, headless=True)
+
+    grid = loaded.get_cubes()
+    self.assertEqual(3, len(grid))
+    self.assertEqual(4, len(grid[0]))
+    return grid
+
+  def test_round_trip(self):
+    """ Tests that cubes and their apps survive saving and loading. """
+    counter = _CounterApp(3)
+    counter.count = 12
+    self.__table.place_many([(0, 0), (1, 0), (3, 2)],
+                            apps=[word_app.WordGameLetter("C"), counter, None],
+                            colors=["#111111", "#222222", "#333333"])
+    self.__table.save(self.__path)
+
+    grid = self.__load()
+    letter_cube = grid[0][0]
+    counter_cube = grid[0][1]
+    empty_cube = grid[2][3]
+    self.assertEqual(3, sum(1 for row in grid for cube in row if cube))
+
+    self.assertEqual("#111111", letter_cube.get_color())
+    self.assertIsInstance(letter_cube.get_app(), word_app.WordGameLetter)
+    self.assertEqual("C", letter_cube.get_app().get_letter())
+
+    self.assertEqual("#222222", counter_cube.get_color())
+    loaded_counter = counter_cube.get_app()
+    self.assertIsInstance(loaded_counter, _CounterApp)
+    self.assertEqual(3, loaded_counter.step)
+    self.assertEqual(12, loaded_counter.count)
+
+    self.assertEqual("#333333", empty_cube.get_color())
+    self.assertIsNone(empty_cube.get_app())
+
+    # Cubes next to each other should be connected again.
+    connections = letter_cube.get_connections()
+    self.assertIs(counter_cube, connections["right"])
+
+  def test_pool_app(self):
+    """ Tests that the real app gets saved for cubes whose app runs in an app
+    pool. """
+    pool = app_pool.AppPool(1)
+    try:
+      pool_cube, = self.__table.place_many([(2, 1)])
+      pool.run_app(pool_cube, word_app.WordGameLetter("S"))
+      self.assertIsInstance(pool_cube.get_app(), app_pool.RemoteApplication)
+
+      self.__table.save(self.__path)
+    finally:
+      pool.shutdown()
+
+    grid = self.__load()
+    loaded_app = grid[1][2].get_app()
+    self.assertIsInstance(loaded_app, word_app.WordGameLetter)
+    self.assertEqual("S", loaded_app.get_letter())
+
+  def test_not_snapshot(self):
+    """ Tests that other files are rejected. """
+    with open(self.__path, "wb") as bad_file:
+      bad_file.write("not a snapshot")
+
+    with self.assertRaises(ValueError):
+      tabletop.Tabletop.load(self.__path, headless=True)
+
+
+if __name__ == "__main__":
+  unittest.main()
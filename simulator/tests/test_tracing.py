@@ -0,0 +1,221 @@
+import mock
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+# The simulator modules import each other by their bare names.
+import app_pool
+import application
+import config
+import event
+import tabletop
+import tracing
+import word_app
+
+
+class _SetSender(application.Application):
+  """ App that sends its neighbors messages that can't be converted to JSON. """
+
+  def on_reconfiguration(self, config):
+    for side in config.added:
+      self.send_message(side, set([1, 2]))
+
+
+class _Counter(application.Application):
+  """ App with constructor arguments and state that need to be recorded. """
+
+  def __init__(self, step):
+    """
+    Args:
+      step: How much to count by. """
+    self.step = step
+    self.count = 0
+
+  def get_init_args(self):
+    return (self.step,)
+
+  def get_state(self):
+    return self.count
+
+  def set_state(self, state):
+    self.count = state
+
+
+class _Unreplayable(application.Application):
+  """ App that can't be recreated, like the ones that run on VMs. """
+
+  def get_app_class(self):
+    return None
+
+  def on_reconfiguration(self, config):
+    for side in config.added:
+      self.send_message(side, {"type": "hello"})
+
+
+class TestTracing(unittest.TestCase):
+  """ Tests for recording and replaying traces. """
+
+  # Size of the grid that cubes get moved around on.
+  _GRID_SIZE = (6, 3)
+
+  def setUp(self):
+    self.__temp_dir = tempfile.mkdtemp()
+    self.__table = tabletop.Tabletop(headless=True, grid_size=self._GRID_SIZE)
+
+    # The word game pauses to show when a word is right.
+    self.__sleep_patcher = mock.patch("time.sleep")
+    self.__sleep_patcher.start()
+
+  def tearDown(self):
+    self.__sleep_patcher.stop()
+    tracing.stop_recording()
+    shutil.rmtree(self.__temp_dir)
+
+  def __drag(self, moved, x, y):
+    """ Drags a cube to a grid spot with synthetic mouse events.
+    Args:
+      moved: The cube to drag.
+      x: The x index of the spot.
+      y: The y index of the spot. """
+    size = int(config.get("CUBE", "CUBE_SIZE"))
+    offset = int(config.get("CUBE", "GRID_OFFSET"))
+
+    canvas = self.__table.get_canvas()
+    start = canvas.to_window(moved.get_pos())
+    end = canvas.to_window((x * size + offset, y * size + offset))
+
+    canvas.post_event(event.MousePressEvent, start, 0)
+    canvas.post_event(event.MouseDragEvent, end, 16)
+    canvas.post_event(event.MouseReleaseEvent, end, 32)
+    canvas.update()
+
+  def __check_round_trip(self, compress):
+    """ Records the word game while cubes get moved around, and checks that the
+    trace can be read while it's being written, and replays the same way.
+    Args:
+      compress: Whether to compress the trace. """
+    path = os.path.join(self.__temp_dir, "game.trace")
+    recorder = tracing.start_recording(path, compress=compress)
+
+    cubes = self.__table.place_many([(0, 0), (1, 0), (2, 0), (3, 0)])
+    for letter_cube, letter in zip(cubes, "CAT"):
+      letter_cube.run_app(word_app.WordGameLetter(letter))
+    cubes[3].run_app(word_app.WordGameChecker())
+
+    rand = random.Random(0)
+    width, height = self._GRID_SIZE
+    for _ in range(40):
+      self.__drag(rand.choice(cubes), rand.randrange(width),
+                  rand.randrange(height))
+
+    # It should be possible to read everything while the trace is still open.
+    recorder.flush()
+    reader = tracing.TraceReader(path)
+    self.assertEqual(recorder.get_records(), len(list(reader)))
+    reader.close()
+
+    tracing.stop_recording()
+
+    replayer = tracing.TraceReplayer(path)
+    replayer.replay()
+
+    self.assertEqual(recorder.get_records(), replayer.get_records())
+    self.assertEqual([], replayer.get_mismatches())
+
+  def test_round_trip(self):
+    """ Tests that a normal trace replays the same way. """
+    self.__check_round_trip(False)
+
+  def test_compressed_round_trip(self):
+    """ Tests that a compressed trace replays the same way. """
+    self.__check_round_trip(True)
+
+  def test_opaque_messages(self):
+    """ Tests that local messages that can't be converted to JSON don't break
+    recording. """
+    path = os.path.join(self.__temp_dir, "opaque.trace")
+    tracing.start_recording(path)
+
+    cubes = self.__table.place_many([(0, 0), (2, 0)])
+    for sender in cubes:
+      sender.run_app(_SetSender())
+    self.__drag(cubes[1], 1, 0)
+
+    tracing.stop_recording()
+
+    reader = tracing.TraceReader(path)
+    sends = [fields for _, record_type, _, fields in reader \
+             if record_type == tracing.RecordTypes.SEND]
+    reader.close()
+    self.assertEqual(2, len(sends))
+    for _, message, codec_name in sends:
+      self.assertEqual("", message)
+      self.assertEqual(tracing._OPAQUE_CODEC, codec_name)
+
+    replayer = tracing.TraceReplayer(path)
+    replayer.replay()
+    self.assertEqual([], replayer.get_mismatches())
+
+  def test_app_state(self):
+    """ Tests that apps get replayed with the arguments and state that they had
+    originally. """
+    path = os.path.join(self.__temp_dir, "state.trace")
+    tracing.start_recording(path)
+
+    counter = _Counter(3)
+    counter.count = 12
+    counter_cube, = self.__table.place_many([(0, 0)])
+    counter_cube.run_app(counter)
+
+    tracing.stop_recording()
+
+    replayer = tracing.TraceReplayer(path)
+    replayer.replay()
+    replayed = replayer.get_app(counter_cube.get_id())
+    self.assertIsInstance(replayed, _Counter)
+    self.assertEqual(3, replayed.step)
+    self.assertEqual(12, replayed.count)
+
+  def test_pool_app(self):
+    """ Tests that the real app gets replayed for cubes whose app ran in an app
+    pool. """
+    path = os.path.join(self.__temp_dir, "pool.trace")
+    tracing.start_recording(path)
+
+    pool = app_pool.AppPool(1)
+    try:
+      pool_cube, = self.__table.place_many([(0, 0)])
+      pool.run_app(pool_cube, word_app.WordGameLetter("S"))
+    finally:
+      pool.shutdown()
+    tracing.stop_recording()
+
+    replayer = tracing.TraceReplayer(path)
+    replayer.replay()
+    replayed = replayer.get_app(pool_cube.get_id())
+    self.assertIsInstance(replayed, word_app.WordGameLetter)
+    self.assertEqual("S", replayed.get_letter())
+
+  def test_unreplayable_app(self):
+    """ Tests that cubes whose apps can't be recreated are skipped. """
+    path = os.path.join(self.__temp_dir, "skipped.trace")
+    tracing.start_recording(path)
+
+    cubes = self.__table.place_many([(0, 0), (2, 0)])
+    cubes[0].run_app(_Unreplayable())
+    cubes[1].run_app(_SetSender())
+    self.__drag(cubes[1], 1, 0)
+
+    tracing.stop_recording()
+
+    replayer = tracing.TraceReplayer(path)
+    replayer.replay()
+    with self.assertRaises(KeyError):
+      replayer.get_app(cubes[0].get_id())
+    self.assertEqual([], replayer.get_mismatches())
+
+
+if __name__ == "__main__":
+  unittest.main()
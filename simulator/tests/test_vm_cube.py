@@ -0,0 +1,173 @@
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+from apps.libmc.sim.protobuf import cube_message_pb2
+from apps.libmc.sim.protobuf import sim_message_pb2
+from virtual_cube import shm_framebuffer
+
+# The simulator modules import each other by their bare names.
+import application
+import codec
+import config
+import tabletop
+
+
+class _Receiver(application.Application):
+  """ App that remembers the messages it gets, and fails on some of them. """
+
+  def __init__(self):
+    self.received = []
+
+  def _on_message_receive(self, side, message):
+    if message.get("fail"):
+      raise RuntimeError("Failing on purpose.")
+    self.received.append(message)
+
+
+def _make_cube_message(data, codec_name=codec.JsonCodec.NAME):
+  """ Makes a message that the VM sends to its right neighbor.
+  Args:
+    data: The serialized message.
+    codec_name: The name of the codec that it was encoded with.
+  Returns:
+    The SimMessage. """
+  message = sim_message_pb2.SimMessage()
+  message.cube_message.side = cube_message_pb2.RIGHT
+  message.cube_message.codec = codec_name
+  message.cube_message.data = data
+  return message
+
+
+class TestVmCube(unittest.TestCase):
+  """ Tests for cubes that are backed by VMs. """
+
+  def setUp(self):
+    self.__table = tabletop.Tabletop(headless=True, grid_size=(3, 1))
+
+    # We don't want to actually talk to a VM.
+    self.__link_patcher = mock.patch("vm_cube.vm_link.VmLink")
+    self.__link = self.__link_patcher.start().return_value
+    self.__link.get_messages.return_value = []
+
+    # Polling is scheduled through the event loop, which we run by hand.
+    self.__call_later = mock.patch.object(self.__table.get_canvas(),
+                                          "call_later").start()
+
+    self.__vm_cube = self.__table.make_vm_cube(mock.Mock())
+    self.__receiver = _Receiver()
+    self.__table.place_many([(1, 0)], apps=[self.__receiver])
+
+  def tearDown(self):
+    mock.patch.stopall()
+
+  def test_bad_messages_dropped(self):
+    """ Tests that messages which can't be delivered don't stop the ones after
+    them from getting through. """
+    self.__link.get_messages.return_value = [
+        # Truncated, so it can't be decoded.
+        _make_cube_message("\x92\x01", codec.BinaryCodec.NAME),
+        # The neighbor's handler fails on this one.
+        _make_cube_message('{"fail": true}'),
+        _make_cube_message('{"value": 1}')]
+
+    self.assertEqual(3, self.__vm_cube.poll())
+    self.assertEqual([{"value": 1}], self.__receiver.received)
+
+  def test_poll_periodically_reschedules(self):
+    """ Tests that polling keeps going after something goes wrong. """
+    self.__call_later.reset_mock()
+    self.__link.get_messages.side_effect = RuntimeError("Failing on purpose.")
+
+    with self.assertRaises(RuntimeError):
+      self.__vm_cube.poll_periodically()
+
+    self.assertEqual(1, self.__call_later.call_count)
+    interval, callback = self.__call_later.call_args[0]
+    self.assertEqual(10, interval)
+
+    # The next poll works again.
+    self.__link.get_messages.side_effect = None
+    self.__link.get_messages.return_value = [
+        _make_cube_message('{"value": 2}')]
+    callback()
+    self.assertEqual([{"value": 2}], self.__receiver.received)
+
+
+class TestVmCubeMirroring(unittest.TestCase):
+  """ Tests for showing what the VM draws in its framebuffer. """
+
+  def setUp(self):
+    self.__temp_dir = tempfile.mkdtemp()
+    self.__path = os.path.join(self.__temp_dir, "cube_fb")
+
+    # Mirroring only works with the framebuffer display backend.
+    real_get = config.get
+    def get(section, attribute):
+      if (section, attribute) == ("CUBE", "DISPLAY_BACKEND"):
+        return "framebuffer"
+      return real_get(section, attribute)
+    mock.patch("config.get", side_effect=get).start()
+
+    link = mock.patch("vm_cube.vm_link.VmLink").start().return_value
+    link.get_messages.return_value = []
+
+    table = tabletop.Tabletop(headless=True, grid_size=(1, 1))
+    mock.patch.object(table.get_canvas(), "call_later").start()
+
+    self.__vm = mock.Mock()
+    self.__vm.open_framebuffer.side_effect = self.__open_framebuffer
+    self.__vm_cube = table.make_vm_cube(self.__vm)
+    self.__screen = self.__vm_cube.get_display().get_framebuffer()
+
+  def tearDown(self):
+    mock.patch.stopall()
+    shutil.rmtree(self.__temp_dir)
+
+  def __open_framebuffer(self):
+    """ Opens the framebuffer like CubeVm does. """
+    return shm_framebuffer.ShmFramebufferReader(self.__path)
+
+  def test_no_header(self):
+    """ Tests that nothing is shown until the VM writes the framebuffer
+    header. """
+    # The file exists as soon as the VM starts, but it's empty.
+    with open(self.__path, "wb") as framebuffer_file:
+      framebuffer_file.write("\x00" * shm_framebuffer.get_region_size((2, 2)))
+    before = bytearray(self.__screen.get_pixels())
+
+    self.__vm_cube.poll()
+    self.assertEqual(before, bytearray(self.__screen.get_pixels()))
+
+    # Once it's set up, it should start showing up.
+    width, height = self.__screen.get_size()
+    writer = shm_framebuffer.ShmFramebufferWriter(self.__path, (width, height))
+    writer.write_region(1, 2, 1, 1, "\x01\x02\x03")
+    writer.close()
+
+    self.__vm_cube.poll()
+    self.assertEqual([1, 2, 3], list(self.__screen.get_pixels()[2, 1]))
+
+    # Once it's open, it doesn't get opened again. The first try was when the
+    # cube was made, before the file existed.
+    self.__vm_cube.poll()
+    self.assertEqual(3, self.__vm.open_framebuffer.call_count)
+
+  def test_wrong_size(self):
+    """ Tests that a framebuffer that doesn't match the display is ignored. """
+    writer = shm_framebuffer.ShmFramebufferWriter(self.__path, (2, 2))
+    writer.write_region(0, 0, 1, 1, "\x01\x02\x03")
+    writer.close()
+    before = bytearray(self.__screen.get_pixels())
+
+    self.__vm_cube.poll()
+    self.__vm_cube.poll()
+    self.assertEqual(before, bytearray(self.__screen.get_pixels()))
+    # It was tried when the cube was made, and then given up on.
+    self.assertEqual(2, self.__vm.open_framebuffer.call_count)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,71 @@
+import mock
+import unittest
+
+# The simulator modules import each other by their bare names.
+import application
+import tabletop
+import word_app
+
+
+class _RemoteLetter(application.Application):
+  """ Stands in for a letter that runs somewhere else, so all we can do is send
+  it messages. """
+
+  def __init__(self, letter):
+    """
+    Args:
+      letter: The letter to answer word requests with. """
+    self.__letter = letter
+
+  def _on_message_receive(self, side, message):
+    if message["type"] == "word":
+      self.send_message(side, {"type": "word_resp", "word": self.__letter})
+
+
+class TestWordApp(unittest.TestCase):
+  """ Tests for the word game. """
+
+  def setUp(self):
+    self.__table = tabletop.Tabletop(headless=True, grid_size=(5, 2))
+
+    # The checker pauses to show when a word is right.
+    self.__sleep_patcher = mock.patch("time.sleep")
+    self.__sleep_patcher.start()
+
+  def tearDown(self):
+    self.__sleep_patcher.stop()
+
+  def __check(self, apps):
+    """ Puts a word together and connects a checker to the end of it.
+    Args:
+      apps: The apps to run on the cubes in the word, from left to right.
+    Returns:
+      The text that the checker ended up displaying. """
+    positions = [(x, 0) for x in range(len(apps) + 1)]
+    checker = word_app.WordGameChecker()
+
+    with mock.patch.object(checker, "draw_text") as draw_text:
+      self.__table.place_many(positions, apps=apps + [checker])
+
+      return draw_text.call_args[0][0]
+
+  def test_local_letters(self):
+    """ Tests checking a word made of letters that run locally. """
+    letters = [word_app.WordGameLetter(letter) for letter in "TEN"]
+    self.assertEqual("GOOD", self.__check(letters))
+
+  def test_bad_word(self):
+    """ Tests checking something that isn't a word. """
+    letters = [word_app.WordGameLetter(letter) for letter in "NTE"]
+    self.assertEqual("BAD", self.__check(letters))
+
+  def test_remote_letter(self):
+    """ Tests that letters which don't run locally still count. """
+    # This doesn't pass requests on, so it has to be at the end of the word.
+    letters = [_RemoteLetter("T"), word_app.WordGameLetter("E"),
+               word_app.WordGameLetter("N")]
+    self.assertEqual("GOOD", self.__check(letters))
+
+
+if __name__ == "__main__":
+  unittest.main()
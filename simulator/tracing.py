@@ -0,0 +1,780 @@
+import importlib
+import logging
+import struct
+import time
+import zlib
+
+import codec
+import cube
+
+
+logger = logging.getLogger(__name__)
+
+
+""" Records everything that happens to the apps on a tabletop to a compact
+binary trace, so that it can be replayed later without a GUI.
+
+A trace starts with a magic string, followed by records. Each record is a
+32-bit length, followed by that many bytes containing the timestamp, record
+type, cube ID, and fields that depend on the type. Strings are stored with a
+32-bit length in front of them.
+
+In compressed traces, the records are grouped into blocks, and each block is
+compressed with zlib on its own and written with a 32-bit length in front of it.
+Either way, traces can be read while they are still being written. """
+
+
+# Identifies trace files.
+_MAGIC = "MCTRACE\x01"
+# Identifies compressed trace files.
+_COMPRESSED_MAGIC = "MCTRACEZ"
+# Compressed blocks are written once they have at least this many bytes of
+# records in them.
+_BLOCK_SIZE = 64 * 1024
+
+# Length that goes in front of every record and string.
+_LENGTH = struct.Struct("<I")
+# Timestamp, record type and cube ID at the start of every record.
+_RECORD_HEADER = struct.Struct("<dBi")
+# The connected, added and removed cube IDs for each side in a reconfiguration.
+_CONNECTIONS = struct.Struct("<12i")
+# A single cube ID.
+_CUBE_ID = struct.Struct("<i")
+# A single direction flag.
+_DIRECTION = struct.Struct("<B")
+# Whether a button was pressed, and when it happened.
+_BUTTON = struct.Struct("<Bd")
+
+# Stands in for a missing cube.
+_NO_CUBE = -1
+
+# Codec name recorded for local messages that can't be converted to JSON. The
+# messages themselves aren't saved.
+_OPAQUE_CODEC = "opaque"
+# What messages that weren't saved decode to, so that they can still be
+# compared.
+_OPAQUE_MESSAGE = "<opaque>"
+# Encodes the init args and state of apps.
+_STATE_CODEC = codec.BinaryCodec()
+
+
+class RecordTypes(object):
+  """ The types of records in a trace. """
+
+  # An app was started on a cube.
+  APP = 0
+  # A cube sent a message to a neighbor.
+  SEND = 1
+  # A cube received a message from a neighbor.
+  RECEIVE = 2
+  # A cube received a routed message.
+  ROUTED = 3
+  # The connections of a cube changed.
+  RECONFIGURE = 4
+  # A SimMessage was exchanged with a cube VM.
+  SIM_MESSAGE = 5
+  # A button on a cube was pressed or released.
+  BUTTON = 6
+  # The connections of a cube changed. These are written for every cube in a
+  # batch of changes before any of the apps are told about it.
+  TOPOLOGY = 7
+
+
+class SimDirections(object):
+  """ Which way a SimMessage went. """
+
+  TO_VM = 0
+  FROM_VM = 1
+
+
+def _pack_string(string):
+  """ Packs a string with its length in front of it.
+  Args:
+    string: The string to pack.
+  Returns:
+    The packed string. """
+  return _LENGTH.pack(len(string)) + string
+
+def _unpack_string(data, offset):
+  """ Unpacks a string that was packed with _pack_string().
+  Args:
+    data: The data to unpack from.
+    offset: The offset that the string starts at.
+  Returns:
+    The string, and the offset just past the end of it. """
+  length, = _LENGTH.unpack_from(data, offset)
+  offset += _LENGTH.size
+  return data[offset:offset + length], offset + length
+
+def _portable_message(message, codec_name):
+  """ Makes sure that a message can be written to the trace. Messages sent with
+  the local codec are not serialized, so they get converted to JSON. If that
+  isn't possible, the message is left out.
+  Args:
+    message: The message, as it was sent.
+    codec_name: The name of the codec that it was encoded with.
+  Returns:
+    The serialized message, and the name of the codec used. """
+  if codec_name == codec.LocalCodec.NAME:
+    try:
+      return codec.JsonCodec().encode(message), codec.JsonCodec.NAME
+    except (TypeError, ValueError):
+      # Local messages can be any object at all.
+      return "", _OPAQUE_CODEC
+  return message, codec_name
+
+def _decode_message(message, codec_name):
+  """ Decodes a message that was written to the trace.
+  Args:
+    message: The serialized message.
+    codec_name: The name of the codec that it was encoded with.
+  Returns:
+    The decoded message, or _OPAQUE_MESSAGE if it wasn't saved. """
+  if codec_name == _OPAQUE_CODEC:
+    return _OPAQUE_MESSAGE
+  return codec.get_codec(codec_name).decode(message)
+
+def _get_sides():
+  """
+  Returns:
+    The sides, in the order that they are stored in reconfiguration
+    records. """
+  sides = cube.Cube.Sides
+  return (sides.LEFT, sides.RIGHT, sides.TOP, sides.BOTTOM)
+
+def _cube_id(other):
+  """
+  Args:
+    other: A cube, or None.
+  Returns:
+    The ID of the cube, or _NO_CUBE if it is None. """
+  if other is None:
+    return _NO_CUBE
+  return other.get_id()
+
+def _pack_connections(config):
+  """ Packs the connected, added and removed cubes for each side.
+  Args:
+    config: The Cube.Connections to pack.
+  Returns:
+    The packed connections. """
+  ids = []
+  for side in _get_sides():
+    ids.extend([_cube_id(config[side]), _cube_id(config.added.get(side)),
+                _cube_id(config.removed.get(side))])
+  return _CONNECTIONS.pack(*ids)
+
+
+class TraceRecorder(object):
+  """ Writes a trace file. """
+
+  def __init__(self, path, compress=False):
+    """
+    Args:
+      path: The file to write to.
+      compress: Whether to compress the trace. Records only make it to the
+                file when a whole block is written, or it is flushed. """
+    self.__compress = compress
+    self.__file = open(path, "wb")
+    self.__file.write(_COMPRESSED_MAGIC if compress else _MAGIC)
+
+    # The records that haven't been compressed yet, and their total size.
+    self.__block = []
+    self.__block_size = 0
+
+    # Timestamps are relative to when recording started.
+    self.__start_time = time.time()
+    self.__records = 0
+
+  def __write(self, record_type, cube_id, *fields):
+    """ Writes a single record.
+    Args:
+      record_type: The type of the record.
+      cube_id: The ID of the cube that the record is about.
+      All other arguments are packed fields that make up the rest of the
+      record. """
+    header = _RECORD_HEADER.pack(time.time() - self.__start_time, record_type,
+                                 cube_id)
+    record = _pack_string(header + "".join(fields))
+    self.__records += 1
+
+    if not self.__compress:
+      self.__file.write(record)
+      return
+
+    self.__block.append(record)
+    self.__block_size += len(record)
+    if self.__block_size >= _BLOCK_SIZE:
+      self.__write_block()
+
+  def __write_block(self):
+    """ Compresses the pending records and writes them as a block. """
+    if not self.__block:
+      return
+
+    self.__file.write(_pack_string(zlib.compress("".join(self.__block))))
+    self.__block = []
+    self.__block_size = 0
+
+  def record_app(self, cube, app):
+    """ Records an app being started on a cube. This has to be called before
+    the app starts running.
+    Args:
+      cube: The cube.
+      app: The app. """
+    app_class = app.get_app_class()
+    if app_class is None:
+      # The replayer will skip this cube.
+      self.__write(RecordTypes.APP, cube.get_id(), _pack_string(""),
+                   _pack_string(""))
+      return
+
+    class_path = "%s.%s" % (app_class.__module__, app_class.__name__)
+    try:
+      # Save what the app needs to be recreated in the same state. This uses
+      # the binary codec instead of pickle, so that reading a trace can't run
+      # arbitrary code.
+      state = _STATE_CODEC.encode([list(app.get_init_args()),
+                                   app.get_state()])
+    except (TypeError, ValueError):
+      logger.warning("Can't save %s in trace, it will be recreated." % \
+                     (class_path))
+      state = ""
+
+    self.__write(RecordTypes.APP, cube.get_id(), _pack_string(class_path),
+                 _pack_string(state))
+
+  def record_send(self, cube, side, message, codec_name):
+    """ Records a message being sent to a neighbor.
+    Args:
+      cube: The cube that sent it.
+      side: The side that it was sent on.
+      message: The serialized message.
+      codec_name: The name of the codec that it was encoded with. """
+    message, codec_name = _portable_message(message, codec_name)
+    self.__write(RecordTypes.SEND, cube.get_id(), _pack_string(side),
+                 _pack_string(codec_name), _pack_string(message))
+
+  def record_receive(self, cube, side, message, codec_name):
+    """ Records a message being received from a neighbor.
+    Args:
+      cube: The cube that received it.
+      side: The side that it was received on.
+      message: The serialized message.
+      codec_name: The name of the codec that it was encoded with. """
+    message, codec_name = _portable_message(message, codec_name)
+    self.__write(RecordTypes.RECEIVE, cube.get_id(), _pack_string(side),
+                 _pack_string(codec_name), _pack_string(message))
+
+  def record_routed(self, cube, source_id, message, codec_name):
+    """ Records a routed message being received.
+    Args:
+      cube: The cube that received it.
+      source_id: The ID of the cube that sent it.
+      message: The serialized message.
+      codec_name: The name of the codec that it was encoded with. """
+    message, codec_name = _portable_message(message, codec_name)
+    self.__write(RecordTypes.ROUTED, cube.get_id(), _CUBE_ID.pack(source_id),
+                 _pack_string(codec_name), _pack_string(message))
+
+  def record_topology(self, cube, config):
+    """ Records the connections of a cube changing, before the app on it or any
+    other cube finds out about it.
+    Args:
+      cube: The cube.
+      config: The new Cube.Connections. """
+    self.__write(RecordTypes.TOPOLOGY, cube.get_id(),
+                 _pack_connections(config))
+
+  def record_reconfiguration(self, cube, config):
+    """ Records the app on a cube being told that its connections changed.
+    Args:
+      cube: The cube.
+      config: The new Cube.Connections. """
+    self.__write(RecordTypes.RECONFIGURE, cube.get_id(),
+                 _pack_connections(config))
+
+  def record_sim_message(self, cube, direction, message):
+    """ Records a SimMessage exchanged with a cube VM.
+    Args:
+      cube: The cube that is backed by the VM.
+      direction: The SimDirections value for which way it went.
+      message: The SimMessage. """
+    self.__write(RecordTypes.SIM_MESSAGE, cube.get_id(),
+                 _DIRECTION.pack(direction),
+                 _pack_string(message.SerializeToString()))
+
+  def record_button(self, cube, button, pressed, timestamp):
+    """ Records a button being pressed or released.
+    Args:
+      cube: The cube that the button is on.
+      button: The button.
+      pressed: True if it was pressed, false if it was released.
+      timestamp: When it happened, in seconds since the epoch. """
+    self.__write(RecordTypes.BUTTON, cube.get_id(), _pack_string(button),
+                 _BUTTON.pack(pressed, timestamp))
+
+  def get_records(self):
+    """
+    Returns:
+      The number of records written so far. """
+    return self.__records
+
+  def flush(self):
+    """ Makes sure that everything recorded so far is written to the file. """
+    self.__write_block()
+    self.__file.flush()
+
+  def close(self):
+    """ Finishes writing the trace. """
+    self.__write_block()
+    self.__file.close()
+
+
+class TraceReader(object):
+  """ Reads records from a trace file, one at a time. """
+
+  def __init__(self, path):
+    """
+    Args:
+      path: The file to read. It can be compressed. """
+    self.__file = open(path, "rb")
+
+    magic = self.__file.read(len(_MAGIC))
+    if magic not in (_MAGIC, _COMPRESSED_MAGIC):
+      self.__file.close()
+      raise ValueError("'%s' is not a trace file." % (path))
+    self.__compressed = magic == _COMPRESSED_MAGIC
+
+  def __decode(self, body):
+    """ Decodes the body of a record.
+    Args:
+      body: The body.
+    Returns:
+      A tuple of the timestamp, record type, cube ID, and a tuple of the
+      fields for that type of record. """
+    timestamp, record_type, cube_id = _RECORD_HEADER.unpack_from(body, 0)
+    offset = _RECORD_HEADER.size
+
+    if record_type == RecordTypes.APP:
+      class_path, offset = _unpack_string(body, offset)
+      state, offset = _unpack_string(body, offset)
+      fields = (class_path, state)
+
+    elif record_type in (RecordTypes.SEND, RecordTypes.RECEIVE):
+      side, offset = _unpack_string(body, offset)
+      codec_name, offset = _unpack_string(body, offset)
+      message, offset = _unpack_string(body, offset)
+      fields = (side, message, codec_name)
+
+    elif record_type == RecordTypes.ROUTED:
+      source_id, = _CUBE_ID.unpack_from(body, offset)
+      offset += _CUBE_ID.size
+      codec_name, offset = _unpack_string(body, offset)
+      message, offset = _unpack_string(body, offset)
+      fields = (source_id, message, codec_name)
+
+    elif record_type in (RecordTypes.RECONFIGURE, RecordTypes.TOPOLOGY):
+      ids = _CONNECTIONS.unpack_from(body, offset)
+      connected, added, removed = {}, {}, {}
+      for i, side in enumerate(_get_sides()):
+        connected_id, added_id, removed_id = ids[i * 3:i * 3 + 3]
+        connected[side] = None if connected_id == _NO_CUBE else connected_id
+        if added_id != _NO_CUBE:
+          added[side] = added_id
+        if removed_id != _NO_CUBE:
+          removed[side] = removed_id
+      fields = (connected, added, removed)
+
+    elif record_type == RecordTypes.SIM_MESSAGE:
+      direction, = _DIRECTION.unpack_from(body, offset)
+      offset += _DIRECTION.size
+      message, offset = _unpack_string(body, offset)
+      fields = (direction, message)
+
+    elif record_type == RecordTypes.BUTTON:
+      button, offset = _unpack_string(body, offset)
+      pressed, button_time = _BUTTON.unpack_from(body, offset)
+      fields = (button, bool(pressed), button_time)
+
+    else:
+      raise ValueError("Unknown record type %d." % (record_type))
+
+    return (timestamp, record_type, cube_id, fields)
+
+  def __read_chunks(self):
+    """ Reads length-prefixed chunks from the file. These are records in normal
+    traces, and blocks in compressed ones.
+    Returns:
+      A generator of the chunks. """
+    while True:
+      length_data = self.__file.read(_LENGTH.size)
+      if len(length_data) < _LENGTH.size:
+        # End of the trace. A partial chunk at the end means it was cut off
+        # while it was being written.
+        return
+
+      length, = _LENGTH.unpack(length_data)
+      chunk = self.__file.read(length)
+      if len(chunk) < length:
+        return
+
+      yield chunk
+
+  def __iter__(self):
+    for chunk in self.__read_chunks():
+      if not self.__compressed:
+        yield self.__decode(chunk)
+        continue
+
+      # Blocks always contain whole records.
+      block = zlib.decompress(chunk)
+      offset = 0
+      while offset < len(block):
+        body, offset = _unpack_string(block, offset)
+        yield self.__decode(body)
+
+  def close(self):
+    """ Closes the file. """
+    self.__file.close()
+
+
+class _ReplayDisplay(object):
+  """ Stands in for a cube's display during replay. Drawing does nothing. """
+
+  def __init__(self):
+    # Number of drawing calls made.
+    self.calls = 0
+
+  def __getattr__(self, name):
+    def call(*args, **kwargs):
+      self.calls += 1
+    return call
+
+
+class _ReplayCube(object):
+  """ Stands in for a cube during replay. It implements the parts of the Cube
+  interface that applications use, and remembers what the app sends. """
+
+  def __init__(self, cube_id, cluster_index):
+    """
+    Args:
+      cube_id: The ID of the cube.
+      cluster_index: The ClusterIndex shared by all the cubes in the replay. """
+    self.__id = cube_id
+    self.__cluster_index = cluster_index
+    self.__display = _ReplayDisplay()
+    self.__connected = dict.fromkeys(cube.Cube.Sides.all())
+    self.__app = None
+
+    # The decoded messages sent directly to neighbors, as tuples of the side
+    # and the message.
+    self.sent = []
+
+  def set_connections(self, connected):
+    """ Sets the connections of this cube.
+    Args:
+      connected: The connected _ReplayCubes, keyed by side. """
+    self.__connected = connected
+
+  def set_app(self, app):
+    """ Sets the app that runs on this cube.
+    Args:
+      app: The app. """
+    self.__app = app
+
+  def get_id(self):
+    return self.__id
+
+  def get_app(self):
+    return self.__app
+
+  def get_display(self):
+    return self.__display
+
+  def get_cluster_index(self):
+    return self.__cluster_index
+
+  def get_connections(self):
+    return self.__connected.copy()
+
+  def get_peer_codecs(self, side):
+    if self.__connected[side] is None:
+      raise ValueError("No cube connected on side %s'." % (side))
+    return self.__connected[side].get_codecs()
+
+  def get_codecs(self):
+    if self.__app is None:
+      return ()
+    return self.__app.get_codecs()
+
+  def send_message(self, side, message, codec_name):
+    # Compare messages the way that they were recorded originally.
+    message, codec_name = _portable_message(message, codec_name)
+    self.sent.append((side, _decode_message(message, codec_name)))
+
+  def flood_message(self, encoding, sides=None, first_side=None):
+    # The other cubes get their copies from the trace.
+    return
+
+  def route_message(self, cube_id, encoding):
+    return
+
+
+class TraceReplayer(object):
+  """ Re-runs the apps from a trace without a GUI, as fast as possible. Apps
+  only see the inputs that were recorded, so anything that they send doesn't
+  go anywhere, but it is checked against what they sent originally. """
+
+  def __init__(self, path, app_factory=None):
+    """
+    Args:
+      path: The trace file to replay.
+      app_factory: Function that takes a cube ID and the class path of the app
+                   that ran on it, and returns a new app. It is used for apps
+                   whose arguments and state couldn't be saved in the trace.
+                   By default, the class is instantiated with no arguments.
+    """
+    # This can't be imported at the top, because cluster_index imports cube,
+    # which imports this module.
+    import cluster_index
+
+    self.__path = path
+    self.__app_factory = app_factory
+
+    # Rebuilt from the topology records, so that apps can look things up in it
+    # just like they did originally.
+    self.__cluster_index = cluster_index.ClusterIndex()
+    # The topology records from the current batch of changes, which haven't
+    # been applied yet.
+    self.__pending_topology = []
+
+    # Maps cube IDs to the _ReplayCube and the app running on it.
+    self.__cubes = {}
+    self.__apps = {}
+    # IDs of the cubes whose apps can't be replayed.
+    self.__skipped = set()
+    # The decoded messages that each cube sent originally, keyed by cube ID.
+    self.__expected_sends = {}
+
+    self.__records = 0
+    self.__duration = 0.0
+    self.__elapsed = 0.0
+
+  def __make_app(self, cube_id, class_path, state):
+    """ Recreates an app from the trace.
+    Args:
+      cube_id: The ID of the cube that it runs on.
+      class_path: The full name of the app class.
+      state: The encoded init args and state of the app, or an empty string.
+    Returns:
+      The app. """
+    if not state and self.__app_factory is not None:
+      return self.__app_factory(cube_id, class_path)
+
+    module_name, class_name = class_path.rsplit(".", 1)
+    module = importlib.import_module(module_name)
+    app_class = getattr(module, class_name)
+    if not state:
+      return app_class()
+
+    init_args, app_state = _STATE_CODEC.decode(state)
+    app = app_class(*init_args)
+    app.set_state(app_state)
+    return app
+
+  def __get_cube(self, cube_id):
+    """ Gets the stand-in for a cube, creating it if necessary.
+    Args:
+      cube_id: The ID of the cube.
+    Returns:
+      The _ReplayCube. """
+    replay_cube = self.__cubes.get(cube_id)
+    if replay_cube is None:
+      replay_cube = _ReplayCube(cube_id, self.__cluster_index)
+      self.__cubes[cube_id] = replay_cube
+      self.__cluster_index.add_cube(replay_cube)
+    return replay_cube
+
+  def __get_cubes(self, cube_ids):
+    """ Gets the stand-ins for a set of cubes.
+    Args:
+      cube_ids: Dictionary of cube IDs, or None for no cube, keyed by side.
+    Returns:
+      The same dictionary, with _ReplayCubes instead of IDs. """
+    return dict((side, None if cube_id is None else self.__get_cube(cube_id)) \
+                for side, cube_id in cube_ids.iteritems())
+
+  def __apply_topology(self):
+    """ Applies the pending topology records. Like in the original run, all the
+    connections are changed before the cluster index is updated, and both
+    happen before any of the apps are told about it. """
+    changes = []
+    for cube_id, (connected, added, removed) in self.__pending_topology:
+      replay_cube = self.__get_cube(cube_id)
+      replay_cube.set_connections(self.__get_cubes(connected))
+      changes.append((replay_cube, self.__get_cubes(added),
+                      self.__get_cubes(removed)))
+    self.__pending_topology = []
+
+    for replay_cube, added, removed in changes:
+      self.__cluster_index.update(replay_cube, added, removed)
+
+  def __apply(self, record_type, cube_id, fields):
+    """ Applies a single record.
+    Args:
+      record_type: The type of the record.
+      cube_id: The ID of the cube that it's about.
+      fields: The fields of the record. """
+    if record_type == RecordTypes.TOPOLOGY:
+      # These always come in a group, which gets applied all at once.
+      self.__pending_topology.append((cube_id, fields))
+      return
+    if self.__pending_topology:
+      self.__apply_topology()
+
+    replay_cube = self.__get_cube(cube_id)
+
+    if record_type == RecordTypes.APP:
+      class_path = fields[0]
+      if not class_path:
+        logger.warning("App on cube %d can't be replayed, skipping it." % \
+                       (cube_id))
+        self.__apps.pop(cube_id, None)
+        self.__skipped.add(cube_id)
+        return
+
+      self.__skipped.discard(cube_id)
+      app = self.__make_app(cube_id, *fields)
+      self.__apps[cube_id] = app
+      replay_cube.set_app(app)
+      app.run(replay_cube)
+      return
+
+    if record_type == RecordTypes.SEND:
+      side, message, codec_name = fields
+      decoded = _decode_message(message, codec_name)
+      self.__expected_sends.setdefault(cube_id, []).append((side, decoded))
+      return
+
+    if record_type == RecordTypes.RECONFIGURE:
+      connected, added, removed = fields
+      # The connections were already set from the topology records, but older
+      # traces don't have those.
+      replay_cube.set_connections(self.__get_cubes(connected))
+      config = cube.Cube.Connections(replay_cube.get_connections(),
+                                     self.__get_cubes(added),
+                                     self.__get_cubes(removed))
+
+    app = self.__apps.get(cube_id)
+    if app is None:
+      # No app was running on this cube at this point.
+      return
+
+    if record_type in (RecordTypes.RECEIVE, RecordTypes.ROUTED) and \
+        fields[2] == _OPAQUE_CODEC:
+      logger.warning("Message to cube %d wasn't saved, skipping it." % \
+                     (cube_id))
+      return
+
+    if record_type == RecordTypes.RECONFIGURE:
+      app.on_reconfiguration(config)
+    elif record_type == RecordTypes.RECEIVE:
+      app.on_message_receive(*fields)
+    elif record_type == RecordTypes.ROUTED:
+      app.on_routed_message_receive(*fields)
+    elif record_type == RecordTypes.BUTTON:
+      app.on_button_event(*fields)
+
+  def replay(self):
+    """ Replays the whole trace. """
+    reader = TraceReader(self.__path)
+    start_time = time.time()
+
+    try:
+      for timestamp, record_type, cube_id, fields in reader:
+        self.__apply(record_type, cube_id, fields)
+        self.__records += 1
+        self.__duration = timestamp
+      if self.__pending_topology:
+        self.__apply_topology()
+    finally:
+      reader.close()
+
+    self.__elapsed = time.time() - start_time
+    logger.info("Replayed %d records covering %.1f s in %.3f s." % \
+                (self.__records, self.__duration, self.__elapsed))
+
+  def get_app(self, cube_id):
+    """
+    Args:
+      cube_id: The ID of the cube.
+    Returns:
+      The replayed app that ran on that cube. """
+    return self.__apps[cube_id]
+
+  def get_mismatches(self):
+    """ Compares what the replayed apps sent to what they sent originally.
+    Returns:
+      The IDs of the cubes whose apps didn't send the same messages. """
+    mismatched = []
+    for cube_id in set(self.__cubes) | set(self.__expected_sends):
+      if cube_id in self.__skipped:
+        # There's nothing to compare to.
+        continue
+      expected = self.__expected_sends.get(cube_id, [])
+      if self.__get_cube(cube_id).sent != expected:
+        mismatched.append(cube_id)
+
+    return sorted(mismatched)
+
+  def get_records(self):
+    """
+    Returns:
+      The number of records that were replayed. """
+    return self.__records
+
+  def get_duration(self):
+    """
+    Returns:
+      How long the original session took, in seconds. """
+    return self.__duration
+
+  def get_elapsed(self):
+    """
+    Returns:
+      How long the replay took, in seconds. """
+    return self.__elapsed
+
+
+# The recorder that is currently active, if any.
+_recorder = None
+
+def start_recording(path, compress=False):
+  """ Starts recording everything that happens on the tabletop.
+  Args:
+    path: The file to write the trace to.
+    compress: Whether to compress the trace.
+  Returns:
+    The TraceRecorder. """
+  global _recorder
+  if _recorder is not None:
+    raise RuntimeError("Already recording a trace.")
+
+  _recorder = TraceRecorder(path, compress=compress)
+  return _recorder
+
+def stop_recording():
+  """ Stops recording and closes the trace. """
+  global _recorder
+  if _recorder is None:
+    return
+
+  _recorder.close()
+  _recorder = None
+
+def get_recorder():
+  """
+  Returns:
+    The active TraceRecorder, or None if nothing is being recorded. """
+  return _recorder
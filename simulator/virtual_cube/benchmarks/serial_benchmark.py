@@ -0,0 +1,410 @@
+#!/usr/bin/python
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from apps.libmc.sim.protobuf import sim_message_pb2
+
+from simulator.virtual_cube import cows
+from simulator.virtual_cube import serial_com
+
+
+""" Benchmarks for the Python side of the serial link: COWS stuffing, SerialCom
+round-trips, and splitting a byte stream into frames. Results are written as
+JSON, so that they can be compared between commits with --compare. """
+
+
+# Payload sizes to benchmark COWS with, in bytes.
+_PAYLOAD_SIZES = (16, 64, 256, 1024, 4096)
+# Fractions of the words in the payload that are zero.
+_ZERO_DENSITIES = (0.0, 0.1, 0.5, 1.0)
+# Message sizes to benchmark SerialCom with, in bytes.
+_MESSAGE_SIZES = (16, 256, 4096)
+# How many frames to send at once for the frame splitting benchmark.
+_BURST_FRAMES = 256
+
+# Seed for generating payloads, so they are the same on every run.
+_SEED = 42
+
+# Buffer size used by the C++ COWS tests.
+_CC_BUFFER_SIZE = 1024
+
+
+def _make_payload(size, zero_density, rand):
+  """ Creates a payload for COWS, with the overhead word at the front.
+  Args:
+    size: The size of the payload, in bytes, not counting the overhead.
+    zero_density: The fraction of the words that should be zero.
+    rand: The random number generator to use.
+  Returns:
+    The payload, as a bytearray. """
+  payload = bytearray(2)
+  for _ in range(size / 2):
+    if rand.random() < zero_density:
+      payload.extend((0, 0))
+    else:
+      payload.extend((rand.randint(1, 255), rand.randint(0, 255)))
+
+  return payload
+
+def _time(function, number, repeat):
+  """ Times a function.
+  Args:
+    function: The function to time. It is called with no arguments.
+    number: How many times to call it in each round.
+    repeat: How many rounds to run.
+  Returns:
+    A dictionary with the best and median time per call, in seconds. """
+  times = []
+  for _ in range(repeat):
+    start_time = time.time()
+    for _ in range(number):
+      function()
+    times.append((time.time() - start_time) / number)
+
+  times.sort()
+  return {"best": times[0], "median": times[len(times) / 2],
+          "calls": number * repeat}
+
+def _add_throughput(result, size):
+  """ Adds the throughput to a result from _time().
+  Args:
+    result: The result to add it to.
+    size: The number of bytes processed in each call. """
+  result["bytes"] = size
+  result["mb_per_s"] = size / result["median"] / 1e6 if result["median"] \
+                       else None
+
+
+def benchmark_cows(number, repeat):
+  """ Benchmarks stuffing and unstuffing across payload sizes and zero
+  densities.
+  Args:
+    number: How many calls to make in each round.
+    repeat: How many rounds to run.
+  Returns:
+    The results, keyed by benchmark name. """
+  rand = random.Random(_SEED)
+  results = {}
+  for size in _PAYLOAD_SIZES:
+    for density in _ZERO_DENSITIES:
+      payload = _make_payload(size, density, rand)
+      stuffed = payload[:]
+      cows.cows_stuff(stuffed)
+
+      # Both functions work in-place, so they get a fresh copy every time.
+      # Copying is much faster than stuffing, so this doesn't skew the results
+      # much.
+      name = "cows_stuff/%d/%.1f" % (size, density)
+      results[name] = _time(lambda: cows.cows_stuff(payload[:]), number,
+                            repeat)
+      _add_throughput(results[name], size)
+
+      name = "cows_unstuff/%d/%.1f" % (size, density)
+      results[name] = _time(lambda: cows.cows_unstuff(stuffed[:]), number,
+                            repeat)
+      _add_throughput(results[name], size)
+
+  return results
+
+
+class _FakeChardev(object):
+  """ Stands in for the QEMU serial chardev: a Unix socket server that
+  SerialCom can connect to. """
+
+  def __init__(self):
+    self.__directory = tempfile.mkdtemp()
+    self.__path = os.path.join(self.__directory, "serial")
+
+    self.__server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.__server.bind(self.__path)
+    self.__server.listen(1)
+
+    self.__connection = None
+    self.__echo_thread = None
+
+  def get_path(self):
+    """
+    Returns:
+      The path to connect to. """
+    return self.__path
+
+  def accept(self):
+    """ Accepts the connection from SerialCom.
+    Returns:
+      The connected socket. """
+    self.__connection, _ = self.__server.accept()
+    return self.__connection
+
+  def __echo(self):
+    """ Sends back everything that gets received. """
+    while True:
+      data = self.__connection.recv(65536)
+      if not data:
+        return
+      self.__connection.sendall(data)
+
+  def start_echo(self):
+    """ Starts sending back everything that gets received, from a background
+    thread. """
+    self.__echo_thread = threading.Thread(target=self.__echo)
+    self.__echo_thread.daemon = True
+    self.__echo_thread.start()
+
+  def close(self):
+    """ Closes the sockets and cleans up. """
+    if self.__connection is not None:
+      self.__connection.close()
+    self.__server.close()
+    shutil.rmtree(self.__directory)
+
+
+def _make_message(size):
+  """ Creates a message for testing SerialCom.
+  Args:
+    size: The approximate size of the message, in bytes.
+  Returns:
+    The SimMessage. """
+  message = sim_message_pb2.SimMessage()
+  message.cube_message.side = 1
+  message.cube_message.codec = "binary"
+  message.cube_message.data = bytes(bytearray(i % 251 for i in range(size)))
+  return message
+
+def benchmark_serial_com(number, repeat):
+  """ Benchmarks writing messages to a SerialCom and reading them back.
+  Args:
+    number: How many calls to make in each round.
+    repeat: How many rounds to run.
+  Returns:
+    The results, keyed by benchmark name. """
+  results = {}
+
+  chardev = _FakeChardev()
+  try:
+    serial = serial_com.SerialCom(chardev.get_path())
+    chardev.accept()
+    chardev.start_echo()
+
+    for size in _MESSAGE_SIZES:
+      message = _make_message(size)
+
+      def round_trip():
+        serial.write_message(message)
+        serial.read_message()
+
+      name = "serial_round_trip/%d" % (size)
+      results[name] = _time(round_trip, number, repeat)
+      _add_throughput(results[name], message.ByteSize())
+
+  finally:
+    chardev.close()
+
+  return results
+
+def benchmark_frame_splitting(number, repeat):
+  """ Benchmarks splitting a burst of frames that arrive all at once.
+  Args:
+    number: How many bursts to read in each round.
+    repeat: How many rounds to run.
+  Returns:
+    The results, keyed by benchmark name. """
+  results = {}
+
+  chardev = _FakeChardev()
+  try:
+    serial = serial_com.SerialCom(chardev.get_path())
+    connection = chardev.accept()
+    # Get rid of the initial separator, and send one so that SerialCom can
+    # sync to the packet stream.
+    connection.recv(2)
+    connection.sendall(serial_com.SerialCom._SEPARATOR)
+
+    for size in _MESSAGE_SIZES:
+      frame = bytes(serial_com.encode_frame(_make_message(size)))
+      burst = (frame + serial_com.SerialCom._SEPARATOR) * _BURST_FRAMES
+
+      def read_burst():
+        # Do the sending from another thread, because the burst can be bigger
+        # than the socket buffer.
+        sender = threading.Thread(target=connection.sendall, args=(burst,))
+        sender.start()
+        for _ in range(_BURST_FRAMES):
+          serial.read_frame()
+        sender.join()
+
+      # Warm up.
+      read_burst()
+
+      name = "frame_splitting/%d" % (size)
+      results[name] = _time(read_burst, number, repeat)
+      _add_throughput(results[name], len(burst))
+      results[name]["frames_per_s"] = \
+          _BURST_FRAMES / results[name]["median"]
+
+  finally:
+    chardev.close()
+
+  return results
+
+
+def _reference_stuff(words):
+  """ Word-for-word port of Cows::CowsStuff() from apps/libmc/sim/cows.cc.
+  Args:
+    words: The buffer, as a list of 16-bit words. It is modified in-place. """
+  last_zero = len(words)
+  for i in range(len(words) - 1, 0, -1):
+    if not words[i]:
+      words[i] = last_zero - i
+      last_zero = i
+  words[0] = last_zero
+
+def _reference_unstuff(words):
+  """ Word-for-word port of Cows::CowsUnstuff() from apps/libmc/sim/cows.cc.
+  Args:
+    words: The buffer, as a list of 16-bit words. It is modified in-place. """
+  next_zero = words[0]
+  while next_zero < len(words):
+    move_forward = words[next_zero]
+    words[next_zero] = 0
+    next_zero += move_forward
+
+def _cc_test_pattern():
+  """ Generates the buffer that the C++ COWS tests use.
+  Returns:
+    The buffer, as a list of 16-bit words. """
+  words = [0] * _CC_BUFFER_SIZE
+  base = 3
+  for i in range(2, _CC_BUFFER_SIZE):
+    if not words[i - 1]:
+      words[i] = base
+      base = base * 5 & 0xFFFF
+    else:
+      words[i] = words[i - 1] << 1 & 0xFFFF
+
+  return words
+
+def _to_bytes(words):
+  """ Converts words to bytes, in the order that cows.py reads them.
+  Args:
+    words: The words to convert.
+  Returns:
+    The bytes, as a bytearray. """
+  array = bytearray()
+  for word in words:
+    array.extend((word >> 8, word & 0xFF))
+  return array
+
+def cross_check():
+  """ Checks that cows.py produces the same output as the C++ implementation
+  on the vectors from the C++ tests.
+  Returns:
+    The results, keyed by vector name. Each one says whether the stuffed
+    output matched, and whether unstuffing gave back the input. """
+  pattern = _cc_test_pattern()
+  no_zeros = pattern[:]
+  _reference_stuff(no_zeros)
+  vectors = {"pattern": pattern,
+             "no_zeros": no_zeros,
+             "all_zeros": [0] * _CC_BUFFER_SIZE}
+
+  results = {}
+  for name, words in vectors.iteritems():
+    expected = words[:]
+    _reference_stuff(expected)
+    unstuffed = expected[:]
+    _reference_unstuff(unstuffed)
+
+    array = _to_bytes(words)
+    cows.cows_stuff(array)
+    stuffed_matches = array == _to_bytes(expected)
+    cows.cows_unstuff(array)
+    # The overhead word doesn't come back.
+    round_trips = array[2:] == _to_bytes(words)[2:] and \
+                  unstuffed[1:] == words[1:]
+
+    results[name] = {"stuffed_matches": stuffed_matches,
+                     "round_trips": round_trips}
+
+  return results
+
+
+def _get_revision():
+  """
+  Returns:
+    The git revision that is checked out, or None if it can't be found. """
+  try:
+    return subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                   stderr=open(os.devnull, "w")).strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+def _compare(results, old_path):
+  """ Prints how the results changed relative to an earlier run.
+  Args:
+    results: The new results.
+    old_path: The file containing the earlier results. """
+  with open(old_path) as old_file:
+    old_results = json.load(old_file)["benchmarks"]
+
+  for name in sorted(results):
+    if name not in old_results:
+      continue
+    old_time = old_results[name]["median"]
+    new_time = results[name]["median"]
+    if old_time <= 0:
+      continue
+    print "%-32s %10.2f us -> %10.2f us (%+.1f%%)" % \
+        (name, old_time * 1e6, new_time * 1e6,
+         (new_time - old_time) / old_time * 100)
+
+def main():
+  parser = argparse.ArgumentParser(
+      description="Benchmarks the Python serial framing stack.")
+  parser.add_argument("-o", "--output", default="serial_benchmark.json",
+                      help="File to write the results to.")
+  parser.add_argument("-c", "--compare",
+                      help="Earlier results to compare against.")
+  parser.add_argument("--quick", action="store_true",
+                      help="Run fewer iterations.")
+  args = parser.parse_args()
+
+  number, repeat = (10, 3) if args.quick else (100, 7)
+
+  checks = cross_check()
+  results = {}
+  results.update(benchmark_cows(number, repeat))
+  results.update(benchmark_serial_com(number, repeat))
+  results.update(benchmark_frame_splitting(max(number / 10, 1), repeat))
+
+  with open(args.output, "w") as output:
+    json.dump({"revision": _get_revision(),
+               "python": platform.python_version(),
+               "time": time.time(),
+               "cross_check": checks,
+               "benchmarks": results},
+              output, indent=2, sort_keys=True)
+
+  if args.compare:
+    _compare(results, args.compare)
+
+  for name, check in sorted(checks.iteritems()):
+    if not all(check.values()):
+      print "cows.py does not match the C++ implementation on '%s'." % (name)
+      return 1
+
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -1,4 +1,7 @@
 import ctypes
+import time
+
+import metrics
 
 
 def _pad_array(array):
@@ -42,12 +45,8 @@ def _get_word(array, index):
 
   return value
 
-def cows_stuff(array):
-  """ Performs COWS stuffing on an input.
-  Args:
-    array: The input to stuff. The first word will
-           be used for the overhead, and so should not contain any necessary
-           data. """
+def _stuff(array):
+  """ Performs COWS stuffing on an input. See cows_stuff(). """
   padded = _pad_array(array)
 
   last_zero = len(array) / 2
@@ -73,11 +72,8 @@ def cows_stuff(array):
     # Remove the padding.
     _unpad_array(array)
 
-def cows_unstuff(array):
-  """ Performs the COWS unstuffing on an input.
-  Args:
-    array: The input to unstuff. The first word will be assumed to be the
-           overhead. """
+def _unstuff(array):
+  """ Performs the COWS unstuffing on an input. See cows_unstuff(). """
   padded = _pad_array(array)
 
   # Make a single forward pass to replace all the zeroes.
@@ -94,3 +90,34 @@ def cows_unstuff(array):
   if padded:
     # Remove the padding.
     _unpad_array(array)
+
+def _timed(name, function, array):
+  """ Runs one of the COWS functions, recording how long it took if metrics
+  are enabled.
+  Args:
+    name: The name of the histogram to record the time in.
+    function: The function to run.
+    array: The input to run it on. """
+  registry = metrics.get_registry()
+  if registry is None:
+    function(array)
+    return
+
+  start_time = time.time()
+  function(array)
+  registry.get_histogram(name).observe(time.time() - start_time)
+
+def cows_stuff(array):
+  """ Performs COWS stuffing on an input.
+  Args:
+    array: The input to stuff. The first word will
+           be used for the overhead, and so should not contain any necessary
+           data. """
+  _timed("cows.stuff_time", _stuff, array)
+
+def cows_unstuff(array):
+  """ Performs the COWS unstuffing on an input.
+  Args:
+    array: The input to unstuff. The first word will be assumed to be the
+           overhead. """
+  _timed("cows.unstuff_time", _unstuff, array)
@@ -7,6 +7,7 @@ import time
 from apps.libmc.sim.protobuf import sim_message_pb2
 
 import serial_com
+import shm_framebuffer
 
 
 logger = logging.getLogger(__name__)
@@ -39,6 +40,9 @@ class CubeVm(object):
   _QEMU_CONFIG = "simulator/virtual_cube/assets/cube_vm.cfg"
   # Location of the image for VMs.
   _DISK_IMAGE = "simulator/virtual_cube/assets/cube_os.ext4"
+  # Size of the shared memory for the framebuffer. This has to be a power of
+  # two, and big enough for the whole screen.
+  _FRAMEBUFFER_SIZE = "128K"
 
   # Internal counter to use for generating unique cube IDs.
   _CUBE_ID = 0
@@ -82,6 +86,16 @@ class CubeVm(object):
                "socket,path=/tmp/%s,server,nowait,id=vcube_ser" % (name)]
     return options
 
+  def __make_framebuffer_options(self, name):
+    """ Creates the QEMU CLI option list for the shared-memory framebuffer.
+    Args:
+      name: Unique name of the serial device. """
+    options = ["-object",
+               "memory-backend-file,id=vcube_fb,share=on,mem-path=/tmp/%s_fb,"
+               "size=%s" % (name, self._FRAMEBUFFER_SIZE),
+               "-device", "ivshmem-plain,memdev=vcube_fb"]
+    return options
+
   def __extract_disk_image(self):
     """ Extracts the VM disk image if necessary. """
     # The compressed path is just the normal one with a gzip extension.
@@ -109,6 +123,9 @@ class CubeVm(object):
     # Add serial options.
     options = self.__make_serial_options(self.__serial_name)
     command.extend(options)
+    # Add framebuffer options.
+    options = self.__make_framebuffer_options(self.__serial_name)
+    command.extend(options)
 
     logger.debug("Running command: %s" % str(command))
 
@@ -149,8 +166,39 @@ class CubeVm(object):
       The serial FD for the cube. """
     return "/tmp/%s" % (self.__serial_name)
 
+  def get_framebuffer_file(self):
+    """ Gets the file backing the shared-memory framebuffer for this cube.
+    Returns:
+      The path to the file. """
+    return "/tmp/%s_fb" % (self.__serial_name)
+
+  def open_framebuffer(self):
+    """ Opens the framebuffer so that the host can see what the cube draws.
+    Returns:
+      A ShmFramebufferReader for the framebuffer. """
+    return shm_framebuffer.ShmFramebufferReader(self.get_framebuffer_file())
+
   def send_message(self, message):
     """ Sends a message to this cube.
     Args:
       message: The message to send. This must be a protobuf SimMessage. """
     self.__serial.write_message(message)
+
+  def receive_message(self):
+    """ Receives a message from this cube. It blocks until one is available.
+    Returns:
+      The protobuf SimMessage that it received. """
+    return self.__serial.read_message()
+
+  def send_frame(self, frame):
+    """ Sends a frame that was already encoded to this cube.
+    Args:
+      frame: The COWS-stuffed frame to send, without the separator. """
+    self.__serial.write_frame(frame)
+
+  def receive_frame(self):
+    """ Receives a frame from this cube without decoding it. It blocks until
+    one is available.
+    Returns:
+      The COWS-stuffed frame, without the separator. """
+    return self.__serial.read_frame()
@@ -0,0 +1,313 @@
+from apps.libmc.sim.protobuf import display_message_pb2
+from apps.libmc.sim.protobuf import sim_message_pb2
+
+
+""" Sends screen contents over the serial link as compressed dirty rectangles,
+so that the bandwidth used depends on how much of the screen changed, and not
+on how big it is. """
+
+
+# Bytes per pixel.
+_PIXEL_SIZE = 3
+# Longest run that can be encoded in one count byte.
+_MAX_RUN = 255
+
+_DirtyRect = display_message_pb2.DirtyRect
+
+
+def rle_encode(pixels):
+  """ Run-length encodes pixel data.
+  Args:
+    pixels: The pixels, in RGB order.
+  Returns:
+    The encoded data, as a bytearray. """
+  pixels = bytearray(pixels)
+  encoded = bytearray()
+
+  i = 0
+  end = len(pixels)
+  while i < end:
+    pixel = pixels[i:i + _PIXEL_SIZE]
+    run = 1
+    i += _PIXEL_SIZE
+    while (run < _MAX_RUN and i < end and pixels[i:i + _PIXEL_SIZE] == pixel):
+      run += 1
+      i += _PIXEL_SIZE
+
+    encoded.append(run)
+    encoded.extend(pixel)
+
+  return encoded
+
+def rle_decode(encoded):
+  """ Decodes run-length encoded pixel data.
+  Args:
+    encoded: The encoded data.
+  Returns:
+    The pixels, as a bytearray. """
+  encoded = bytearray(encoded)
+  if len(encoded) % (_PIXEL_SIZE + 1):
+    raise ValueError("Truncated RLE data.")
+
+  pixels = bytearray()
+  for i in range(0, len(encoded), _PIXEL_SIZE + 1):
+    run = encoded[i]
+    pixels.extend(encoded[i + 1:i + 1 + _PIXEL_SIZE] * run)
+
+  return pixels
+
+def _xor(pixels1, pixels2):
+  """ XORs two equal-length buffers.
+  Args:
+    pixels1: The first buffer.
+    pixels2: The second buffer.
+  Returns:
+    The result, as a bytearray. """
+  return bytearray(a ^ b for a, b in zip(bytearray(pixels1),
+                                         bytearray(pixels2)))
+
+
+class _Screen(object):
+  """ A copy of the screen contents, in row-major RGB order. """
+
+  def __init__(self, size):
+    """
+    Args:
+      size: The width and height of the screen. """
+    self.width, self.height = size
+    self.pixels = bytearray(self.width * self.height * _PIXEL_SIZE)
+
+  def get_region(self, x, y, width, height):
+    """ Copies a region out of the screen.
+    Args:
+      x: The left edge of the region.
+      y: The top edge of the region.
+      width: The width of the region.
+      height: The height of the region.
+    Returns:
+      The pixels in the region, as a bytearray. """
+    row_size = width * _PIXEL_SIZE
+    region = bytearray()
+    for row in range(y, y + height):
+      offset = (row * self.width + x) * _PIXEL_SIZE
+      region.extend(self.pixels[offset:offset + row_size])
+
+    return region
+
+  def check_region(self, x, y, width, height, region):
+    """ Makes sure that a region can be written to the screen.
+    Args:
+      x: The left edge of the region.
+      y: The top edge of the region.
+      width: The width of the region.
+      height: The height of the region.
+      region: The new pixels for the region. """
+    if (x + width > self.width or y + height > self.height):
+      raise ValueError("Region does not fit on the screen.")
+    if len(region) != width * height * _PIXEL_SIZE:
+      raise ValueError("Expected %d bytes of pixels, got %d." % \
+                       (width * height * _PIXEL_SIZE, len(region)))
+
+  def set_region(self, x, y, width, height, region):
+    """ Replaces a region of the screen.
+    Args:
+      x: The left edge of the region.
+      y: The top edge of the region.
+      width: The width of the region.
+      height: The height of the region.
+      region: The new pixels for the region. """
+    self.check_region(x, y, width, height, region)
+
+    row_size = width * _PIXEL_SIZE
+    for row in range(height):
+      offset = ((y + row) * self.width + x) * _PIXEL_SIZE
+      self.pixels[offset:offset + row_size] = \
+          region[row * row_size:(row + 1) * row_size]
+
+
+class DisplayUpdateEncoder(object):
+  """ Turns successive frames of the screen into DisplayUpdate messages that
+  only contain what changed. """
+
+  def __init__(self, size):
+    """
+    Args:
+      size: The width and height of the screen. """
+    self.__screen = _Screen(size)
+    self.__frame = 0
+    # Whether the other end has the previous frame, so that we can send
+    # changes relative to it.
+    self.__have_previous = False
+
+  def __find_dirty_rects(self, pixels):
+    """ Finds the regions that differ from the previous frame. Changed rows
+    that are next to each other get grouped into a single rectangle, spanning
+    the columns that changed in any of them.
+    Args:
+      pixels: The new frame.
+    Returns:
+      A list of the dirty regions, as (x, y, width, height). """
+    old_pixels = self.__screen.pixels
+    width = self.__screen.width
+    row_size = width * _PIXEL_SIZE
+
+    rects = []
+    band_start = None
+    band_left = width
+    band_right = 0
+    for row in range(self.__screen.height + 1):
+      changed = False
+      if row < self.__screen.height:
+        start = row * row_size
+        old_row = old_pixels[start:start + row_size]
+        new_row = pixels[start:start + row_size]
+        changed = old_row != new_row
+
+      if changed:
+        # Find the first and last pixels that changed.
+        left = 0
+        while old_row[left * _PIXEL_SIZE:(left + 1) * _PIXEL_SIZE] == \
+              new_row[left * _PIXEL_SIZE:(left + 1) * _PIXEL_SIZE]:
+          left += 1
+        right = width
+        while old_row[(right - 1) * _PIXEL_SIZE:right * _PIXEL_SIZE] == \
+              new_row[(right - 1) * _PIXEL_SIZE:right * _PIXEL_SIZE]:
+          right -= 1
+
+        if band_start is None:
+          band_start = row
+        band_left = min(band_left, left)
+        band_right = max(band_right, right)
+
+      elif band_start is not None:
+        # The band ended.
+        rects.append((band_left, band_start, band_right - band_left,
+                      row - band_start))
+        band_start = None
+        band_left = width
+        band_right = 0
+
+    return rects
+
+  def __encode_rect(self, x, y, width, height, region):
+    """ Encodes a single dirty region using whichever encoding is smallest.
+    Args:
+      x: The left edge of the region.
+      y: The top edge of the region.
+      width: The width of the region.
+      height: The height of the region.
+      region: The new pixels for the region.
+    Returns:
+      The DirtyRect message. """
+    rect = _DirtyRect(x=x, y=y, width=width, height=height)
+
+    candidates = [(_DirtyRect.RAW, region),
+                  (_DirtyRect.RLE, rle_encode(region))]
+    if self.__have_previous:
+      previous = self.__screen.get_region(x, y, width, height)
+      candidates.append((_DirtyRect.XOR_RLE,
+                         rle_encode(_xor(region, previous))))
+
+    rect.encoding, data = min(candidates, key=lambda c: len(c[1]))
+    rect.data = bytes(data)
+    return rect
+
+  def reset(self):
+    """ Makes the next update contain the whole screen, without referring to
+    previous frames. This is needed if the other end lost track. """
+    self.__have_previous = False
+
+  def encode(self, pixels):
+    """ Encodes a new frame.
+    Args:
+      pixels: The contents of the screen, in row-major RGB order.
+    Returns:
+      A SimMessage with the changes since the last frame, or None if nothing
+      changed. """
+    pixels = bytearray(pixels)
+    if len(pixels) != len(self.__screen.pixels):
+      raise ValueError("Expected %d bytes of pixels, got %d." % \
+                       (len(self.__screen.pixels), len(pixels)))
+
+    if self.__have_previous:
+      rects = self.__find_dirty_rects(pixels)
+      if not rects:
+        return None
+    else:
+      rects = [(0, 0, self.__screen.width, self.__screen.height)]
+
+    message = sim_message_pb2.SimMessage()
+    self.__frame += 1
+    message.display.frame = self.__frame
+    for x, y, width, height in rects:
+      region = bytearray()
+      row_size = width * _PIXEL_SIZE
+      for row in range(y, y + height):
+        offset = (row * self.__screen.width + x) * _PIXEL_SIZE
+        region.extend(pixels[offset:offset + row_size])
+
+      message.display.rects.extend([self.__encode_rect(x, y, width, height,
+                                                       region)])
+
+    self.__screen.pixels = pixels
+    self.__have_previous = True
+    return message
+
+
+class DisplayUpdateDecoder(object):
+  """ Applies DisplayUpdate messages to a copy of the screen. """
+
+  def __init__(self, size):
+    """
+    Args:
+      size: The width and height of the screen. """
+    self.__screen = _Screen(size)
+    # The last frame that we applied, or None if we haven't applied any.
+    self.__frame = None
+
+  def get_pixels(self):
+    """
+    Returns:
+      The current contents of the screen, in row-major RGB order. """
+    return self.__screen.pixels
+
+  def apply(self, update):
+    """ Applies an update.
+    Args:
+      update: The DisplayUpdate message.
+    Returns:
+      A list of the regions that changed, as tuples of the x position, y
+      position, width and height, and the new pixels. """
+    in_sequence = (self.__frame is not None and \
+                   update.frame == self.__frame + 1)
+
+    # Everything gets decoded before the screen is touched, so that a bad rect
+    # doesn't leave it half-updated. The rects never overlap, so relative ones
+    # don't depend on the others.
+    decoded = []
+    for rect in update.rects:
+      if rect.encoding == _DirtyRect.RAW:
+        region = bytearray(rect.data)
+      elif rect.encoding == _DirtyRect.RLE:
+        region = rle_decode(rect.data)
+      elif rect.encoding == _DirtyRect.XOR_RLE:
+        if not in_sequence:
+          raise ValueError("Got relative update for frame %d after frame %s." \
+                           % (update.frame, self.__frame))
+        previous = self.__screen.get_region(rect.x, rect.y, rect.width,
+                                            rect.height)
+        region = _xor(rle_decode(rect.data), previous)
+      else:
+        raise ValueError("Unknown encoding %d." % (rect.encoding))
+
+      self.__screen.check_region(rect.x, rect.y, rect.width, rect.height,
+                                 region)
+      decoded.append((rect.x, rect.y, rect.width, rect.height, region))
+
+    regions = []
+    for x, y, width, height, region in decoded:
+      self.__screen.set_region(x, y, width, height, region)
+      regions.append((x, y, width, height, bytes(region)))
+
+    self.__frame = update.frame
+    return regions
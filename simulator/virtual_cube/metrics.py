@@ -0,0 +1,284 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+
+""" Counters and histograms for finding out where the simulator spends its
+time. Metrics are only collected after enable() is called. Until then,
+get_registry() returns None, so instrumented code only pays for checking that:
+
+  registry = metrics.get_registry()
+  if registry is not None:
+    registry.get_counter("messages_sent").increment(label=cube_id)
+"""
+
+
+# Default histogram buckets for timings, in seconds. Each one is the upper
+# bound of a bucket, and anything bigger goes into a final overflow bucket.
+TIME_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05,
+                0.1, 0.5, 1.0)
+# Default histogram buckets for sizes, in bytes.
+SIZE_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536)
+
+
+class Counter(object):
+  """ Counts how many times something happened. Counts can optionally be
+  broken down by a label, such as a cube ID. """
+
+  def __init__(self):
+    self.__lock = threading.Lock()
+    self.__value = 0
+    # Counts for each label.
+    self.__labels = {}
+
+  def increment(self, amount=1, label=None):
+    """ Increments the counter.
+    Args:
+      amount: How much to increment it by.
+      label: If specified, the count for this label is incremented too. """
+    with self.__lock:
+      self.__value += amount
+      if label is not None:
+        self.__labels[label] = self.__labels.get(label, 0) + amount
+
+  def get_value(self, label=None):
+    """
+    Args:
+      label: If specified, get the count for only this label.
+    Returns:
+      The current count. """
+    if label is None:
+      return self.__value
+    return self.__labels.get(label, 0)
+
+  def snapshot(self):
+    """
+    Returns:
+      The state of the counter, as a dictionary that can be saved as JSON. """
+    with self.__lock:
+      snapshot = {"value": self.__value}
+      if self.__labels:
+        snapshot["labels"] = dict((str(label), value) \
+                                  for label, value in self.__labels.iteritems())
+      return snapshot
+
+
+class Histogram(object):
+  """ Keeps track of how values are distributed, using fixed buckets so that
+  recording a value takes constant time and space. """
+
+  def __init__(self, buckets):
+    """
+    Args:
+      buckets: The upper bounds of the buckets, in increasing order. """
+    if list(buckets) != sorted(buckets):
+      raise ValueError("Histogram buckets must be in increasing order.")
+
+    self.__lock = threading.Lock()
+    self.__buckets = tuple(buckets)
+    # The last count is for values bigger than all the buckets.
+    self.__counts = [0] * (len(self.__buckets) + 1)
+    self.__total = 0.0
+    self.__max = None
+
+  def observe(self, value):
+    """ Records a value.
+    Args:
+      value: The value to record. """
+    index = bisect.bisect_left(self.__buckets, value)
+    with self.__lock:
+      self.__counts[index] += 1
+      self.__total += value
+      if (self.__max is None or value > self.__max):
+        self.__max = value
+
+  def get_buckets(self):
+    """
+    Returns:
+      The upper bounds of the buckets. """
+    return self.__buckets
+
+  def get_counts(self):
+    """
+    Returns:
+      The number of values in each bucket. There is one more of these than
+      there are buckets, for values that are bigger than all of them. """
+    return list(self.__counts)
+
+  def get_count(self):
+    """
+    Returns:
+      The total number of values recorded. """
+    return sum(self.__counts)
+
+  def get_total(self):
+    """
+    Returns:
+      The sum of all the values recorded. """
+    return self.__total
+
+  def snapshot(self):
+    """
+    Returns:
+      The state of the histogram, as a dictionary that can be saved as
+      JSON. """
+    with self.__lock:
+      return {"buckets": list(self.__buckets),
+              "counts": list(self.__counts),
+              "count": sum(self.__counts),
+              "total": self.__total,
+              "max": self.__max}
+
+
+class MetricsRegistry(object):
+  """ Holds all the metrics, by name. Metrics are created the first time that
+  they are asked for. """
+
+  def __init__(self):
+    self.__lock = threading.Lock()
+    self.__counters = {}
+    self.__histograms = {}
+
+  def get_counter(self, name):
+    """
+    Args:
+      name: The name of the counter.
+    Returns:
+      The Counter with that name. """
+    counter = self.__counters.get(name)
+    if counter is None:
+      with self.__lock:
+        counter = self.__counters.setdefault(name, Counter())
+
+    return counter
+
+  def get_histogram(self, name, buckets=TIME_BUCKETS):
+    """
+    Args:
+      name: The name of the histogram.
+      buckets: The buckets to use if the histogram needs to be created.
+    Returns:
+      The Histogram with that name. """
+    histogram = self.__histograms.get(name)
+    if histogram is None:
+      with self.__lock:
+        histogram = self.__histograms.get(name)
+        if histogram is None:
+          histogram = Histogram(buckets)
+          self.__histograms[name] = histogram
+
+    return histogram
+
+  def snapshot(self):
+    """ Gets the current state of all the metrics.
+    Returns:
+      A dictionary, with the time the snapshot was taken, and the snapshots of
+      all the counters and histograms, keyed by name. """
+    with self.__lock:
+      counters = self.__counters.items()
+      histograms = self.__histograms.items()
+
+    return {"time": time.time(),
+            "counters": dict((name, counter.snapshot()) \
+                             for name, counter in counters),
+            "histograms": dict((name, histogram.snapshot()) \
+                               for name, histogram in histograms)}
+
+  def dump(self, path):
+    """ Writes a snapshot to a file, as JSON. The file is replaced atomically,
+    so it can be watched by other programs.
+    Args:
+      path: The file to write to. """
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as dump_file:
+      json.dump(self.snapshot(), dump_file, indent=2, sort_keys=True)
+    os.rename(temp_path, path)
+
+
+class _PeriodicDumper(object):
+  """ Dumps the metrics to a file from a background thread. """
+
+  def __init__(self, registry, path, interval):
+    """
+    Args:
+      registry: The MetricsRegistry to dump.
+      path: The file to dump to.
+      interval: How often to dump, in seconds. """
+    self.__registry = registry
+    self.__path = path
+    self.__interval = interval
+
+    self.__stopped = threading.Event()
+    self.__thread = threading.Thread(target=self.__run)
+    self.__thread.daemon = True
+    self.__thread.start()
+
+  def __run(self):
+    """ Dumps the metrics until we are stopped. """
+    while not self.__stopped.wait(self.__interval):
+      self.__registry.dump(self.__path)
+
+  def stop(self):
+    """ Stops dumping, and writes one last dump. """
+    self.__stopped.set()
+    self.__thread.join()
+    self.__registry.dump(self.__path)
+
+
+# The registry that metrics are being recorded to, or None if they aren't.
+_registry = None
+# Dumps the registry periodically, if that was requested.
+_dumper = None
+
+def enable(dump_path=None, dump_interval=5.0):
+  """ Starts collecting metrics. Does nothing if they are already being
+  collected.
+  Args:
+    dump_path: If specified, the metrics will be written here periodically,
+               and when collection is stopped.
+    dump_interval: How often to write the metrics, in seconds.
+  Returns:
+    The MetricsRegistry that metrics will be recorded to. """
+  global _registry
+  global _dumper
+  if _registry is not None:
+    return _registry
+
+  _registry = MetricsRegistry()
+  if dump_path:
+    _dumper = _PeriodicDumper(_registry, dump_path, dump_interval)
+
+  return _registry
+
+def disable():
+  """ Stops collecting metrics.
+  Returns:
+    The MetricsRegistry that metrics were recorded to, or None if they weren't
+    being collected. """
+  global _registry
+  global _dumper
+  if _dumper is not None:
+    _dumper.stop()
+    _dumper = None
+
+  registry = _registry
+  _registry = None
+  return registry
+
+def get_registry():
+  """
+  Returns:
+    The MetricsRegistry to record metrics to, or None if metrics are not being
+    collected. """
+  return _registry
+
+def snapshot():
+  """
+  Returns:
+    A snapshot of all the metrics, or None if metrics are not being
+    collected. """
+  if _registry is None:
+    return None
+  return _registry.snapshot()
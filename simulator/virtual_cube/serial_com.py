@@ -1,20 +1,57 @@
 import collections
 import logging
 import socket
+import threading
 
 from apps.libmc.sim.protobuf import sim_message_pb2
 
 import cows
+import metrics
 
 
 logger = logging.getLogger(__name__)
 
 
+def encode_frame(message):
+  """ Turns a Protobuf message into a COWS-stuffed frame, without the
+  separator.
+  Args:
+    message: The message to encode.
+  Returns:
+    The frame, as a bytearray. """
+  # Serialize the message.
+  bin_message = message.SerializeToString()
+  # Add the overhead word for COWS.
+  bin_message = bytearray(2) + bytearray(bin_message)
+  # Stuff the message.
+  cows.cows_stuff(bin_message)
+
+  return bin_message
+
+def decode_frame(frame):
+  """ Turns a COWS-stuffed frame back into a Protobuf message.
+  Args:
+    frame: The frame, without the separator. It is not modified.
+  Returns:
+    The SimMessage. """
+  bin_message = bytearray(frame)
+
+  # Unstuff the message.
+  cows.cows_unstuff(bin_message)
+  # Deserialize the message, skipping the overhead word.
+  message = sim_message_pb2.SimMessage()
+  message.ParseFromString(bin_message[2:])
+
+  return message
+
+
 class SerialCom(object):
   """ Manages the serial link with the virtual cube. """
 
   # Separator for serial messages.
   _SEPARATOR = b"\x00\x00"
+  # Maximum number of bytes to read from the socket at once.
+  _READ_SIZE = 4096
 
   def __init__(self, serial_fd):
     """
@@ -30,6 +67,9 @@ class SerialCom(object):
     self.__data = bytearray()
     # Queue for complete messages that we've received.
     self.__message_queue = collections.deque()
+    # Makes sure that frames written from different threads don't get mixed
+    # up.
+    self.__write_lock = threading.Lock()
 
     # Send the initial message separator.
     self.__write_all(self._SEPARATOR)
@@ -66,7 +106,7 @@ class SerialCom(object):
         self.__data.pop()
 
       # Read anything that is available.
-      read_this_round.extend(self.__socket.recv())
+      read_this_round.extend(self.__socket.recv(self._READ_SIZE))
 
       while self._SEPARATOR in read_this_round:
         # We found the end.
@@ -81,27 +121,43 @@ class SerialCom(object):
 
       self.__data.extend(read_this_round)
 
+  def fileno(self):
+    """
+    Returns:
+      The file descriptor of the underlying socket. """
+    return self.__socket.fileno()
+
+  def write_frame(self, frame):
+    """ Writes a frame that was already COWS-stuffed to the serial port. This
+    can be called from multiple threads.
+    Args:
+      frame: The frame to write, without the separator. """
+    # Add the separator at the end.
+    complete_message = frame + self._SEPARATOR
+
+    with self.__write_lock:
+      self.__write_all(complete_message)
+
+    registry = metrics.get_registry()
+    if registry is not None:
+      registry.get_counter("serial.frames_written").increment()
+      registry.get_counter("serial.bytes_written") \
+          .increment(len(complete_message))
+
   def write_message(self, message):
     """ Writes a Protobuf message to the serial port.
     Args:
       message: The message to write. """
-    logger.debug("Writing message: %s" % (str(message)))
-
-    # Serialize the message.
-    bin_message = message.SerializeToString()
-    # Add the overhead word for COWS.
-    bin_message = bytearray(2) + bytearray(bin_message)
-    # Stuff the message.
-    cows.cows_stuff(bin_message)
-    # Add the separator at the end.
-    complete_message = bin_message + self._SEPARATOR
+    if logger.isEnabledFor(logging.DEBUG):
+      # The message might get changed after we return, so format it now.
+      logger.debug("Writing message: %s", str(message))
 
-    self.__write_all(complete_message)
+    self.write_frame(encode_frame(message))
 
-  def read_message(self):
-    """ Reads a Protobuf message from the serial port.
+  def read_frame(self):
+    """ Reads a frame from the serial port, without unstuffing it.
     Returns:
-      The message that it read. """
+      The frame that it read, without the separator. """
     if not len(self.__message_queue):
       # We don't have any buffered messages, so we need to receive more.
 
@@ -113,14 +169,24 @@ class SerialCom(object):
       # Read from the serial.
       self.__read_until_separator()
 
-    bin_message = self.__message_queue.pop()
+    frame = self.__message_queue.pop()
 
-    # Unstuff the message.
-    cows.cows_unstuff(bin_message)
-    # Deserialize the message, skipping the overhead word.
-    message = sim_message_pb2.SimMessage()
-    message.ParseFromString(bin_message[2:])
+    registry = metrics.get_registry()
+    if registry is not None:
+      registry.get_counter("serial.frames_read").increment()
+      # Count the separator too, so this matches bytes_written.
+      registry.get_counter("serial.bytes_read") \
+          .increment(len(frame) + len(self._SEPARATOR))
+
+    return frame
+
+  def read_message(self):
+    """ Reads a Protobuf message from the serial port.
+    Returns:
+      The message that it read. """
+    message = decode_frame(self.read_frame())
 
-    logger.debug("Read message: %s" % (str(message)))
+    if logger.isEnabledFor(logging.DEBUG):
+      logger.debug("Read message: %s", str(message))
 
     return message
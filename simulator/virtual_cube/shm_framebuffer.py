@@ -0,0 +1,212 @@
+import mmap
+import os
+import struct
+
+
+""" Lets the host see what a cube VM draws on its screen, through a
+shared-memory region that is mapped into the VM with ivshmem.
+
+The region starts with a header, followed by the pixels, in row-major RGB
+order with one byte per channel. The header contains, in little-endian order:
+  magic: The four bytes "MCFB".
+  frame: A 32-bit frame counter. The writer makes it odd while it is changing
+         the pixels, and even again once it is done.
+  width, height: The size of the screen, as 16-bit values.
+  dirty_x, dirty_y, dirty_width, dirty_height: The region that changed in the
+                                                last frame, as 16-bit values.
+"""
+
+
+# Header at the start of the region.
+_HEADER = struct.Struct("<4sIHHHHHH")
+# Offset of the frame counter in the header.
+_FRAME_OFFSET = 4
+_FRAME = struct.Struct("<I")
+# Magic bytes that identify a framebuffer region.
+_MAGIC = "MCFB"
+# Bytes per pixel.
+_PIXEL_SIZE = 3
+
+# How many times to try reading a frame if it keeps changing under us.
+_READ_ATTEMPTS = 3
+
+
+def get_region_size(size):
+  """ Gets the size of the shared-memory region needed for a screen.
+  Args:
+    size: The width and height of the screen.
+  Returns:
+    The size of the region, in bytes. """
+  width, height = size
+  return _HEADER.size + width * height * _PIXEL_SIZE
+
+
+class ShmFramebufferWriter(object):
+  """ Writes screen contents into a shared-memory framebuffer. This is what the
+  graphics context in the VM does. It is mostly useful for testing. """
+
+  def __init__(self, path, size):
+    """
+    Args:
+      path: The file backing the shared memory. It is created if it doesn't
+            exist.
+      size: The width and height of the screen. """
+    self.__width, self.__height = size
+    self.__frame = 0
+
+    region_size = get_region_size(size)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT)
+    try:
+      if os.fstat(fd).st_size < region_size:
+        os.ftruncate(fd, region_size)
+      self.__memory = mmap.mmap(fd, region_size)
+    finally:
+      os.close(fd)
+
+    self.__write_header(0, 0, 0, 0)
+
+  def __write_header(self, x, y, width, height):
+    """ Writes the header.
+    Args:
+      x: The left edge of the dirty region.
+      y: The top edge of the dirty region.
+      width: The width of the dirty region.
+      height: The height of the dirty region. """
+    _HEADER.pack_into(self.__memory, 0, _MAGIC, self.__frame, self.__width,
+                      self.__height, x, y, width, height)
+
+  def write_region(self, x, y, width, height, pixels):
+    """ Replaces part of the screen.
+    Args:
+      x: The left edge of the region.
+      y: The top edge of the region.
+      width: The width of the region.
+      height: The height of the region.
+      pixels: The new pixels for the region, in row-major RGB order. """
+    if (x + width > self.__width or y + height > self.__height):
+      raise ValueError("Region does not fit on the screen.")
+    if len(pixels) != width * height * _PIXEL_SIZE:
+      raise ValueError("Expected %d bytes of pixels, got %d." % \
+                       (width * height * _PIXEL_SIZE, len(pixels)))
+
+    # Mark the frame as in progress.
+    self.__frame += 1
+    _FRAME.pack_into(self.__memory, _FRAME_OFFSET, self.__frame)
+
+    row_size = width * _PIXEL_SIZE
+    for row in range(height):
+      offset = _HEADER.size + \
+               ((y + row) * self.__width + x) * _PIXEL_SIZE
+      self.__memory[offset:offset + row_size] = \
+          pixels[row * row_size:(row + 1) * row_size]
+
+    # Mark it as done.
+    self.__frame += 1
+    self.__write_header(x, y, width, height)
+
+  def close(self):
+    """ Unmaps the shared memory. """
+    self.__memory.close()
+
+
+class ShmFramebufferReader(object):
+  """ Reads screen contents from a shared-memory framebuffer. The frame counter
+  is used to tell when something changed, so checking for updates is cheap, and
+  only the region that changed gets copied out. """
+
+  def __init__(self, path):
+    """
+    Args:
+      path: The file backing the shared memory. """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+      self.__memory = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    finally:
+      os.close(fd)
+
+    if len(self.__memory) < _HEADER.size:
+      raise ValueError("'%s' is too small to be a framebuffer." % (path))
+    magic, _, self.__width, self.__height, _, _, _, _ = \
+        _HEADER.unpack_from(self.__memory, 0)
+    if magic != _MAGIC:
+      raise ValueError("'%s' is not a framebuffer." % (path))
+    if len(self.__memory) < get_region_size((self.__width, self.__height)):
+      raise ValueError("Framebuffer in '%s' is truncated." % (path))
+
+    # The last frame that we read, or None if we haven't read any yet.
+    self.__last_frame = None
+
+  def __get_frame(self):
+    """
+    Returns:
+      The current value of the frame counter. """
+    return _FRAME.unpack_from(self.__memory, _FRAME_OFFSET)[0]
+
+  def __copy_region(self, x, y, width, height):
+    """ Copies pixels out of the shared memory.
+    Args:
+      x: The left edge of the region.
+      y: The top edge of the region.
+      width: The width of the region.
+      height: The height of the region.
+    Returns:
+      The pixels, in row-major RGB order. """
+    if width == self.__width:
+      # The rows are contiguous.
+      offset = _HEADER.size + y * width * _PIXEL_SIZE
+      return self.__memory[offset:offset + width * height * _PIXEL_SIZE]
+
+    row_size = width * _PIXEL_SIZE
+    rows = []
+    for row in range(y, y + height):
+      offset = _HEADER.size + (row * self.__width + x) * _PIXEL_SIZE
+      rows.append(self.__memory[offset:offset + row_size])
+    return "".join(rows)
+
+  def get_size(self):
+    """
+    Returns:
+      The width and height of the screen. """
+    return (self.__width, self.__height)
+
+  def get_frame(self):
+    """
+    Returns:
+      The last frame that was read, or None if nothing was read yet. """
+    return self.__last_frame
+
+  def read_update(self):
+    """ Reads whatever changed since the last call. This never blocks.
+    Returns:
+      None if nothing changed, otherwise a tuple of the x position, y position,
+      width and height of the region that changed, and its pixels. """
+    for _ in range(_READ_ATTEMPTS):
+      frame = self.__get_frame()
+      if frame == self.__last_frame:
+        # Nothing changed.
+        return None
+      if frame % 2:
+        # The writer is in the middle of a frame.
+        continue
+
+      _, _, _, _, x, y, width, height = _HEADER.unpack_from(self.__memory, 0)
+      if (self.__last_frame is None or frame - self.__last_frame != 2):
+        # We missed at least one frame, so the dirty region doesn't tell us
+        # everything that changed.
+        x, y = 0, 0
+        width, height = self.__width, self.__height
+
+      pixels = self.__copy_region(x, y, width, height)
+      if self.__get_frame() != frame:
+        # It changed while we were reading.
+        continue
+
+      self.__last_frame = frame
+      return (x, y, width, height, pixels)
+
+    # Try again next time.
+    return None
+
+  def close(self):
+    """ Unmaps the shared memory. """
+    self.__memory.close()
@@ -47,7 +47,11 @@ class TestCubeVm(unittest.TestCase):
     # Make sure it started the process.
     expected_command = [cube_vm.CubeVm._QEMU_BIN, "-readconfig",
                         cube_vm.CubeVm._QEMU_CONFIG, "-nographic", "-chardev",
-                        "socket,path=/tmp/cube0,server,nowait,id=vcube_ser"]
+                        "socket,path=/tmp/cube0,server,nowait,id=vcube_ser",
+                        "-object",
+                        "memory-backend-file,id=vcube_fb,share=on,"
+                        "mem-path=/tmp/cube0_fb,size=128K",
+                        "-device", "ivshmem-plain,memdev=vcube_fb"]
     mocked_popen.assert_called_once_with(expected_command,
                                          stdin=subprocess.PIPE,
                                          stdout=subprocess.PIPE)
@@ -71,7 +75,11 @@ class TestCubeVm(unittest.TestCase):
     # Make sure it started the process.
     expected_command = [cube_vm.CubeVm._QEMU_BIN, "-readconfig",
                         cube_vm.CubeVm._QEMU_CONFIG, "-nographic", "-chardev",
-                        "socket,path=/tmp/cube0,server,nowait,id=vcube_ser"]
+                        "socket,path=/tmp/cube0,server,nowait,id=vcube_ser",
+                        "-object",
+                        "memory-backend-file,id=vcube_fb,share=on,"
+                        "mem-path=/tmp/cube0_fb,size=128K",
+                        "-device", "ivshmem-plain,memdev=vcube_fb"]
     mocked_popen.assert_called_once_with(expected_command,
                                          stdin=subprocess.PIPE,
                                          stdout=subprocess.PIPE)
@@ -82,6 +90,10 @@ class TestCubeVm(unittest.TestCase):
     # It should have started the serial interface.
     self.__serial = mocked_serial.assert_called_once_with("/tmp/cube0")
 
+  def test_get_framebuffer_file(self):
+    """ Tests that get_framebuffer_file() works under normal conditions. """
+    self.assertEqual("/tmp/cube0_fb", self.__cube.get_framebuffer_file())
+
   @mock.patch("subprocess.Popen")
   @mock.patch("simulator.virtual_cube.serial_com.SerialCom")
   @mock.patch("os.path.exists")
@@ -0,0 +1,145 @@
+import unittest
+
+from apps.libmc.sim.protobuf import display_message_pb2
+
+from simulator.virtual_cube import display_update
+
+
+class TestRle(unittest.TestCase):
+  """ Tests for the run-length encoding functions. """
+
+  def test_round_trip(self):
+    """ Tests that data survives encoding and decoding. """
+    pixels = bytearray("\x01\x02\x03" * 300 + "\x04\x05\x06" + "\x00" * 30)
+    encoded = display_update.rle_encode(pixels)
+
+    # Runs longer than 255 pixels need to be split.
+    self.assertEqual(bytearray("\xff\x01\x02\x03\x2d\x01\x02\x03"),
+                     encoded[:8])
+    self.assertEqual(pixels, display_update.rle_decode(encoded))
+
+  def test_truncated(self):
+    """ Tests that decoding fails on truncated data. """
+    with self.assertRaises(ValueError):
+      display_update.rle_decode("\x01\x02\x03")
+
+
+class TestDisplayUpdate(unittest.TestCase):
+  """ Tests for the display update encoder and decoder. """
+
+  def setUp(self):
+    self.__size = (8, 6)
+    self.__encoder = display_update.DisplayUpdateEncoder(self.__size)
+    self.__decoder = display_update.DisplayUpdateDecoder(self.__size)
+
+    # Start with a black screen.
+    self.__pixels = bytearray(8 * 6 * 3)
+
+  def __set_pixel(self, x, y, value):
+    """ Sets a pixel in the test screen.
+    Args:
+      x: The x position of the pixel.
+      y: The y position of the pixel.
+      value: The value to set all the channels to. """
+    offset = (y * 8 + x) * 3
+    self.__pixels[offset:offset + 3] = chr(value) * 3
+
+  def __send(self):
+    """ Encodes the test screen and applies it to the decoder.
+    Returns:
+      The SimMessage that was sent, and the regions that the decoder returned.
+    """
+    message = self.__encoder.encode(self.__pixels)
+    if message is None:
+      return None, []
+
+    regions = self.__decoder.apply(message.display)
+    self.assertEqual(self.__pixels, self.__decoder.get_pixels())
+    return message, regions
+
+  def test_first_frame(self):
+    """ Tests that the first frame contains the whole screen. """
+    message, regions = self.__send()
+
+    self.assertEqual(1, len(message.display.rects))
+    rect = message.display.rects[0]
+    self.assertEqual((0, 0, 8, 6), (rect.x, rect.y, rect.width, rect.height))
+    # A black screen compresses well.
+    self.assertEqual(display_message_pb2.DirtyRect.RLE, rect.encoding)
+
+  def test_no_change(self):
+    """ Tests that nothing is sent if nothing changed. """
+    self.__send()
+    message, _ = self.__send()
+    self.assertIsNone(message)
+
+  def test_dirty_rects(self):
+    """ Tests that only the changed regions are sent. """
+    self.__send()
+
+    # Two separate bands of changed rows.
+    self.__set_pixel(2, 1, 10)
+    self.__set_pixel(4, 2, 20)
+    self.__set_pixel(7, 5, 30)
+    message, regions = self.__send()
+
+    self.assertEqual(2, message.display.frame)
+    self.assertEqual([(2, 1, 3, 2), (7, 5, 1, 1)],
+                     [region[:4] for region in regions])
+    self.assertEqual("\x1e" * 3, regions[1][4])
+
+  def test_relative_updates(self):
+    """ Tests that updates relative to the last frame work. """
+    # Fill the screen with something that doesn't compress well.
+    self.__pixels = bytearray(i % 251 for i in range(len(self.__pixels)))
+    self.__send()
+
+    # Change both ends of a row, so the pixels in between are unchanged.
+    self.__set_pixel(0, 2, 0)
+    self.__set_pixel(7, 2, 0)
+    message, regions = self.__send()
+
+    rect = message.display.rects[0]
+    self.assertEqual((0, 2, 8, 1), (rect.x, rect.y, rect.width, rect.height))
+    self.assertEqual(display_message_pb2.DirtyRect.XOR_RLE, rect.encoding)
+    self.assertLess(len(rect.data), 8 * 3)
+
+  def test_single_pixel(self):
+    """ Tests that tiny regions are sent raw. """
+    self.__send()
+
+    self.__set_pixel(3, 3, 9)
+    message, _ = self.__send()
+    self.assertEqual(display_message_pb2.DirtyRect.RAW,
+                     message.display.rects[0].encoding)
+
+  def test_missed_frame(self):
+    """ Tests that the decoder rejects relative updates if it missed a frame.
+    """
+    self.__send()
+
+    self.__pixels = bytearray("\x01" * len(self.__pixels))
+    self.__encoder.encode(self.__pixels)
+    self.__set_pixel(0, 0, 5)
+    self.__set_pixel(7, 5, 5)
+    message = self.__encoder.encode(self.__pixels)
+    # Only the last rect is relative.
+    self.assertEqual(2, len(message.display.rects))
+    message.display.rects[1].encoding = \
+        display_message_pb2.DirtyRect.XOR_RLE
+
+    before = bytearray(self.__decoder.get_pixels())
+    with self.assertRaises(ValueError):
+      self.__decoder.apply(message.display)
+
+    # The first rect was fine, but nothing should have been applied.
+    self.assertEqual(before, self.__decoder.get_pixels())
+
+    # After a reset, it should get back in sync.
+    self.__encoder.reset()
+    self.__set_pixel(1, 1, 7)
+    self.__send()
+
+
+if __name__ == "__main__":
+  unittest.main()
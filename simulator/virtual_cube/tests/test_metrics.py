@@ -0,0 +1,109 @@
+import json
+import os
+import tempfile
+import unittest
+
+from simulator.virtual_cube import metrics
+
+
+class TestCounter(unittest.TestCase):
+  """ Tests for the Counter class. """
+
+  def test_increment(self):
+    """ Tests that we can count things, with and without labels. """
+    counter = metrics.Counter()
+
+    counter.increment()
+    counter.increment(amount=2, label=1)
+    counter.increment(label=2)
+
+    self.assertEqual(4, counter.get_value())
+    self.assertEqual(2, counter.get_value(label=1))
+    self.assertEqual(1, counter.get_value(label=2))
+    self.assertEqual(0, counter.get_value(label=3))
+
+    self.assertEqual({"value": 4, "labels": {"1": 2, "2": 1}},
+                     counter.snapshot())
+
+
+class TestHistogram(unittest.TestCase):
+  """ Tests for the Histogram class. """
+
+  def test_observe(self):
+    """ Tests that values go into the right buckets. """
+    histogram = metrics.Histogram((1, 10, 100))
+
+    for value in (0.5, 1, 5, 50, 500, 1000):
+      histogram.observe(value)
+
+    self.assertEqual([2, 1, 1, 2], histogram.get_counts())
+    self.assertEqual(6, histogram.get_count())
+    self.assertEqual(1556.5, histogram.get_total())
+
+    snapshot = histogram.snapshot()
+    self.assertEqual(1000, snapshot["max"])
+    self.assertEqual([1, 10, 100], snapshot["buckets"])
+
+  def test_unsorted_buckets(self):
+    """ Tests that it rejects buckets that aren't in order. """
+    with self.assertRaises(ValueError):
+      metrics.Histogram((10, 1))
+
+
+class TestMetricsRegistry(unittest.TestCase):
+  """ Tests for the MetricsRegistry class. """
+
+  def setUp(self):
+    self.__registry = metrics.MetricsRegistry()
+
+  def test_get_metrics(self):
+    """ Tests that metrics are created once, and then reused. """
+    counter = self.__registry.get_counter("counter")
+    self.assertIs(counter, self.__registry.get_counter("counter"))
+
+    histogram = self.__registry.get_histogram("histogram")
+    self.assertIs(histogram, self.__registry.get_histogram("histogram"))
+    self.assertEqual(metrics.TIME_BUCKETS, histogram.get_buckets())
+
+  def test_dump(self):
+    """ Tests that we can write a snapshot to a file. """
+    self.__registry.get_counter("counter").increment()
+    self.__registry.get_histogram("sizes", metrics.SIZE_BUCKETS).observe(20)
+
+    dump_file, path = tempfile.mkstemp()
+    os.close(dump_file)
+    try:
+      self.__registry.dump(path)
+
+      with open(path) as dump_file:
+        snapshot = json.load(dump_file)
+    finally:
+      os.remove(path)
+
+    self.assertEqual(1, snapshot["counters"]["counter"]["value"])
+    self.assertEqual(1, snapshot["histograms"]["sizes"]["counts"][1])
+
+
+class TestEnable(unittest.TestCase):
+  """ Tests for turning metrics collection on and off. """
+
+  def tearDown(self):
+    metrics.disable()
+
+  def test_enable(self):
+    """ Tests that there is only a registry while metrics are enabled. """
+    self.assertIsNone(metrics.get_registry())
+    self.assertIsNone(metrics.snapshot())
+
+    registry = metrics.enable()
+    self.assertIs(registry, metrics.get_registry())
+    # Enabling it again should do nothing.
+    self.assertIs(registry, metrics.enable())
+    self.assertEqual({}, metrics.snapshot()["counters"])
+
+    self.assertIs(registry, metrics.disable())
+    self.assertIsNone(metrics.get_registry())
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -3,10 +3,12 @@ import unittest
 
 from apps.libmc.sim.protobuf import test_pb2
 
+from simulator.virtual_cube import metrics
 from simulator.virtual_cube import serial_com
 
 
 _SEPARATOR = serial_com.SerialCom._SEPARATOR
+_READ_SIZE = serial_com.SerialCom._READ_SIZE
 
 
 class TestSerialCom(unittest.TestCase):
@@ -129,6 +131,27 @@ class TestSerialCom(unittest.TestCase):
                       mock.call.send(_SEPARATOR)]
     mocked_socket.assert_has_calls(expected_calls)
 
+  def test_byte_counts(self):
+    """ Tests that the bytes read and written are counted the same way. """
+    registry = metrics.enable()
+    self.addCleanup(metrics.disable)
+
+    com, mocked_socket = self.__make_serial()
+
+    # Write a frame, and then read back exactly what was written.
+    frame = bytearray(b"\x01\x02\x03")
+    mocked_socket.send.side_effect = len
+    com.write_frame(frame)
+    written, = mocked_socket.send.call_args[0]
+
+    mocked_socket.recv.side_effect = [_SEPARATOR, bytes(written)]
+    self.assertEqual(frame, com.read_frame())
+
+    bytes_written = registry.get_counter("serial.bytes_written").get_value()
+    self.assertEqual(len(frame) + len(_SEPARATOR), bytes_written)
+    self.assertEqual(bytes_written,
+                     registry.get_counter("serial.bytes_read").get_value())
+
   @mock.patch("simulator.virtual_cube.cows.cows_unstuff")
   @mock.patch("apps.libmc.sim.protobuf.sim_message_pb2.SimMessage")
   def test_read_message(self, mocked_sys_action, mocked_cows):
@@ -158,7 +181,7 @@ class TestSerialCom(unittest.TestCase):
     # The first call to read() should have been for the initial separator. The
     # second call should have been for the message and ending separator.
     expected_calls = [mock.call.recv(len(_SEPARATOR)),
-                      mock.call.recv()]
+                      mock.call.recv(_READ_SIZE)]
     mocked_socket.assert_has_calls(expected_calls)
     # It should have tried to unstuff it.
     mocked_cows.assert_called_once()
@@ -202,9 +225,9 @@ class TestSerialCom(unittest.TestCase):
     # and the fourth call should have been for reading the rest of the message
     # and the next separator.
     expected_calls = [mock.call.recv(len(_SEPARATOR)),
-                      mock.call.recv(),
-                      mock.call.recv(),
-                      mock.call.recv()]
+                      mock.call.recv(_READ_SIZE),
+                      mock.call.recv(_READ_SIZE),
+                      mock.call.recv(_READ_SIZE)]
     mocked_socket.assert_has_calls(expected_calls)
     # It should have tried to unstuff it.
     mocked_cows.assert_called_once()
@@ -252,7 +275,7 @@ class TestSerialCom(unittest.TestCase):
     # second call should have been for the first message, ending separator,
     # and second message and its ending separator.
     expected_calls = [mock.call.recv(len(_SEPARATOR)),
-                      mock.call.recv()]
+                      mock.call.recv(_READ_SIZE)]
     mocked_socket.assert_has_calls(expected_calls)
     mocked_socket.recv.reset_mock()
     # It should have tried to unstuff it.
@@ -313,7 +336,7 @@ class TestSerialCom(unittest.TestCase):
     # second call should have been for the first message, ending separator, and
     # first byte of the second message.
     expected_calls = [mock.call.recv(len(_SEPARATOR)),
-                      mock.call.recv()]
+                      mock.call.recv(_READ_SIZE)]
     mocked_socket.assert_has_calls(expected_calls)
     mocked_socket.recv.reset_mock()
     # It should have tried to unstuff it.
@@ -332,7 +355,7 @@ class TestSerialCom(unittest.TestCase):
 
     # It should have made one call to recv() which should have gotten the end of
     # the second message plus the ending separator.
-    mocked_socket.recv.assert_called_once_with()
+    mocked_socket.recv.assert_called_once_with(_READ_SIZE)
     # It should have tried to unstuff it.
     mocked_cows.assert_called_once()
 
@@ -367,7 +390,7 @@ class TestSerialCom(unittest.TestCase):
     # Make sure it tried to call read the proper number of times.
     expected_calls = [mock.call.recv(len(_SEPARATOR)),
                       mock.call.recv(1), mock.call.recv(1),
-                      mock.call.recv(1), mock.call.recv()]
+                      mock.call.recv(1), mock.call.recv(_READ_SIZE)]
     mocked_socket.assert_has_calls(expected_calls)
     # It should have tried to unstuff the message.
     mocked_cows.assert_called_once()
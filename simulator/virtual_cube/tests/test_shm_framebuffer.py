@@ -0,0 +1,105 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from simulator.virtual_cube import shm_framebuffer
+
+
+class TestShmFramebuffer(unittest.TestCase):
+  """ Tests for the shared-memory framebuffer. """
+
+  def setUp(self):
+    self.__dir = tempfile.mkdtemp()
+    self.__path = os.path.join(self.__dir, "cube0_fb")
+
+    # Create a small framebuffer for testing.
+    self.__writer = shm_framebuffer.ShmFramebufferWriter(self.__path, (4, 3))
+    self.__reader = shm_framebuffer.ShmFramebufferReader(self.__path)
+
+  def tearDown(self):
+    self.__writer.close()
+    self.__reader.close()
+    shutil.rmtree(self.__dir)
+
+  def __make_pixels(self, width, height, value):
+    """ Creates pixels for a region.
+    Args:
+      width: The width of the region.
+      height: The height of the region.
+      value: The value to set every byte to.
+    Returns:
+      The pixel data. """
+    return chr(value) * (width * height * 3)
+
+  def test_get_size(self):
+    """ Tests that the reader gets the size from the header. """
+    self.assertEqual((4, 3), self.__reader.get_size())
+
+  def test_first_read(self):
+    """ Tests that the first read gets the whole screen. """
+    update = self.__reader.read_update()
+    self.assertEqual((0, 0, 4, 3, "\x00" * 36), update)
+
+    # Nothing changed since.
+    self.assertIsNone(self.__reader.read_update())
+
+  def test_dirty_region(self):
+    """ Tests that only the region that changed gets read. """
+    self.__reader.read_update()
+
+    self.__writer.write_region(1, 1, 2, 2, self.__make_pixels(2, 2, 7))
+    update = self.__reader.read_update()
+    self.assertEqual((1, 1, 2, 2, self.__make_pixels(2, 2, 7)), update)
+    self.assertEqual(2, self.__reader.get_frame())
+
+    # The rest of the screen should be untouched.
+    self.__writer.write_region(0, 0, 4, 1, self.__make_pixels(4, 1, 1))
+    x, y, width, height, pixels = self.__reader.read_update()
+    self.assertEqual((0, 0, 4, 1), (x, y, width, height))
+    self.assertEqual(self.__make_pixels(4, 1, 1), pixels)
+
+  def test_missed_frames(self):
+    """ Tests that we read the whole screen if we missed a frame. """
+    self.__reader.read_update()
+
+    self.__writer.write_region(0, 0, 1, 1, self.__make_pixels(1, 1, 5))
+    self.__writer.write_region(3, 2, 1, 1, self.__make_pixels(1, 1, 9))
+
+    x, y, width, height, pixels = self.__reader.read_update()
+    self.assertEqual((0, 0, 4, 3), (x, y, width, height))
+    self.assertEqual("\x05\x05\x05", pixels[:3])
+    self.assertEqual("\x09\x09\x09", pixels[-3:])
+
+  def test_frame_in_progress(self):
+    """ Tests that we don't read a frame that is still being written. """
+    self.__reader.read_update()
+
+    # Make it look like the writer is in the middle of a frame.
+    with open(self.__path, "r+b") as shm_file:
+      shm_file.seek(4)
+      shm_file.write(struct.pack("<I", 1))
+
+    self.assertIsNone(self.__reader.read_update())
+    self.assertEqual(0, self.__reader.get_frame())
+
+  def test_bad_region(self):
+    """ Tests that the writer rejects regions that don't fit. """
+    with self.assertRaises(ValueError):
+      self.__writer.write_region(3, 0, 2, 1, self.__make_pixels(2, 1, 0))
+    with self.assertRaises(ValueError):
+      self.__writer.write_region(0, 0, 2, 1, self.__make_pixels(1, 1, 0))
+
+  def test_bad_magic(self):
+    """ Tests that the reader rejects files that aren't framebuffers. """
+    path = os.path.join(self.__dir, "not_fb")
+    with open(path, "wb") as bad_file:
+      bad_file.write("\x00" * 64)
+
+    with self.assertRaises(ValueError):
+      shm_framebuffer.ShmFramebufferReader(path)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,114 @@
+import mock
+import threading
+import unittest
+
+from apps.libmc.sim.protobuf import sim_message_pb2
+
+from simulator.virtual_cube import serial_com
+from simulator.virtual_cube import vm_link
+
+
+class TestVmLink(unittest.TestCase):
+  """ Tests for the VmLink class. """
+
+  def setUp(self):
+    # Messages that the fake VM will produce. The reader blocks until something
+    # is put here, like it would on the serial.
+    self.__from_vm = []
+    self.__from_vm_ready = threading.Semaphore(0)
+    # Set when the fake VM has received a message.
+    self.__sent = threading.Event()
+
+    self.__vm = mock.Mock()
+    self.__vm.receive_frame.side_effect = self.__receive
+    self.__vm.send_message.side_effect = lambda message: self.__sent.set()
+
+    self.__link = vm_link.VmLink(self.__vm, max_queued=2)
+
+  def tearDown(self):
+    # Unblock the reader so the thread can exit.
+    self.__from_vm.append(bytearray())
+    self.__from_vm_ready.release()
+    self.__link.stop()
+
+  def __receive(self):
+    """ Fake version of CubeVm.receive_frame().
+    Returns:
+      The next frame from the fake VM. """
+    self.__from_vm_ready.acquire()
+    return self.__from_vm.pop(0)
+
+  def test_send(self):
+    """ Tests that messages get sent to the VM. """
+    message = mock.Mock()
+    self.assertTrue(self.__link.send(message))
+
+    self.assertTrue(self.__sent.wait(5))
+    self.__vm.send_message.assert_called_once_with(message)
+
+  def test_send_frame(self):
+    """ Tests that encoded frames get sent to the VM through the same queue. """
+    sent_frame = threading.Event()
+    self.__vm.send_frame.side_effect = lambda frame: sent_frame.set()
+
+    frame = bytearray("\x00\x01hello")
+    self.assertTrue(self.__link.send_frame(frame))
+
+    self.assertTrue(sent_frame.wait(5))
+    self.__vm.send_frame.assert_called_once_with(frame)
+    self.assertFalse(self.__vm.send_message.called)
+
+  def test_switch(self):
+    """ Tests that the link registers itself with a switch. """
+    switch = mock.Mock()
+    link = vm_link.VmLink(self.__vm, switch=switch)
+    switch.attach.assert_called_once_with(self.__vm, link)
+
+    link.stop()
+    switch.detach.assert_called_once_with(self.__vm)
+
+  def test_receive(self):
+    """ Tests that messages from the VM can be picked up. """
+    # Nothing received yet, and it shouldn't block.
+    self.assertEqual([], self.__link.get_messages())
+
+    message1 = sim_message_pb2.SimMessage()
+    message1.system.shutdown = True
+    message2 = sim_message_pb2.SimMessage()
+    message2.cube_message.data = "hello"
+    self.__from_vm.extend([serial_com.encode_frame(message1),
+                           serial_com.encode_frame(message2)])
+    self.__from_vm_ready.release()
+    self.__from_vm_ready.release()
+
+    messages = []
+    for _ in range(100):
+      messages.extend(self.__link.get_messages())
+      if len(messages) == 2:
+        break
+      threading.Event().wait(0.01)
+
+    self.assertEqual([message1, message2], messages)
+
+  def test_slow_vm(self):
+    """ Tests that sending doesn't block if the VM stops reading. """
+    # Make the VM hang on the first message.
+    unblock = threading.Event()
+    def hang(message):
+      self.__sent.set()
+      unblock.wait()
+    self.__vm.send_message.side_effect = hang
+
+    self.__link.send("first")
+    self.assertTrue(self.__sent.wait(5))
+
+    # Now the queue fills up and more messages get dropped.
+    self.assertTrue(self.__link.send("second"))
+    self.assertTrue(self.__link.send("third"))
+    self.assertFalse(self.__link.send("fourth"))
+
+    unblock.set()
+
+
+if __name__ == "__main__":
+  unittest.main()
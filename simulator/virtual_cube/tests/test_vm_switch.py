@@ -0,0 +1,112 @@
+import mock
+import unittest
+
+from apps.libmc.sim.protobuf import cube_message_pb2
+from apps.libmc.sim.protobuf import sim_message_pb2
+
+from simulator.virtual_cube import serial_com
+from simulator.virtual_cube import vm_switch
+
+
+class TestVmSwitch(unittest.TestCase):
+  """ Tests for the VM switch. """
+
+  def setUp(self):
+    self.__switch = vm_switch.VmSwitch()
+
+    self.__vm1 = mock.Mock()
+    self.__vm2 = mock.Mock()
+
+    # Frames for the second VM get queued on its link.
+    self.__link2 = mock.Mock()
+    self.__switch.attach(self.__vm2, self.__link2)
+
+  def __make_frame(self, side, data, codec="binary"):
+    """ Creates a stuffed frame containing a neighbor message.
+    Args:
+      side: The side to send it on.
+      data: The message data.
+      codec: The name of the codec.
+    Returns:
+      The frame. """
+    message = sim_message_pb2.SimMessage()
+    message.cube_message.side = side
+    message.cube_message.codec = codec
+    message.cube_message.data = data
+
+    return serial_com.encode_frame(message)
+
+  def test_find_side(self):
+    """ Tests that we can find the side in stuffed frames. """
+    for data in ["", "\x00" * 10, "\x01\x00\x00\x02" * 100, "x" * 1000]:
+      frame = self.__make_frame(cube_message_pb2.RIGHT, data)
+
+      index = vm_switch.find_side(frame)
+      self.assertIsNotNone(index)
+      self.assertEqual(cube_message_pb2.RIGHT, frame[index])
+
+  def test_find_side_other_messages(self):
+    """ Tests that other messages are left alone. """
+    message = sim_message_pb2.SimMessage()
+    message.system.shutdown = True
+    self.assertIsNone(vm_switch.find_side(serial_com.encode_frame(message)))
+
+    # No side at all.
+    message = sim_message_pb2.SimMessage()
+    message.cube_message.data = "hello"
+    self.assertIsNone(vm_switch.find_side(serial_com.encode_frame(message)))
+
+    # A zero word was stuffed before the side.
+    frame = bytearray("\x00\x01\x22\x02\x08\x01")
+    self.assertIsNone(vm_switch.find_side(frame))
+
+  def test_forward(self):
+    """ Tests that frames are forwarded across links. """
+    self.__switch.connect(self.__vm1, cube_message_pb2.RIGHT, self.__vm2,
+                          cube_message_pb2.LEFT)
+
+    frame = self.__make_frame(cube_message_pb2.RIGHT, "\x00\x00hello")
+    self.assertTrue(self.__switch.forward(self.__vm1, frame))
+    self.assertEqual(1, self.__switch.get_forwarded())
+
+    # It should be queued for the other side, and still decode properly.
+    self.assertFalse(self.__vm2.send_frame.called)
+    sent, = self.__link2.send_frame.call_args[0]
+    message = serial_com.decode_frame(sent)
+    self.assertEqual(cube_message_pb2.LEFT, message.cube_message.side)
+    self.assertEqual("\x00\x00hello", message.cube_message.data)
+    self.assertEqual("binary", message.cube_message.codec)
+
+  def test_forward_unlinked(self):
+    """ Tests that frames aren't forwarded without a link. """
+    self.__switch.connect(self.__vm1, cube_message_pb2.RIGHT, self.__vm2,
+                          cube_message_pb2.LEFT)
+
+    # Wrong side.
+    frame = self.__make_frame(cube_message_pb2.TOP, "hello")
+    self.assertFalse(self.__switch.forward(self.__vm1, frame))
+    # Wrong VM.
+    frame = self.__make_frame(cube_message_pb2.RIGHT, "hello")
+    self.assertFalse(self.__switch.forward(self.__vm2, frame))
+
+    # Disconnected.
+    self.__switch.disconnect(self.__vm1, cube_message_pb2.RIGHT)
+    self.assertFalse(self.__switch.forward(self.__vm1, frame))
+
+    self.assertFalse(self.__link2.send_frame.called)
+    self.assertEqual(0, self.__switch.get_forwarded())
+
+  def test_forward_detached(self):
+    """ Tests that frames aren't forwarded to VMs without a link. """
+    self.__switch.connect(self.__vm1, cube_message_pb2.RIGHT, self.__vm2,
+                          cube_message_pb2.LEFT)
+    self.__switch.detach(self.__vm2)
+
+    frame = self.__make_frame(cube_message_pb2.RIGHT, "hello")
+    self.assertFalse(self.__switch.forward(self.__vm1, frame))
+    self.assertFalse(self.__link2.send_frame.called)
+    self.assertEqual(0, self.__switch.get_forwarded())
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,149 @@
+import logging
+import Queue
+import threading
+
+import serial_com
+
+
+logger = logging.getLogger(__name__)
+
+
+class VmLink(object):
+  """ Talks to a cube VM without ever blocking the caller. Messages are sent and
+  received by background threads, so a VM that is slow to read or write only
+  holds up its own threads. """
+
+  def __init__(self, vm, max_queued=1024, switch=None):
+    """
+    Args:
+      vm: The CubeVm to talk to.
+      max_queued: The maximum number of messages that can be waiting to be sent.
+                  If the VM falls further behind than this, new messages get
+                  dropped.
+      switch: If specified, a VmSwitch that gets the first chance to forward
+              everything that the VM sends, before it is decoded. """
+    self.__vm = vm
+    self.__switch = switch
+
+    # Messages and frames waiting to be sent to the VM, along with the method
+    # to send them with.
+    self.__outgoing = Queue.Queue(max_queued)
+    # Messages received from the VM that haven't been picked up yet.
+    self.__incoming = Queue.Queue()
+
+    self.__running = True
+
+    self.__writer = threading.Thread(target=self.__write_loop)
+    self.__writer.daemon = True
+    self.__writer.start()
+
+    self.__reader = threading.Thread(target=self.__read_loop)
+    self.__reader.daemon = True
+    self.__reader.start()
+
+    if self.__switch is not None:
+      # Frames forwarded from other VMs go through our queue.
+      self.__switch.attach(self.__vm, self)
+
+  def __write_loop(self):
+    """ Sends queued messages to the VM until the link is stopped. """
+    while True:
+      queued = self.__outgoing.get()
+      if queued is None:
+        # We were stopped.
+        return
+
+      send, message = queued
+      try:
+        send(message)
+      except Exception:
+        logger.exception("Failed to send message to VM.")
+
+  def __read_loop(self):
+    """ Receives messages from the VM until the link is stopped. """
+    while self.__running:
+      try:
+        frame = self.__vm.receive_frame()
+      except Exception:
+        if self.__running:
+          logger.exception("Failed to receive message from VM.")
+        return
+
+      if (self.__switch is not None and self.__switch.forward(self.__vm, frame)):
+        # It went straight to another VM.
+        continue
+
+      try:
+        message = serial_com.decode_frame(frame)
+      except Exception:
+        logger.exception("Failed to decode message from VM.")
+        continue
+
+      self.__incoming.put(message)
+
+  def __queue(self, send, message):
+    """ Queues something to be sent to the VM.
+    Args:
+      send: The method of the VM to send it with.
+      message: The message or frame to send.
+    Returns:
+      True if it was queued, false if it was dropped. """
+    try:
+      self.__outgoing.put_nowait((send, message))
+    except Queue.Full:
+      logger.warning("VM is not keeping up, dropping message.")
+      return False
+
+    return True
+
+  def send(self, message):
+    """ Queues a message to be sent to the VM. This never blocks.
+    Args:
+      message: The SimMessage to send.
+    Returns:
+      True if the message was queued, false if it was dropped because the VM is
+      too far behind. """
+    return self.__queue(self.__vm.send_message, message)
+
+  def send_frame(self, frame):
+    """ Queues a frame that was already encoded to be sent to the VM. This never
+    blocks.
+    Args:
+      frame: The COWS-stuffed frame to send, without the separator.
+    Returns:
+      True if the frame was queued, false if it was dropped because the VM is
+      too far behind. """
+    return self.__queue(self.__vm.send_frame, frame)
+
+  def get_messages(self):
+    """ Gets all the messages that were received from the VM so far. This never
+    blocks.
+    Returns:
+      A list of the SimMessages, in the order that they were received. """
+    messages = []
+    while True:
+      try:
+        messages.append(self.__incoming.get_nowait())
+      except Queue.Empty:
+        return messages
+
+  def stop(self):
+    """ Stops the background threads. The reader thread can't be interrupted
+    while it is waiting for the VM, so it only exits once the VM sends
+    something or shuts down. """
+    if self.__switch is not None:
+      self.__switch.detach(self.__vm)
+
+    self.__running = False
+    # Make sure the writer wakes up, even if the queue is full.
+    while True:
+      try:
+        self.__outgoing.put_nowait(None)
+        break
+      except Queue.Full:
+        try:
+          self.__outgoing.get_nowait()
+        except Queue.Empty:
+          pass
+
+    self.__writer.join()
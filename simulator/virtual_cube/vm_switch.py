@@ -0,0 +1,138 @@
+import threading
+
+
+""" Passes messages between adjacent cube VMs directly, without decoding them.
+
+VMs send messages for their neighbors as SimMessages that contain only a
+CubeMessage, so a frame always starts with the overhead word, the CubeMessage
+tag, its length, and then the tag and value of the side. None of these bytes
+are zero, so COWS leaves them alone unless they share a word with a zero that
+got stuffed, which can only happen if the overhead word points inside them.
+That means we can find and change the side without unstuffing the frame. """
+
+
+# Tag of the cube_message field in SimMessage.
+_CUBE_MESSAGE_TAG = 0x22
+# Tag of the side field in CubeMessage.
+_SIDE_TAG = 0x08
+# Size of the COWS overhead word.
+_OVERHEAD_SIZE = 2
+
+
+def find_side(frame):
+  """ Finds the side that a neighbor message in a stuffed frame is for.
+  Args:
+    frame: The COWS-stuffed frame.
+  Returns:
+    The index of the side byte in the frame, or None if the frame isn't a
+    neighbor message that we can handle without decoding it. """
+  if (len(frame) < _OVERHEAD_SIZE + 4 or \
+      frame[_OVERHEAD_SIZE] != _CUBE_MESSAGE_TAG):
+    return None
+
+  # Skip the length, which is a varint.
+  index = _OVERHEAD_SIZE + 1
+  while (index < len(frame) and frame[index] & 0x80):
+    index += 1
+  index += 1
+
+  if (index + 1 >= len(frame) or frame[index] != _SIDE_TAG):
+    return None
+  index += 1
+
+  # The overhead word is the index of the first word that was zero before
+  # stuffing. Everything before it is unchanged.
+  first_zero = (frame[0] << 8) | frame[1]
+  if index >= first_zero * 2:
+    return None
+
+  return index
+
+
+class VmSwitch(object):
+  """ Keeps track of which sides of which VMs are connected to other VMs, and
+  forwards frames across those links. It is safe to use from multiple
+  threads. """
+
+  def __init__(self):
+    # Maps each (VM, side) pair that is linked to the VM on the other end and
+    # the side that frames arrive on there. Sides are CubeSide values.
+    self.__links = {}
+    # Maps each VM to the VmLink that frames for it get queued on.
+    self.__vm_links = {}
+    self.__lock = threading.Lock()
+
+    # Number of frames that were forwarded directly.
+    self.__forwarded = 0
+
+  def attach(self, vm, link):
+    """ Registers the link that is used to send to a VM. Frames are only
+    forwarded to VMs that have one.
+    Args:
+      vm: The VM.
+      link: The VmLink that talks to it. """
+    with self.__lock:
+      self.__vm_links[vm] = link
+
+  def detach(self, vm):
+    """ Stops forwarding frames to a VM.
+    Args:
+      vm: The VM. """
+    with self.__lock:
+      self.__vm_links.pop(vm, None)
+
+  def connect(self, vm, side, other_vm, other_side):
+    """ Forwards frames that a VM sends on one side to another VM.
+    Args:
+      vm: The sending VM.
+      side: The side that it sends on, as a CubeSide value.
+      other_vm: The receiving VM.
+      other_side: The side that the frames arrive on, as a CubeSide value. """
+    with self.__lock:
+      self.__links[(vm, side)] = (other_vm, other_side)
+
+  def disconnect(self, vm, side):
+    """ Stops forwarding frames that a VM sends on one side.
+    Args:
+      vm: The sending VM.
+      side: The side, as a CubeSide value. """
+    with self.__lock:
+      self.__links.pop((vm, side), None)
+
+  def forward(self, vm, frame):
+    """ Forwards a frame directly to another VM if possible.
+    Args:
+      vm: The VM that sent the frame.
+      frame: The COWS-stuffed frame. It might get modified.
+    Returns:
+      True if the frame was forwarded, false if it has to be handled
+      normally. """
+    index = find_side(frame)
+    if index is None:
+      return False
+
+    with self.__lock:
+      destination = self.__links.get((vm, frame[index]))
+      if destination is None:
+        return False
+      other_vm, other_side = destination
+
+      other_link = self.__vm_links.get(other_vm)
+      if other_link is None:
+        # There is no way to send it without waiting on the other VM.
+        return False
+      self.__forwarded += 1
+
+    # Both sides are non-zero, so this doesn't affect the stuffing.
+    frame[index] = other_side
+    # This is called from the sending VM's reader thread, so it mustn't block
+    # if the other VM is slow.
+    other_link.send_frame(frame)
+
+    return True
+
+  def get_forwarded(self):
+    """
+    Returns:
+      The number of frames that were forwarded directly. """
+    return self.__forwarded
@@ -0,0 +1,252 @@
+import logging
+
+from apps.libmc.sim.protobuf import cube_message_pb2
+from apps.libmc.sim.protobuf import sim_message_pb2
+from virtual_cube import display_update
+from virtual_cube import vm_link
+
+from application import Application
+from cube import Cube
+import codec
+import display
+import tracing
+
+
+logger = logging.getLogger(__name__)
+
+
+# Maps simulator sides to the corresponding protobuf values, and back.
+_TO_PROTO_SIDE = {Cube.Sides.LEFT: cube_message_pb2.LEFT,
+                  Cube.Sides.RIGHT: cube_message_pb2.RIGHT,
+                  Cube.Sides.TOP: cube_message_pb2.TOP,
+                  Cube.Sides.BOTTOM: cube_message_pb2.BOTTOM}
+_FROM_PROTO_SIDE = dict((proto_side, side) \
+                        for side, proto_side in _TO_PROTO_SIDE.iteritems())
+
+
+class _VmBridge(Application):
+  """ Stands in for the app on a cube that is backed by a VM. Everything that
+  happens to the cube gets forwarded to the VM. """
+
+  # Messages have to be sent to the VM as bytes, so the local codec is not an
+  # option.
+  _CODECS = (codec.BinaryCodec.NAME, codec.JsonCodec.NAME)
+
+  def __init__(self, cube, link, vm, switch):
+    """
+    Args:
+      cube: The VmBackedCube that this is running on.
+      link: The VmLink to send things to the VM on.
+      vm: The CubeVm that the cube is backed by.
+      switch: The VmSwitch that links adjacent VMs directly, or None. """
+    self.__cube = cube
+    self.__link = link
+    self.__vm = vm
+    self.__switch = switch
+
+  def __send_neighbor_event(self, side, other, connected):
+    """ Tells the VM that a neighbor connected or disconnected.
+    Args:
+      side: The side that the neighbor is on.
+      other: The neighboring cube.
+      connected: True if it connected, false if it disconnected. """
+    message = sim_message_pb2.SimMessage()
+    message.neighbor.side = _TO_PROTO_SIDE[side]
+    message.neighbor.connected = connected
+    message.neighbor.neighbor_id = other.get_id()
+
+    self.__send(message)
+
+  def __send(self, message):
+    """ Sends a message to the VM.
+    Args:
+      message: The SimMessage to send. """
+    recorder = tracing.get_recorder()
+    if recorder is not None:
+      recorder.record_sim_message(self.__cube, tracing.SimDirections.TO_VM,
+                                  message)
+
+    self.__link.send(message)
+
+  def get_app_class(self):
+    # The real app is firmware in the VM, which can't be recreated from here.
+    return None
+
+  def on_reconfiguration(self, config):
+    # Report disconnections first, in case something else got connected on the
+    # same side.
+    for side, other in config.removed.iteritems():
+      if self.__switch is not None:
+        self.__switch.disconnect(self.__vm, _TO_PROTO_SIDE[side])
+      self.__send_neighbor_event(side, other, False)
+
+    for side, other in config.added.iteritems():
+      if (self.__switch is not None and isinstance(other, VmBackedCube)):
+        # Messages to the other VM can skip the host entirely.
+        other_side = Cube.Sides.opposite(side)
+        self.__switch.connect(self.__vm, _TO_PROTO_SIDE[side], other.get_vm(),
+                              _TO_PROTO_SIDE[other_side])
+      self.__send_neighbor_event(side, other, True)
+
+  def on_message_receive(self, side, message,
+                         codec_name=codec.JsonCodec.NAME):
+    sim_message = sim_message_pb2.SimMessage()
+    sim_message.cube_message.side = _TO_PROTO_SIDE[side]
+    sim_message.cube_message.codec = codec_name
+    sim_message.cube_message.data = message
+
+    self.__send(sim_message)
+
+  def on_routed_message_receive(self, source_id, message,
+                                codec_name=codec.JsonCodec.NAME):
+    # The VM only knows about its neighbors.
+    logger.debug("Dropping routed message from cube %d for VM.", source_id)
+
+  def on_button_event(self, button, pressed, timestamp):
+    # There is no way to tell the VM about buttons yet.
+    logger.debug("Dropping %s button event for VM.", button)
+
+
+class VmBackedCube(Cube):
+  """ A cube whose app is real firmware running in a cube VM, instead of a
+  Python Application. Neighbor changes and messages from other cubes are
+  forwarded to the VM, and messages that the VM sends are delivered to the
+  neighboring cubes. What the VM draws in its shared-memory framebuffer is
+  shown on the display once the VM sets it up. None of this ever waits on the
+  VM. """
+
+  def __init__(self, canvas, idx, color, vm, cluster_index=None,
+               switch=None):
+    """
+    Args:
+      canvas: The canvas to draw the cube on.
+      idx: The grid indices where the new cube is located.
+      color: The color of the cube.
+      vm: The running CubeVm to connect to.
+      cluster_index: The ClusterIndex to keep updated with this cube's
+                     connections, if any.
+      switch: If specified, the VmSwitch to use for sending messages directly
+              to adjacent VM-backed cubes. """
+    super(VmBackedCube, self).__init__(canvas, idx, color,
+                                       cluster_index=cluster_index)
+
+    self.__canvas = canvas
+    self.__vm = vm
+    self.__link = vm_link.VmLink(vm, switch=switch)
+    # Decodes screen updates from the VM. This is created when the first one
+    # arrives.
+    self.__display_decoder = None
+    # Whether we're done trying to mirror the VM's framebuffer, either because
+    # it's being mirrored, or because it can't be.
+    self.__mirror_done = False
+
+    self.run_app(_VmBridge(self, self.__link, vm, switch))
+
+  def get_vm(self):
+    """
+    Returns:
+      The CubeVm that this cube is backed by. """
+    return self.__vm
+
+  def __handle_cube_message(self, message):
+    """ Delivers a message that the VM sent to one of its neighbors.
+    Args:
+      message: The CubeMessage. """
+    side = _FROM_PROTO_SIDE.get(message.side)
+    if side is None:
+      logger.warning("Got message from VM with invalid side %d." % \
+                     (message.side))
+      return
+
+    try:
+      self.send_message(side, message.data, message.codec)
+    except ValueError as error:
+      # The neighbor went away before the message got here.
+      logger.warning("Dropping message from VM: %s" % (error))
+    except Exception:
+      # The message might not decode, or the neighbor might not handle it.
+      # Either way, that shouldn't stop us from handling all the others.
+      logger.exception("Dropping message from VM that couldn't be delivered.")
+
+  def __handle_display_update(self, update):
+    """ Shows a screen update from the VM.
+    Args:
+      update: The DisplayUpdate. """
+    screen = self.get_display()
+    if not isinstance(screen, display.FramebufferDisplay):
+      logger.debug("Ignoring screen update, framebuffer display is disabled.")
+      return
+
+    if self.__display_decoder is None:
+      size = screen.get_framebuffer().get_size()
+      self.__display_decoder = display_update.DisplayUpdateDecoder(size)
+
+    try:
+      regions = self.__display_decoder.apply(update)
+    except ValueError as error:
+      logger.warning("Dropping screen update from VM: %s" % (error))
+      return
+
+    for region in regions:
+      screen.update_region(*region)
+
+  def __start_mirroring(self):
+    """ Starts showing the contents of the VM's shared-memory framebuffer on the
+    display, if the VM has set it up. """
+    screen = self.get_display()
+    if not isinstance(screen, display.FramebufferDisplay):
+      # There's nowhere to show it.
+      self.__mirror_done = True
+      return
+
+    try:
+      reader = self.__vm.open_framebuffer()
+    except (OSError, ValueError):
+      # The VM hasn't written the framebuffer header yet, so there's no frame
+      # to show. We'll try again next time.
+      return
+
+    self.__mirror_done = True
+    if reader.get_size() != screen.get_framebuffer().get_size():
+      logger.warning("Not mirroring VM framebuffer of size %s." % \
+                     (reader.get_size(),))
+      reader.close()
+      return
+
+    screen.mirror(reader)
+
+  def poll(self):
+    """ Handles everything that the VM has sent so far. This never blocks.
+    Returns:
+      The number of messages that were handled. """
+    if not self.__mirror_done:
+      self.__start_mirroring()
+
+    messages = self.__link.get_messages()
+    recorder = tracing.get_recorder()
+    for message in messages:
+      if recorder is not None:
+        recorder.record_sim_message(self, tracing.SimDirections.FROM_VM,
+                                    message)
+
+      if message.HasField("cube_message"):
+        self.__handle_cube_message(message.cube_message)
+      if message.HasField("display"):
+        self.__handle_display_update(message.display)
+
+    return len(messages)
+
+  def poll_periodically(self, interval=10):
+    """ Keeps calling poll() from the canvas event loop.
+    Args:
+      interval: How often to poll, in ms. """
+    try:
+      self.poll()
+    finally:
+      # Keep polling, even if something went wrong this time.
+      self.__canvas.call_later(interval,
+                               lambda: self.poll_periodically(interval))
+
+  def shutdown(self):
+    """ Stops talking to the VM. The VM itself keeps running. """
+    self.__link.stop()
@@ -35,6 +35,9 @@ class WordGameLetter(Application):
   def get_letter(self):
     return self.__letter
 
+  def get_init_args(self):
+    return (self.__letter,)
+
   def __handle_word_message(self, side, message):
     """ Handles a message requesting the currently-displayed word.
     Args:
@@ -47,27 +50,25 @@ class WordGameLetter(Application):
     self.__received_words = 0
 
     # We get the word by building it up recursively based on the words we get
-    # from the cubes on the left and right.
+    # from the cubes on the left and right. The responses might come back
+    # before send_message() even returns, so we count the requests up front.
+    request_sides = []
     if (side != Cube.Sides.LEFT and self.__connections[Cube.Sides.LEFT]):
       # Request the word from the cubes on the left of us.
-      self.send_message(Cube.Sides.LEFT, {"type": "word"})
-      self.__sent_word_requests += 1
+      request_sides.append(Cube.Sides.LEFT)
     if (side != Cube.Sides.RIGHT and self.__connections[Cube.Sides.RIGHT]):
       # Request the word from the cubes on the right of us.
-      self.send_message(Cube.Sides.RIGHT, {"type": "word"})
-      self.__sent_word_requests += 1
+      request_sides.append(Cube.Sides.RIGHT)
+    self.__sent_word_requests = len(request_sides)
 
     if self.__sent_word_requests == 0:
       # In the base case, we can just provide our letter.
       resp_message = {"type": "word_resp", "word": self.__letter}
       self.send_message(side, resp_message)
+      return
 
-    elif self.__received_words == self.__sent_word_requests:
-      # We've received responses for everything we sent. Now we can send our own
-      # response.
-      word = self.__left_word + self.__letter + self.__right_word
-      resp_message = {"type": "word_resp", "word": word}
-      self.send_message(self.__word_req_side, resp_message)
+    for request_side in request_sides:
+      self.send_message(request_side, {"type": "word"})
 
   def __handle_word_resp_message(self, side, message):
     """ Handles a message responding to a word request.
@@ -83,21 +84,21 @@ class WordGameLetter(Application):
 
     self.__received_words += 1
 
+    if self.__received_words == self.__sent_word_requests:
+      # We've received responses for everything we sent. Now we can send our own
+      # response.
+      word = self.__left_word + self.__letter + self.__right_word
+      resp_message = {"type": "word_resp", "word": word}
+      self.send_message(self.__word_req_side, resp_message)
+
   def __handle_flash_message(self, side, message):
     # Get color and how long to flash for.
     color = message["color"]
 
-    # Do the flash.
+    # Do the flash. The checker multicasts this to the whole word, so we don't
+    # need to pass it on.
     self.set_background_color(color)
 
-    # Pass it on.
-    if (self.__connections[Cube.Sides.RIGHT] is not None and \
-        side != Cube.Sides.RIGHT):
-      self.send_message(Cube.Sides.RIGHT, message)
-    if (self.__connections[Cube.Sides.LEFT] is not None and \
-        side != Cube.Sides.LEFT):
-      self.send_message(Cube.Sides.LEFT, message)
-
   def _start_app(self):
     # Draw the letter on the screen.
     self.clear_display()
@@ -136,10 +137,43 @@ class WordGameChecker(Application):
   def _start_app(self):
     self.__reset_display()
 
-  def _on_message_receive(self, side, message):
-    # Get the word response.
-    word = message["word"]
-
+  def __read_word(self, side, neighbor):
+    """ Reads the word that we are connected to directly from the cluster
+    index, without having to send any messages.
+    Args:
+      side: The side that the word is connected on.
+      neighbor: The cube that is connected on that side.
+    Returns:
+      The word, or None if it can't be read from the cluster index. """
+    index = self.get_cluster_index()
+    if index is None:
+      return None
+
+    row = index.get_row(neighbor)
+    # Only the part of the row on the side that we're connected to counts, just
+    # like when the letters build up the word themselves.
+    neighbor_pos = row.index(neighbor)
+    if side == Cube.Sides.LEFT:
+      row = row[:neighbor_pos + 1]
+    elif side == Cube.Sides.RIGHT:
+      row = row[neighbor_pos:]
+
+    letters = []
+    for cube in row:
+      app = cube.get_app()
+      if not isinstance(app, WordGameLetter):
+        # Letters that run in an app pool or a VM can only tell us what they
+        # are through messages.
+        return None
+      letters.append(app.get_letter())
+
+    return "".join(letters)
+
+  def __check_word(self, side, word):
+    """ Checks a word, and displays the result.
+    Args:
+      side: The side that the word is connected on.
+      word: The word to check. """
     flash_color = None
     if word in WordGameChecker._VALID_WORDS:
       # Word is valid.
@@ -160,15 +194,22 @@ class WordGameChecker(Application):
     # Do the flash.
     self.set_background_color(flash_color)
 
-    # Pass it on.s
+    # Flash the whole word.
+    word_sides = (Cube.Sides.LEFT, Cube.Sides.RIGHT)
     message = {"type": "flash", "color": flash_color}
-    self.send_message(side, message)
+    self.multicast_message(message, word_sides, first_side=side)
     time.sleep(1)
-    message["color"] = config.get('COLORS', 'SCREEN')
-    self.send_message(side, message)
+    # Messages can be handed to the receiver without copying, so we make a new
+    # one instead of modifying the one we already sent.
+    message = {"type": "flash", "color": config.get('COLORS', 'SCREEN')}
+    self.multicast_message(message, word_sides, first_side=side)
 
     self.set_background_color(config.get('COLORS', 'SCREEN'))
 
+  def _on_message_receive(self, side, message):
+    # Get the word response.
+    self.__check_word(side, message["word"])
+
   def on_reconfiguration(self, config):
     # If we connect the checker cube to something, we want to check the current
     # word. First we have to get it. Choose the side to send it to.
@@ -186,5 +227,14 @@ class WordGameChecker(Application):
 
       return
 
-    # Send the word check message.
-    self.send_message(send_side, {"type": "word"})
+    if not config.added:
+      # We're still attached to the same word, so there's no need to check it
+      # again.
+      return
+
+    word = self.__read_word(send_side, config[send_side])
+    if word is not None:
+      self.__check_word(send_side, word)
+    else:
+      # Send the word check message.
+      self.send_message(send_side, {"type": "word"})